@@ -1,7 +1,11 @@
+import io
 import os
 import logging
+import tempfile
+import time
+from collections import Counter
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from enum import Enum
 import asyncio
 
@@ -10,16 +14,27 @@ from telegram import (
     ReplyKeyboardRemove, KeyboardButton, ReplyKeyboardMarkup
 )
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler,
-    MessageHandler, filters, ContextTypes, ConversationHandler
+    Application, BaseHandler, CommandHandler, CallbackQueryHandler,
+    MessageHandler, filters, ContextTypes, ConversationHandler, TypeHandler
 )
 from telegram.constants import ParseMode
-import pytz
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from telegram.error import BadRequest
 from dotenv import load_dotenv
 
-from database import TodoDatabase
+import config
+from bulk import (
+    export_rows, parse_csv, parse_json, parse_lines, read_records, write_csv, write_json_lines
+)
+from coordination import StoreLease
+from database import open_database
+from dispatcher import ReminderDispatcher
+from persistence import SessionPersistence
+from render_cache import RenderCache
+from sender import ReminderSender
+from sharding import check_shard_layout, current_shard, shard_path
+from updates import AdmissionQueue, PerUserUpdateProcessor, UpdateFilter, allowed_update_types
+from timezones import TimezoneIndex, TimezoneKeyboard, timezone_search_keyboard
+from webhook import serve_webhook
 
 # Загруженка конфигурации
 load_dotenv()
@@ -40,12 +55,22 @@ class States(Enum):
     WAITING_EVERYDAY_TASK_NAME = 4
     WAITING_EVERYDAY_TIMEZONE = 5
     WAITING_EVERYDAY_REMINDER_TIME = 6
+    WAITING_IMPORT = 7
+
+# Номер шарда и число шардов: при запуске через sharding.py процесс
+# обслуживает только своих пользователей и хранит их в своём файле
+SHARD_INDEX, SHARD_COUNT = current_shard()
 
-# Инициализация базы данных
-db = TodoDatabase()
+# База данных (открывается в open_storage, когда процесс завладел файлом)
+db = None
+# Владение файлом данных: пока оно у процесса, только он пишет в файл и
+# рассылает напоминания; другие экземпляры бота ждут в резерве
+store_lease: Optional[StoreLease] = None
 
-# Инициализация планировщика напоминаний
-scheduler = AsyncIOScheduler()
+# Приложение Telegram (задаётся в main), через него отправляются напоминания
+bot_app: Optional[Application] = None
+# Фильтр обновлений без обработчиков (задаётся в build_application)
+update_filter: Optional[UpdateFilter] = None
 
 # Эмодзи
 EMOJIS = {
@@ -62,93 +87,267 @@ EMOJIS = {
     "delete": "🗑️"
 }
 
-async def send_reminder(user_id: int, task_name: str, application: Application) -> None:
-    """Отправляет 5 напоминаний пользователю через 3 секунды"""
+# Клавиатура главного меню одинакова для всех, поэтому строится один раз
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton(f"{EMOJIS['pending']} Активные задачи", 
+                           callback_data="pending_tasks"),
+        InlineKeyboardButton(f"{EMOJIS['done']} Завершённые", 
+                           callback_data="completed_tasks")
+    ],
+    [
+        InlineKeyboardButton(f"{EMOJIS['add']} Добавить новую задачу", 
+                           callback_data="add_task")
+    ],
+    [
+        InlineKeyboardButton("📝 Simple Todo список", 
+                           callback_data="simple_todo_menu")
+    ],
+    [
+        InlineKeyboardButton("🔔 Ежедневное напоминание", 
+                           callback_data="everyday_reminder_menu")
+    ],
+    [
+        InlineKeyboardButton("📥 Импорт", callback_data="bulk_import"),
+        InlineKeyboardButton("📤 Экспорт", callback_data="export")
+    ]
+])
+
+# Отрисованные списки; ключ - версия данных пользователя и страница
+render_cache = RenderCache(config.RENDER_CACHE_USERS)
+
+async def send_message(chat_id: int, text: str) -> None:
+    """Отправляет одно сообщение через бота (используется очередью отправки)"""
+    await bot_app.bot.send_message(
+        chat_id=chat_id,
+        text=text,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Очередь отправки с пулом воркеров и ограничением скорости Telegram
+sender = ReminderSender(
+    send_message,
+    workers=config.SEND_WORKERS,
+    # Лимит Telegram общий на бота, поэтому шарды делят его поровну
+    rate=config.SEND_RATE_PER_SECOND / SHARD_COUNT,
+    per_chat_interval=config.SEND_PER_CHAT_INTERVAL,
+    max_retries=config.SEND_MAX_RETRIES
+)
+
+async def send_reminder(user_id: int, task_name: str, number: int, total: int,
+                        minute: Optional[int] = None) -> None:
+    """Ставит в очередь одно сообщение напоминания (повторы планирует диспетчер)"""
     try:
-        for i in range(1, 6):
-            text = f"{EMOJIS['time']} *Напоминание #{i} из 5!*\n\n📝 Задача: {task_name}\n\n{EMOJIS['success']} Пора сделать это дело!"
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            logger.info(f"✓ Напоминание #{i} отправлено пользователю {user_id}: {task_name}")
-            
-            # Ждём 3 секунды перед следующим напоминанием (кроме последнего)
-            if i < 5:
-                await asyncio.sleep(3)
+        text = f"{EMOJIS['time']} *Напоминание #{number} из {total}!*\n\n📝 Задача: {task_name}\n\n{EMOJIS['success']} Пора сделать это дело!"
+        sender.send(user_id, text, minute)
+        logger.debug(f"✓ Напоминание #{number} поставлено в очередь для {user_id}: {task_name}")
     except Exception as e:
         logger.error(f"✗ Ошибка при отправке напоминания: {e}")
 
-async def schedule_reminder(user_id: int, task_name: str, reminder_time: str, timezone: str, application: Application) -> None:
+# Диспетчер напоминаний: все напоминания в одном «колесе времени»
+dispatcher = ReminderDispatcher(send_reminder)
+
+def reminder_job_id(kind: str, user_id, item_id: int) -> str:
+    """Детерминированный ключ напоминания для todo или ежедневного напоминания"""
+    return f"{kind}_{user_id}_{item_id}"
+
+def parse_reminder_time(text: str) -> Optional[Tuple[str, Optional[int], Optional[int]]]:
+    """Разбирает ввод вида "ЧЧ:ММ" или "ЧЧ:ММ N/S" (N сообщений каждые S секунд)
+    
+    Возвращает (время, число повторов, интервал) или None при неверном вводе;
+    если повторы не указаны, вместо них None.
+    """
+    parts = text.split()
+    if not parts or len(parts) > 2:
+        return None
+    try:
+        datetime.strptime(parts[0], "%H:%M")
+    except ValueError:
+        return None
+    if len(parts) == 1:
+        return parts[0], None, None
+    
+    count, _, interval = parts[1].partition("/")
+    try:
+        repeat_count = int(count)
+        repeat_interval = int(interval) if interval else config.REMINDER_REPEAT_INTERVAL
+    except ValueError:
+        return None
+    if not 1 <= repeat_count <= config.REMINDER_MAX_REPEATS:
+        return None
+    if not 1 <= repeat_interval <= config.REMINDER_MAX_REPEAT_INTERVAL:
+        return None
+    return parts[0], repeat_count, repeat_interval
+
+async def schedule_reminder(kind: str, user_id: int, item_id: int, task_name: str,
+                            reminder_time: str, timezone: str,
+                            repeat_count: Optional[int] = None,
+                            repeat_interval: Optional[int] = None) -> None:
     """Планирует напоминание на указанное время"""
     try:
-        hour, minute = map(int, reminder_time.split(':'))
-        
-        # Создаём уникальный ID для работы
-        job_id = f"reminder_{user_id}_{datetime.now().timestamp()}"
-        
-        # Планируем напоминание
-        scheduler.add_job(
-            send_reminder,
-            CronTrigger(hour=hour, minute=minute, timezone=timezone),
-            args=[user_id, task_name, application],
-            id=job_id,
-            name=f"Reminder: {task_name}"
-        )
-        
+        dispatcher.schedule(reminder_job_id(kind, user_id, item_id), user_id,
+                            task_name, reminder_time, timezone,
+                            repeat_count or config.REMINDER_REPEAT_COUNT,
+                            repeat_interval or config.REMINDER_REPEAT_INTERVAL)
         logger.info(f"⏰ Напоминание запланировано для {user_id} на {reminder_time} ({timezone})")
     except Exception as e:
         logger.error(f"✗ Ошибка при планировании напоминания: {e}")
 
-def get_timezone_buttons() -> list:
-    """Возвращает кнопки со всеми доступными часовыми поясами"""
-    # Получаем все часовые пояса из pytz
-    timezones = pytz.common_timezones
-    
-    # Популярные пояса для быстрого доступа
-    popular_zones = [
-        'Europe/Moscow',      # GMT+3
-        'Asia/Baku',          # GMT+4
-        'Asia/Tashkent',      # GMT+5
-        'Asia/Kolkata',       # GMT+5:30
-        'Asia/Bangkok',       # GMT+7
-        'Asia/Shanghai',      # GMT+8
-        'Europe/London',      # GMT+0
-        'Europe/Berlin',      # GMT+1
-        'Europe/Istanbul',    # GMT+3
-        'America/New_York',   # GMT-5
-        'America/Los_Angeles',# GMT-8
-        'Australia/Sydney',   # GMT+10
-    ]
-    
-    buttons = []
-    
-    # Добавляем популярные пояса
-    for tz in popular_zones:
-        if tz in timezones:
-            # Получаем текущий UTC offset
-            now = datetime.now(pytz.timezone(tz))
-            offset = now.strftime('%z')
-            offset_formatted = f"{offset[:3]}:{offset[3:]}" if len(offset) > 3 else offset
-            
-            buttons.append([
-                InlineKeyboardButton(f"{tz} ({offset_formatted})", 
-                                   callback_data=f"tz_{tz}")
-            ])
-    
-    # Добавляем кнопку для всех остальных поясов
-    buttons.append([
-        InlineKeyboardButton("📌 Все часовые пояса", 
-                           callback_data="show_all_tz")
-    ])
-    
-    buttons.append([
-        InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
-                           callback_data="back_to_main")
-    ])
+def cancel_reminder(kind: str, user_id: int, item_id: int) -> None:
+    """Снимает напоминание и его оставшиеся повторы с диспетчера"""
+    key = reminder_job_id(kind, user_id, item_id)
+    dispatcher.cancel(key)
+    dispatcher.cancel_followups(key)
+
+def open_storage() -> None:
+    """Завладевает файлом данных и открывает базу
+    
+    Если файлом уже владеет другой запущенный экземпляр бота, процесс
+    ждёт в горячем резерве: всё, что не зависит от данных (индекс
+    поясов), готовится заранее, и как только файл освобождается (прежний
+    экземпляр остановлен или упал), бот продолжает работу с его данными.
+    """
+    global db, store_lease
+    database_file = os.getenv("DATABASE_FILE", config.DATABASE_FILE)
+    check_shard_layout(database_file, SHARD_COUNT)
+    filename = shard_path(database_file, SHARD_INDEX, SHARD_COUNT)
+    store_lease = StoreLease(
+        filename + ".lock", config.LEADER_HEARTBEAT_INTERVAL, config.LEADER_POLL_INTERVAL,
+        # Резерву передаётся минута, напоминания которой не просто
+        # переданы в очередь отправки, а уже отправлены
+        state=lambda: {"dispatched_minute": sender.completed_minute(dispatcher.dispatched_minute)}
+    )
+    if not store_lease.acquire(blocking=False):
+        holder = store_lease.holder() or {}
+        logger.info(f"⏸️ Файлом {filename} владеет другой экземпляр (pid {holder.get('pid')}), "
+                    f"жду в резерве")
+        get_timezone_index()
+        store_lease.acquire()
+        logger.info(f"▶️ Файл {filename} освободился, начинаю работу")
+    db = open_database(
+        filename,
+        storage_mode=os.getenv("STORAGE_MODE", config.STORAGE_MODE),
+        migrate_from=shard_path(config.JSON_MIGRATION_SOURCE, SHARD_INDEX, SHARD_COUNT),
+        checkpoint_interval=config.SQLITE_CHECKPOINT_INTERVAL,
+        commit_interval=config.GROUP_COMMIT_INTERVAL,
+        commit_max_pending=config.GROUP_COMMIT_MAX_PENDING,
+        wal_compact_every=config.WAL_COMPACT_EVERY,
+        snapshot_generations=config.SNAPSHOT_GENERATIONS
+    )
+
+def close_storage() -> None:
+    """Записывает оставшиеся изменения и отдаёт файл данных резерву"""
+    db.close()
+    store_lease.release()
+
+def handover_minute() -> Optional[int]:
+    """Минута, до которой разослал напоминания прежний владелец файла
+    
+    Возвращается, только если он остановился недавно (не раньше
+    REMINDER_CATCHUP_MINUTES назад): напоминания пропущенных за это время
+    минут досылаются, а после долгого простоя - нет.
+    """
+    previous = store_lease.previous.get("dispatched_minute") if store_lease else None
+    now_minute = int(time.time() // 60)
+    if previous is None or not now_minute - config.REMINDER_CATCHUP_MINUTES <= previous < now_minute:
+        return None
+    return previous
+
+async def restore_reminders() -> None:
+    """Заново раскладывает все напоминания из базы по диспетчеру
+    
+    База — единственный источник правды о напоминаниях, поэтому после
+    перезапуска ничего не теряется: при старте диспетчер строится из неё
+    целиком за один проход. Проход идёт в фоне порциями, так что бот
+    отвечает пользователям, не дожидаясь его конца.
+    """
+    started = datetime.now()
+    after_minute = handover_minute()
+    count = await dispatcher.restore(
+        ((reminder_job_id(kind, user_id, item_id), int(user_id), task_name, reminder_time, timezone,
+          repeat_count or config.REMINDER_REPEAT_COUNT,
+          repeat_interval or config.REMINDER_REPEAT_INTERVAL)
+         for (kind, user_id, item_id, task_name, reminder_time, timezone,
+              repeat_count, repeat_interval) in db.iter_reminders()),
+        after_minute, config.REMINDER_RESTORE_BATCH
+    )
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"⏰ Восстановлено напоминаний: {count} за {elapsed:.2f} с")
+    if after_minute is not None:
+        logger.info(f"⏰ Досылаю напоминания, пропущенные при смене экземпляра "
+                    f"({int(time.time() // 60) - after_minute} мин.)")
+
+# Клавиатура популярных поясов строится заранее и пересобирается
+# только при переходе на летнее/зимнее время
+timezone_keyboard = TimezoneKeyboard(config.POPULAR_TIMEZONES, [
+    [InlineKeyboardButton("📌 Все часовые пояса", 
+                        callback_data="show_all_tz")],
+    [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
+                        callback_data="back_to_main")]
+])
+
+def get_timezone_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру с популярными часовыми поясами"""
+    return timezone_keyboard.markup()
+
+# Индекс для поиска пояса по свободному вводу (строится при старте бота)
+timezone_index: Optional[TimezoneIndex] = None
+
+def get_timezone_index() -> TimezoneIndex:
+    global timezone_index
+    if timezone_index is None:
+        timezone_index = TimezoneIndex(aliases=config.TIMEZONE_ALIASES,
+                                       preferred=config.POPULAR_TIMEZONES)
+    return timezone_index
+
+async def resolve_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                           cancel_callback: str) -> Optional[str]:
+    """Определяет пояс по введённому тексту
+    
+    Возвращает имя пояса при точном совпадении. Иначе показывает
+    найденные похожие пояса кнопками (или сообщение об ошибке) и
+    возвращает None.
+    """
+    text = update.message.text.strip()
+    index = get_timezone_index()
+    timezone_str = index.exact(text)
+    if timezone_str:
+        return timezone_str
+    
+    matches = index.search(text)
+    if not matches:
+        await update.message.reply_text(
+            f"{EMOJIS['error']} *Не нашёл такой часовой пояс!*\n\n"
+            f"Попробуй написать город, сокращение или смещение, например:\n"
+            f"• Moscow или Москва\n"
+            f"• MSK\n"
+            f"• GMT+4",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return None
+    
+    context.user_data['tz_matches'] = matches
+    context.user_data['tz_cancel'] = cancel_callback
+    await update.message.reply_text(
+        f"🔍 *Найдено поясов: {len(matches)}*\n\nВыбери свой:",
+        reply_markup=timezone_search_keyboard(matches, 0, config.TIMEZONE_SEARCH_PAGE_SIZE,
+                                              cancel_callback),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return None
+
+async def timezone_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Листает страницы найденных часовых поясов"""
+    query = update.callback_query
+    await query.answer()
     
-    return buttons
+    if query.data == "tzpage_noop":
+        return
+    page = int(query.data.replace("tzpage_", ""))
+    await query.edit_message_reply_markup(timezone_search_keyboard(
+        context.user_data.get('tz_matches', []), page, config.TIMEZONE_SEARCH_PAGE_SIZE,
+        context.user_data.get('tz_cancel', "back_to_main")
+    ))
 
 async def show_timezone_selector(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показывает селектор часовых поясов"""
@@ -163,8 +362,7 @@ async def show_timezone_selector(update: Update, context: ContextTypes.DEFAULT_T
 
 {EMOJIS['info']} Если твоего пояса нет в списке, нажми "Все часовые пояса" """
     
-    keyboard = get_timezone_buttons()
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_timezone_keyboard()
     
     await query.edit_message_text(text, reply_markup=reply_markup, 
                                  parse_mode=ParseMode.MARKDOWN)
@@ -177,21 +375,15 @@ async def show_all_timezones(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     # Отправляем сообщение с просьбой написать часовой пояс
-    text = f"""{EMOJIS['info']} *Введи название часового пояса*
-
-Вот некоторые примеры:
-• Europe/Moscow
-• Europe/London
-• Europe/Berlin
-• Asia/Baku
-• Asia/Shanghai
-• America/New_York
-• America/Los_Angeles
-• Australia/Sydney
+    text = f"""{EMOJIS['info']} *Введи часовой пояс*
 
-_Полный список доступен на https://en.wikipedia.org/wiki/List_of_tz_database_time_zones_
+Можно написать что угодно из этого:
+• название пояса: Europe/Moscow
+• город: Moscow, Москва, Tokyo
+• сокращение: MSK, CET, EST
+• смещение: GMT+4, UTC-5, +5:30
 
-{EMOJIS['info']} Напиши название пояса (например: Europe/Moscow)"""
+{EMOJIS['info']} Опечатки не страшны — я покажу похожие пояса"""
     
     keyboard = [
         [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
@@ -237,38 +429,144 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 Выбери нужное действие:"""
     
-    keyboard = [
-        [
-            InlineKeyboardButton(f"{EMOJIS['pending']} Активные задачи", 
-                               callback_data="pending_tasks"),
-            InlineKeyboardButton(f"{EMOJIS['done']} Завершённые", 
-                               callback_data="completed_tasks")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJIS['add']} Добавить новую задачу", 
-                               callback_data="add_task")
-        ],
-        [
-            InlineKeyboardButton("📝 Simple Todo список", 
-                               callback_data="simple_todo_menu")
-        ],
-        [
-            InlineKeyboardButton("🔔 Ежедневное напоминание", 
-                               callback_data="everyday_reminder_menu")
+    await update.message.reply_text(text, reply_markup=MAIN_MENU_MARKUP, 
+                                   parse_mode=ParseMode.MARKDOWN)
+
+def shorten(text: str, limit: int) -> str:
+    """Обрезает текст до limit символов, добавляя многоточие"""
+    return f"{text[:limit]}..." if len(text) > limit else text
+
+def page_cursor(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                view: str) -> Tuple[Optional[int], Optional[int]]:
+    """Курсор (after_id, before_id) страницы списка view
+    
+    Кнопки листания присылают "{view}:next:{id}" и "{view}:prev:{id}", само
+    открытие списка ("{view}") показывает первую страницу. Остальные кнопки
+    (например, завершение задачи) перерисовывают страницу, которую
+    пользователь видел последней.
+    """
+    cursors = context.user_data.setdefault('page_cursors', {})
+    data = update.callback_query.data
+    if data == view:
+        cursors.pop(view, None)
+    elif data.startswith((f"{view}:next:", f"{view}:prev:")):
+        _, direction, item_id = data.split(":")
+        cursors[view] = (direction, int(item_id))
+    
+    direction, item_id = cursors.get(view, (None, None))
+    if direction == "next":
+        return item_id, None
+    if direction == "prev":
+        return None, item_id
+    return None, None
+
+def fetch_page(update: Update, context: ContextTypes.DEFAULT_TYPE, view: str,
+               collection: str, completed: Optional[bool] = None) -> Tuple[List[Dict], bool, bool]:
+    """Загружает из хранилища только видимую страницу списка view"""
+    user_id = update.effective_user.id
+    after_id, before_id = page_cursor(update, context, view)
+    page = db.get_page(user_id, collection, completed, after_id, before_id,
+                       config.LIST_PAGE_SIZE)
+    if not page[0] and (after_id is not None or before_id is not None):
+        # Страница опустела (например, завершили её последнюю задачу):
+        # показываем предыдущую, а если её нет - первую
+        context.user_data['page_cursors'].pop(view, None)
+        if after_id is not None:
+            page = db.get_page(user_id, collection, completed, before_id=after_id + 1,
+                               limit=config.LIST_PAGE_SIZE)
+        if not page[0]:
+            page = db.get_page(user_id, collection, completed, limit=config.LIST_PAGE_SIZE)
+    return page
+
+def page_navigation(view: str, items: List[Dict], has_prev: bool,
+                    has_next: bool) -> List[List[InlineKeyboardButton]]:
+    """Ряд кнопок листания списка (пустой, если страница одна)"""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton("⬅️", callback_data=f"{view}:prev:{items[0]['id']}"))
+    if has_next:
+        row.append(InlineKeyboardButton("➡️", callback_data=f"{view}:next:{items[-1]['id']}"))
+    return [row] if row else []
+
+def selected_ids(context: ContextTypes.DEFAULT_TYPE, view: str) -> Optional[List[int]]:
+    """Задачи, выбранные в списке view, или None, если режим выбора выключен"""
+    selection = context.user_data.get('selection')
+    if selection is None or selection['view'] != view:
+        return None
+    return selection['ids']
+
+def selection_buttons(view: str, todos: List[Dict], selected: Optional[List[int]],
+                      action: str, callback: str) -> List[List[InlineKeyboardButton]]:
+    """Кнопки задач страницы и управления выбором
+    
+    Без режима выбора - кнопка на каждую задачу с действием action и
+    кнопка "Выбрать несколько". В режиме выбора задачи отмечаются нажатием,
+    а одна кнопка применяет действие ко всем выбранным сразу.
+    """
+    if selected is None:
+        keyboard = [
+            [InlineKeyboardButton(f"{action} {shorten(todo['task'], 20)}",
+                                  callback_data=f"{callback}_{todo['id']}")]
+            for todo in todos
         ]
-    ]
+        keyboard.append([InlineKeyboardButton("☑️ Выбрать несколько",
+                                              callback_data=f"{view}:select")])
+        return keyboard
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(text, reply_markup=reply_markup, 
-                                   parse_mode=ParseMode.MARKDOWN)
+    keyboard = [
+        [InlineKeyboardButton(f"{'☑️' if todo['id'] in selected else '⬜'} {shorten(todo['task'], 20)}",
+                              callback_data=f"{view}:pick:{todo['id']}")]
+        for todo in todos
+    ]
+    keyboard.append([
+        InlineKeyboardButton(f"{action} Выбранные ({len(selected)})",
+                             callback_data=f"{view}:apply"),
+        InlineKeyboardButton("✖️ Отменить выбор", callback_data=f"{view}:select")
+    ])
+    return keyboard
 
-async def pending_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Показывает активные задачи"""
+async def show_view(update: Update, context: ContextTypes.DEFAULT_TYPE, view: str,
+                    render: Callable[[Update, ContextTypes.DEFAULT_TYPE],
+                                     Tuple[str, InlineKeyboardMarkup]]) -> None:
+    """Показывает экран списка view в сообщении с нажатой кнопкой
+    
+    Пока данные пользователя и страница не изменились, экран берётся из
+    кэша без обращения к хранилищу. Если сообщение уже показывает этот
+    экран, оно не редактируется. Ключ кэша учитывает и выбранные задачи.
+    """
     user_id = update.effective_user.id
     query = update.callback_query
-    await query.answer()
+    if query.data == view:
+        # Открытие списка заново выключает режим выбора
+        context.user_data.pop('selection', None)
+    selected = selected_ids(context, view)
+    key = (db.data_version(user_id), page_cursor(update, context, view),
+           None if selected is None else tuple(selected))
+    rendered = render_cache.get(user_id, view, key)
+    if rendered is None:
+        rendered = render(update, context)
+        render_cache.put(user_id, view, key, rendered)
+    text, reply_markup = rendered
+    
+    message_id = query.message.message_id if query.message else None
+    if (render_cache.is_shown(user_id, message_id, text)
+            and query.message.reply_markup == reply_markup):
+        return
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, 
+                                     parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        # Сообщение изменили не через show_view, но содержимое совпало
+        if "not modified" not in str(e).lower():
+            raise
+    render_cache.set_shown(user_id, message_id, text)
+
+def render_pending_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, InlineKeyboardMarkup]:
+    """Отрисовывает страницу активных задач"""
+    user_id = update.effective_user.id
     
-    todos = db.get_pending_todos(user_id)
+    todos, has_prev, has_next = fetch_page(update, context, "pending_tasks", "todos",
+                                           completed=False)
     
     if not todos:
         text = f"{EMOJIS['list']} *Активные задачи*\n\n🎊 У тебя нет активных задач! Все дела завершены!"
@@ -277,35 +575,35 @@ async def pending_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                                 callback_data="back_to_main")]
         ]
     else:
-        text = f"{EMOJIS['list']} *Активные задачи* ({len(todos)})\n\n"
-        for i, todo in enumerate(todos, 1):
-            reminder = todo.get('reminder_time', 'N/A')
-            text += f"{i}. {todo['task']}\n   {EMOJIS['time']} Напоминание: {reminder}\n\n"
-        
-        keyboard = []
+        total, completed = db.count_items(user_id, "todos")
+        lines = [f"{EMOJIS['list']} *Активные задачи* ({total - completed})\n"]
         for todo in todos:
-            text_button = f"✓ {todo['task'][:20]}..." if len(todo['task']) > 20 else f"✓ {todo['task']}"
-            keyboard.append([
-                InlineKeyboardButton(text_button, 
-                                   callback_data=f"complete_{todo['id']}")
-            ])
+            reminder = todo.get('reminder_time', 'N/A')
+            lines.append(f"• {shorten(todo['task'], config.LIST_TASK_PREVIEW)}\n"
+                         f"   {EMOJIS['time']} Напоминание: {reminder}\n")
+        text = "\n".join(lines)
         
+        keyboard = selection_buttons("pending_tasks", todos,
+                                     selected_ids(context, "pending_tasks"), "✓", "complete")
+        keyboard += page_navigation("pending_tasks", todos, has_prev, has_next)
         keyboard.append([
             InlineKeyboardButton(f"{EMOJIS['back']} Назад в меню", 
                                 callback_data="back_to_main")
         ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text, reply_markup=reply_markup, 
-                                 parse_mode=ParseMode.MARKDOWN)
+    return text, InlineKeyboardMarkup(keyboard)
 
-async def completed_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Показывает завершённые задачи"""
+async def pending_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает активные задачи (постранично)"""
+    await update.callback_query.answer()
+    await show_view(update, context, "pending_tasks", render_pending_tasks)
+
+def render_completed_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, InlineKeyboardMarkup]:
+    """Отрисовывает страницу завершённых задач"""
     user_id = update.effective_user.id
-    query = update.callback_query
-    await query.answer()
     
-    todos = db.get_completed_todos(user_id)
+    todos, has_prev, has_next = fetch_page(update, context, "completed_tasks", "todos",
+                                           completed=True)
     
     if not todos:
         text = f"{EMOJIS['done']} *Завершённые задачи*\n\n📪 У тебя ещё нет завершённых задач. Начни с чего-нибудь!"
@@ -314,27 +612,77 @@ async def completed_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                 callback_data="back_to_main")]
         ]
     else:
-        text = f"{EMOJIS['done']} *Завершённые задачи* ({len(todos)})\n\n"
-        for i, todo in enumerate(todos, 1):
-            created = todo.get('created_at', 'N/A')
-            text += f"{i}. ~~{todo['task']}~~\n   📅 {created[:10]}\n\n"
-        
-        keyboard = []
+        _, completed = db.count_items(user_id, "todos")
+        lines = [f"{EMOJIS['done']} *Завершённые задачи* ({completed})\n"]
         for todo in todos:
-            text_button = f"🗑️ {todo['task'][:20]}..." if len(todo['task']) > 20 else f"🗑️ {todo['task']}"
-            keyboard.append([
-                InlineKeyboardButton(text_button, 
-                                   callback_data=f"delete_{todo['id']}")
-            ])
+            created = todo.get('created_at', 'N/A')
+            lines.append(f"• ~~{shorten(todo['task'], config.LIST_TASK_PREVIEW)}~~\n"
+                         f"   📅 {created[:10]}\n")
+        text = "\n".join(lines)
         
+        keyboard = selection_buttons("completed_tasks", todos,
+                                     selected_ids(context, "completed_tasks"), "🗑️", "delete")
+        keyboard.append([InlineKeyboardButton("🧹 Очистить все завершённые",
+                                              callback_data="completed_tasks:clear")])
+        keyboard += page_navigation("completed_tasks", todos, has_prev, has_next)
         keyboard.append([
             InlineKeyboardButton(f"{EMOJIS['back']} Назад в меню", 
                                 callback_data="back_to_main")
         ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text, reply_markup=reply_markup, 
-                                 parse_mode=ParseMode.MARKDOWN)
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def completed_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает завершённые задачи (постранично)"""
+    await update.callback_query.answer()
+    await show_view(update, context, "completed_tasks", render_completed_tasks)
+
+async def task_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Режим выбора задач: отметка, действие над выбранными и очистка завершённых
+    
+    Все выбранные задачи завершаются (или удаляются) одним вызовом
+    хранилища, после чего список перерисовывается один раз.
+    """
+    user_id = update.effective_user.id
+    query = update.callback_query
+    view, action, *args = query.data.split(":")
+    selected = selected_ids(context, view)
+    notice = None
+    
+    if action == "select":
+        # Кнопка включает и выключает режим выбора
+        if selected is None:
+            context.user_data['selection'] = {'view': view, 'ids': []}
+        else:
+            context.user_data.pop('selection', None)
+    elif action == "pick" and selected is not None:
+        todo_id = int(args[0])
+        if todo_id in selected:
+            selected.remove(todo_id)
+        else:
+            selected.append(todo_id)
+    elif action == "apply" and selected:
+        if view == "pending_tasks":
+            changed = db.complete_todos(user_id, selected)
+            notice = f"{EMOJIS['success']} Завершено задач: {len(changed)}"
+        else:
+            changed = db.delete_todos(user_id, selected)
+            notice = f"{EMOJIS['delete']} Удалено задач: {len(changed)}"
+        for todo_id in changed:
+            cancel_reminder("todo", user_id, todo_id)
+        context.user_data.pop('selection', None)
+    elif action == "apply":
+        notice = f"{EMOJIS['info']} Сначала отметь задачи"
+    elif action == "clear":
+        changed = db.clear_completed_todos(user_id)
+        for todo_id in changed:
+            cancel_reminder("todo", user_id, todo_id)
+        context.user_data.pop('selection', None)
+        notice = f"🧹 Удалено завершённых задач: {len(changed)}"
+    
+    await query.answer(notice)
+    render = render_pending_tasks if view == "pending_tasks" else render_completed_tasks
+    await show_view(update, context, view, render)
 
 async def add_task_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало добавления новой задачи"""
@@ -377,8 +725,7 @@ async def task_name_received(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 Спасибо! Теперь укажи свой часовой пояс."""
     
-    keyboard = get_timezone_buttons()
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_timezone_keyboard()
     
     await update.message.reply_text(text, reply_markup=reply_markup, 
                                    parse_mode=ParseMode.MARKDOWN)
@@ -388,22 +735,12 @@ async def task_name_received(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def timezone_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение часового пояса"""
     user_id = update.effective_user.id
-    timezone_str = update.message.text.strip()
     
-    # Проверяем, валиден ли часовой пояс
-    try:
-        pytz.timezone(timezone_str)
-        context.user_data['timezone'] = timezone_str
-    except pytz.exceptions.UnknownTimeZoneError:
-        await update.message.reply_text(
-            f"{EMOJIS['error']} *Неправильный часовой пояс!*\n\n"
-            f"Пожалуйста, используй корректное название, например:\n"
-            f"• Europe/Moscow\n"
-            f"• Asia/Baku\n"
-            f"• America/New_York",
-            parse_mode=ParseMode.MARKDOWN
-        )
+    # Точное название принимаем сразу, иначе предлагаем похожие пояса
+    timezone_str = await resolve_timezone(update, context, "back_to_main")
+    if timezone_str is None:
         return States.WAITING_TIMEZONE.value
+    context.user_data['timezone'] = timezone_str
     
     text = f"""{EMOJIS['add']} *Добавить новую задачу*
 
@@ -418,7 +755,9 @@ async def timezone_received(update: Update, context: ContextTypes.DEFAULT_TYPE)
 • 14:30 (2:30 дня)
 • 23:59 (11:59 вечера)
 
-{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)"""
+{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)
+
+🔁 Можно указать повторы: *09:00 3/10* — 3 сообщения каждые 10 секунд"""
     
     keyboard = [
         [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
@@ -442,6 +781,7 @@ async def timezone_button_selected(update: Update, context: ContextTypes.DEFAULT
     
     # Сохраняем в контексте
     context.user_data['timezone'] = timezone_str
+    context.user_data.pop('tz_matches', None)
     
     text = f"""{EMOJIS['add']} *Добавить новую задачу*
 
@@ -456,7 +796,9 @@ async def timezone_button_selected(update: Update, context: ContextTypes.DEFAULT
 • 14:30 (2:30 дня)
 • 23:59 (11:59 вечера)
 
-{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)"""
+{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)
+
+🔁 Можно указать повторы: *09:00 3/10* — 3 сообщения каждые 10 секунд"""
     
     keyboard = [
         [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
@@ -472,30 +814,31 @@ async def timezone_button_selected(update: Update, context: ContextTypes.DEFAULT
 async def reminder_time_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение времени напоминания"""
     user_id = update.effective_user.id
-    reminder_time = update.message.text.strip()
     
-    # Валидация времени
-    try:
-        datetime.strptime(reminder_time, "%H:%M")
-    except ValueError:
+    # Валидация времени (и необязательных повторов)
+    parsed = parse_reminder_time(update.message.text.strip())
+    if parsed is None:
         await update.message.reply_text(
             f"{EMOJIS['error']} *Неправильный формат времени!*\n\n"
             f"Пожалуйста, используй формат: ЧЧ:МММ\n"
-            f"Пример: 09:30 или 14:00",
+            f"Пример: 09:30 или 14:00 (с повторами: 09:30 3/10)",
             parse_mode=ParseMode.MARKDOWN
         )
         return States.WAITING_REMINDER_TIME.value
+    reminder_time, repeat_count, repeat_interval = parsed
     
     # Получаем данные из контекста
     task_name = context.user_data.get('task_name')
     timezone = context.user_data.get('timezone')
     
     # Добавляем задачу в базу данных
-    success = db.add_todo(user_id, task_name, timezone, reminder_time)
+    todo = db.add_todo(user_id, task_name, timezone, reminder_time,
+                       repeat_count, repeat_interval)
     
-    if success:
+    if todo:
         # Планируем напоминание
-        await schedule_reminder(user_id, task_name, reminder_time, timezone, context.application)
+        await schedule_reminder("todo", user_id, todo["id"], task_name, reminder_time, timezone,
+                                repeat_count, repeat_interval)
         
         text = f"""{EMOJIS['success']} *Отлично! Задача добавлена!*
 
@@ -529,13 +872,11 @@ async def reminder_time_received(update: Update, context: ContextTypes.DEFAULT_T
     
     return ConversationHandler.END
 
-async def simple_todo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Показывает меню простых todos"""
+def render_simple_todo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, InlineKeyboardMarkup]:
+    """Отрисовывает страницу простых todos"""
     user_id = update.effective_user.id
-    query = update.callback_query
-    await query.answer()
     
-    todos = db.get_simple_todos(user_id)
+    todos, has_prev, has_next = fetch_page(update, context, "simple_todo_menu", "simple_todos")
     
     if not todos:
         text = f"📝 *Simple Todo Список*\n\n✨ У тебя нет простых todos! Добавь свой первый!"
@@ -546,20 +887,20 @@ async def simple_todo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                                 callback_data="back_to_main")]
         ]
     else:
-        completed = sum(1 for t in todos if t['completed'])
-        text = f"📝 *Simple Todo Список* ({len(todos)})\n\n"
-        text += f"✅ Завершено: {completed}/{len(todos)}\n\n"
-        
-        for i, todo in enumerate(todos, 1):
+        total, completed = db.count_items(user_id, "simple_todos")
+        lines = [f"📝 *Simple Todo Список* ({total})\n",
+                 f"✅ Завершено: {completed}/{total}\n"]
+        for todo in todos:
             status = "✅" if todo['completed'] else "⏳"
-            text += f"{status} {i}. {todo['task']}\n"
+            lines.append(f"{status} {shorten(todo['task'], config.LIST_TASK_PREVIEW)}")
+        text = "\n".join(lines)
         
         keyboard = [
             [InlineKeyboardButton("➕ Добавить todo", 
                                 callback_data="simple_todo_add")]
         ]
         
-        # Добавляем кнопки для каждого todo
+        # Добавляем кнопки для каждого todo на странице
         for todo in todos:
             if todo['completed']:
                 action = "🗑️"
@@ -568,19 +909,22 @@ async def simple_todo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 action = "✓"
                 callback = f"simple_todo_complete_{todo['id']}"
             
-            text_button = f"{action} {todo['task'][:20]}..." if len(todo['task']) > 20 else f"{action} {todo['task']}"
             keyboard.append([
-                InlineKeyboardButton(text_button, callback_data=callback)
+                InlineKeyboardButton(f"{action} {shorten(todo['task'], 20)}", callback_data=callback)
             ])
         
+        keyboard += page_navigation("simple_todo_menu", todos, has_prev, has_next)
         keyboard.append([
             InlineKeyboardButton(f"{EMOJIS['back']} Назад в меню", 
                                 callback_data="back_to_main")
         ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text, reply_markup=reply_markup, 
-                                 parse_mode=ParseMode.MARKDOWN)
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def simple_todo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает меню простых todos (постранично)"""
+    await update.callback_query.answer()
+    await show_view(update, context, "simple_todo_menu", render_simple_todo_menu)
 
 async def simple_todo_add_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало добавления простого todo"""
@@ -666,13 +1010,12 @@ async def simple_todo_delete(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         await query.answer(f"{EMOJIS['error']} Ошибка", show_alert=True)
 
-async def everyday_reminder_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Показывает меню ежедневных напоминаний"""
+def render_everyday_reminder_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, InlineKeyboardMarkup]:
+    """Отрисовывает страницу ежедневных напоминаний"""
     user_id = update.effective_user.id
-    query = update.callback_query
-    await query.answer()
     
-    reminders = db.get_everyday_reminders(user_id)
+    reminders, has_prev, has_next = fetch_page(update, context, "everyday_reminder_menu",
+                                               "everyday_reminders")
     
     if not reminders:
         text = f"🔔 *Ежедневные напоминания*\n\n✨ У тебя нет ежедневных напоминаний! Добавь своё первое!"
@@ -683,38 +1026,42 @@ async def everyday_reminder_menu(update: Update, context: ContextTypes.DEFAULT_T
                                 callback_data="back_to_main")]
         ]
     else:
-        active = sum(1 for r in reminders if r['active'])
-        text = f"🔔 *Ежедневные напоминания* ({len(reminders)})\n\n"
-        text += f"✅ Активных: {active}/{len(reminders)}\n\n"
-        
-        for i, reminder in enumerate(reminders, 1):
+        total, active = db.count_items(user_id, "everyday_reminders")
+        lines = [f"🔔 *Ежедневные напоминания* ({total})\n",
+                 f"✅ Активных: {active}/{total}\n"]
+        for reminder in reminders:
             status = "🔔" if reminder['active'] else "🔕"
-            text += f"{status} {i}. {reminder['task']}\n"
-            text += f"   ⏰ {reminder['reminder_time']} ({reminder['timezone']})\n"
+            lines.append(f"{status} {shorten(reminder['task'], config.LIST_TASK_PREVIEW)}\n"
+                         f"   ⏰ {reminder['reminder_time']} ({reminder['timezone']})")
+        text = "\n".join(lines)
         
         keyboard = [
             [InlineKeyboardButton("➕ Добавить напоминание", 
                                 callback_data="everyday_reminder_add")]
         ]
         
-        # Добавляем кнопки для каждого напоминания
+        # Добавляем кнопки для каждого напоминания на странице
         for reminder in reminders:
             status = "🔕" if reminder['active'] else "✅"
-            action = "Выключить" if reminder['active'] else "Включить"
-            text_button = f"{status} {reminder['task'][:20]}..." if len(reminder['task']) > 20 else f"{status} {reminder['task']}"
             keyboard.append([
-                InlineKeyboardButton(text_button, 
+                InlineKeyboardButton(f"{status} {shorten(reminder['task'], 20)}", 
+                                   callback_data=f"everyday_reminder_toggle_{reminder['id']}"),
+                InlineKeyboardButton(f"{EMOJIS['delete']} Удалить", 
                                    callback_data=f"everyday_reminder_delete_{reminder['id']}")
             ])
         
+        keyboard += page_navigation("everyday_reminder_menu", reminders, has_prev, has_next)
         keyboard.append([
             InlineKeyboardButton(f"{EMOJIS['back']} Назад в меню", 
                                 callback_data="back_to_main")
         ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text, reply_markup=reply_markup, 
-                                 parse_mode=ParseMode.MARKDOWN)
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def everyday_reminder_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает меню ежедневных напоминаний (постранично)"""
+    await update.callback_query.answer()
+    await show_view(update, context, "everyday_reminder_menu", render_everyday_reminder_menu)
 
 async def everyday_reminder_add_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало добавления ежедневного напоминания"""
@@ -754,8 +1101,7 @@ async def everyday_task_name_received(update: Update, context: ContextTypes.DEFA
 
 Спасибо! Теперь укажи свой часовой пояс."""
     
-    keyboard = get_timezone_buttons()
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = get_timezone_keyboard()
     
     await update.message.reply_text(text, reply_markup=reply_markup, 
                                    parse_mode=ParseMode.MARKDOWN)
@@ -773,6 +1119,7 @@ async def everyday_timezone_button_selected(update: Update, context: ContextType
     
     # Сохраняем в контексте
     context.user_data['everyday_timezone'] = timezone_str
+    context.user_data.pop('tz_matches', None)
     
     text = f"""{EMOJIS['add']} *Добавить ежедневное напоминание*
 
@@ -787,7 +1134,9 @@ async def everyday_timezone_button_selected(update: Update, context: ContextType
 • 14:30 (2:30 дня)
 • 23:59 (11:59 вечера)
 
-{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)"""
+{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)
+
+🔁 Можно указать повторы: *09:00 3/10* — 3 сообщения каждые 10 секунд"""
     
     keyboard = [
         [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
@@ -803,22 +1152,12 @@ async def everyday_timezone_button_selected(update: Update, context: ContextType
 async def everyday_timezone_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение часового пояса для ежедневного напоминания (текстовый вариант)"""
     user_id = update.effective_user.id
-    timezone_str = update.message.text.strip()
     
-    # Проверяем, валиден ли часовой пояс
-    try:
-        pytz.timezone(timezone_str)
-        context.user_data['everyday_timezone'] = timezone_str
-    except pytz.exceptions.UnknownTimeZoneError:
-        await update.message.reply_text(
-            f"{EMOJIS['error']} *Неправильный часовой пояс!*\n\n"
-            f"Пожалуйста, используй корректное название, например:\n"
-            f"• Europe/Moscow\n"
-            f"• Asia/Baku\n"
-            f"• America/New_York",
-            parse_mode=ParseMode.MARKDOWN
-        )
+    # Точное название принимаем сразу, иначе предлагаем похожие пояса
+    timezone_str = await resolve_timezone(update, context, "everyday_reminder_menu")
+    if timezone_str is None:
         return States.WAITING_EVERYDAY_TIMEZONE.value
+    context.user_data['everyday_timezone'] = timezone_str
     
     text = f"""{EMOJIS['add']} *Добавить ежедневное напоминание*
 
@@ -833,7 +1172,9 @@ async def everyday_timezone_received(update: Update, context: ContextTypes.DEFAU
 • 14:30 (2:30 дня)
 • 23:59 (11:59 вечера)
 
-{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)"""
+{EMOJIS['info']} Напиши время в формате ЧЧ:МММ (24-часовой формат)
+
+🔁 Можно указать повторы: *09:00 3/10* — 3 сообщения каждые 10 секунд"""
     
     keyboard = [
         [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
@@ -849,30 +1190,32 @@ async def everyday_timezone_received(update: Update, context: ContextTypes.DEFAU
 async def everyday_reminder_time_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Получение времени для ежедневного напоминания"""
     user_id = update.effective_user.id
-    reminder_time = update.message.text.strip()
     
-    # Валидация времени
-    try:
-        datetime.strptime(reminder_time, "%H:%M")
-    except ValueError:
+    # Валидация времени (и необязательных повторов)
+    parsed = parse_reminder_time(update.message.text.strip())
+    if parsed is None:
         await update.message.reply_text(
             f"{EMOJIS['error']} *Неправильный формат времени!*\n\n"
             f"Пожалуйста, используй формат: ЧЧ:МММ\n"
-            f"Пример: 09:30 или 14:00",
+            f"Пример: 09:30 или 14:00 (с повторами: 09:30 3/10)",
             parse_mode=ParseMode.MARKDOWN
         )
         return States.WAITING_EVERYDAY_REMINDER_TIME.value
+    reminder_time, repeat_count, repeat_interval = parsed
     
     # Получаем данные из контекста
     task_name = context.user_data.get('everyday_task_name')
     timezone = context.user_data.get('everyday_timezone')
     
     # Добавляем ежедневное напоминание в базу данных
-    success = db.add_everyday_reminder(user_id, task_name, timezone, reminder_time)
+    reminder = db.add_everyday_reminder(user_id, task_name, timezone, reminder_time,
+                                        repeat_count, repeat_interval)
     
-    if success:
+    if reminder:
         # Планируем напоминание
-        await schedule_reminder(user_id, task_name, reminder_time, timezone, context.application)
+        await schedule_reminder("everyday", user_id, reminder["id"], task_name, reminder_time, timezone,
+                                repeat_count, repeat_interval)
+        repeats = repeat_count or config.REMINDER_REPEAT_COUNT
         
         text = f"""{EMOJIS['success']} *Отлично! Ежедневное напоминание добавлено!*
 
@@ -880,7 +1223,7 @@ async def everyday_reminder_time_received(update: Update, context: ContextTypes.
 *Время:* {reminder_time} каждый день
 *Часовой пояс:* {timezone}
 
-{EMOJIS['info']} Ты будешь получать 5 сообщений в это время! ⏰"""
+{EMOJIS['info']} Ты будешь получать {repeats} сообщ. в это время! ⏰"""
         
         keyboard = [
             [
@@ -923,11 +1266,36 @@ async def everyday_reminder_delete(update: Update, context: ContextTypes.DEFAULT
     success = db.delete_everyday_reminder(user_id, reminder_id)
     
     if success:
+        cancel_reminder("everyday", user_id, reminder_id)
         await query.answer(f"🗑️ Напоминание удалено!", show_alert=False)
         await everyday_reminder_menu(update, context)
     else:
         await query.answer(f"{EMOJIS['error']} Ошибка", show_alert=True)
 
+async def everyday_reminder_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Включает/выключает ежедневное напоминание"""
+    user_id = update.effective_user.id
+    query = update.callback_query
+    await query.answer()
+    
+    callback_data = query.data
+    reminder_id = int(callback_data.replace("everyday_reminder_toggle_", ""))
+    
+    reminder = None
+    if db.toggle_everyday_reminder(user_id, reminder_id):
+        reminder = db.get_everyday_reminder(user_id, reminder_id)
+    
+    if reminder:
+        if reminder['active']:
+            await schedule_reminder("everyday", user_id, reminder_id, reminder['task'],
+                                    reminder['reminder_time'], reminder['timezone'],
+                                    reminder.get('repeat_count'), reminder.get('repeat_interval'))
+        else:
+            cancel_reminder("everyday", user_id, reminder_id)
+        await everyday_reminder_menu(update, context)
+    else:
+        await query.answer(f"{EMOJIS['error']} Ошибка", show_alert=True)
+
 async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Возвращение в главное меню"""
     query = update.callback_query
@@ -942,29 +1310,7 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 Выбери нужное действие:"""
     
-    keyboard = [
-        [
-            InlineKeyboardButton(f"{EMOJIS['pending']} Активные задачи", 
-                               callback_data="pending_tasks"),
-            InlineKeyboardButton(f"{EMOJIS['done']} Завершённые", 
-                               callback_data="completed_tasks")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJIS['add']} Добавить новую задачу", 
-                               callback_data="add_task")
-        ],
-        [
-            InlineKeyboardButton("📝 Simple Todo список", 
-                               callback_data="simple_todo_menu")
-        ],
-        [
-            InlineKeyboardButton("🔔 Ежедневное напоминание", 
-                               callback_data="everyday_reminder_menu")
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(text, reply_markup=reply_markup, 
+    await query.edit_message_text(text, reply_markup=MAIN_MENU_MARKUP, 
                                  parse_mode=ParseMode.MARKDOWN)
     
     return ConversationHandler.END
@@ -983,6 +1329,8 @@ async def complete_todo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     success = db.complete_todo(user_id, todo_id)
     
     if success:
+        # Завершённой задаче напоминание больше не нужно
+        cancel_reminder("todo", user_id, todo_id)
         await query.answer(f"{EMOJIS['success']} Задача завершена!", show_alert=False)
         # Обновляем список активных задач
         await pending_tasks(update, context)
@@ -1003,12 +1351,152 @@ async def delete_todo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     success = db.delete_todo(user_id, todo_id)
     
     if success:
+        cancel_reminder("todo", user_id, todo_id)
         await query.answer(f"{EMOJIS['delete']} Задача удалена!", show_alert=False)
         # Обновляем список завершённых задач
         await completed_tasks(update, context)
     else:
         await query.answer(f"{EMOJIS['error']} Ошибка при удалении задачи", show_alert=True)
 
+async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Начало массового импорта (/import или кнопка в меню)"""
+    text = """📥 *Массовый импорт*
+
+Пришли список сообщением - по одной записи на строку:
+• `09:00 Позвонить маме` - задача с напоминанием
+• `09:00 3/10 Выпить таблетку` - с повторами
+• `Купить молоко` - простой todo
+
+Или загрузи файл CSV, JSON или TXT - например, сделанный командой /export.
+
+Если в списке есть ошибка, ничего не добавится: я покажу, что исправить."""
+    
+    keyboard = [
+        [InlineKeyboardButton(f"{EMOJIS['back']} Отмена", 
+                            callback_data="back_to_main")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    query = update.callback_query
+    if query:
+        await query.answer()
+        await query.edit_message_text(text, reply_markup=reply_markup, 
+                                     parse_mode=ParseMode.MARKDOWN)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, 
+                                       parse_mode=ParseMode.MARKDOWN)
+    
+    return States.WAITING_IMPORT.value
+
+async def apply_import(update: Update, context: ContextTypes.DEFAULT_TYPE, rows) -> int:
+    """Проверяет записи импорта и добавляет их все разом или ни одной"""
+    user_id = update.effective_user.id
+    
+    records, errors = read_records(rows, db.get_user_timezone(user_id), config.IMPORT_MAX_ITEMS)
+    if errors or not records:
+        # Ошибки содержат текст пользователя, поэтому без Markdown
+        if errors:
+            text = (f"{EMOJIS['error']} Импорт отменён, ничего не добавлено.\n\n"
+                    f"Ошибки (строка: причина):\n" + "\n".join(f"• {e}" for e in errors) +
+                    "\n\nИсправь и пришли ещё раз.")
+        else:
+            text = f"{EMOJIS['warning']} Не нашёл ни одной задачи. Пришли список ещё раз."
+        await update.message.reply_text(text)
+        return States.WAITING_IMPORT.value
+    
+    created = db.add_items(user_id, records)
+    for record, (kind, item) in zip(records, created):
+        if kind == "todo" and not item["completed"] or kind == "everyday" and item["active"]:
+            await schedule_reminder(kind, user_id, item["id"], item["task"], record["time"],
+                                    record["timezone"], record["repeat_count"],
+                                    record["repeat_interval"])
+    
+    counts = Counter(kind for kind, _ in created)
+    text = f"""{EMOJIS['success']} *Импорт завершён!*
+
+Задач с напоминанием: {counts['todo']}
+Простых todos: {counts['simple']}
+Ежедневных напоминаний: {counts['everyday']}"""
+    
+    keyboard = [
+        [InlineKeyboardButton(f"{EMOJIS['back']} В меню", 
+                            callback_data="back_to_main")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text(text, reply_markup=reply_markup, 
+                                   parse_mode=ParseMode.MARKDOWN)
+    
+    return ConversationHandler.END
+
+async def import_text_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Импорт списка, вставленного сообщением"""
+    return await apply_import(update, context, parse_lines(update.message.text.splitlines()))
+
+async def import_document_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Импорт из загруженного файла CSV / JSON / TXT
+    
+    Файл скачивается во временный файл и разбирается потоково,
+    по строке или объекту за раз.
+    """
+    document = update.message.document
+    name = (document.file_name or "").lower()
+    if name.endswith(".csv"):
+        parse = parse_csv
+    elif name.endswith((".json", ".jsonl")):
+        parse = parse_json
+    elif name.endswith(".txt"):
+        parse = parse_lines
+    else:
+        await update.message.reply_text(
+            f"{EMOJIS['error']} Поддерживаются файлы .csv, .json, .jsonl и .txt"
+        )
+        return States.WAITING_IMPORT.value
+    if document.file_size and document.file_size > config.IMPORT_MAX_FILE_SIZE:
+        await update.message.reply_text(
+            f"{EMOJIS['error']} Файл больше {config.IMPORT_MAX_FILE_SIZE // 1024} КБ"
+        )
+        return States.WAITING_IMPORT.value
+    
+    file = await document.get_file()
+    with tempfile.TemporaryFile() as raw:
+        await file.download_to_memory(raw)
+        raw.seek(0)
+        stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        try:
+            return await apply_import(update, context, parse(stream))
+        finally:
+            stream.detach()
+
+async def export_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выгружает все записи пользователя файлом (/export - CSV, /export json - JSON Lines)
+    
+    Записи читаются из хранилища по одной и сразу пишутся во временный
+    файл, так что ни база, ни весь список пользователя не собираются в памяти.
+    """
+    user_id = update.effective_user.id
+    query = update.callback_query
+    if query:
+        await query.answer()
+    as_json = bool(context.args) and context.args[0].lower() == "json"
+    
+    rows = export_rows(db.iter_items(user_id), db.get_user_timezone(user_id))
+    with tempfile.TemporaryFile() as raw:
+        stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        count = (write_json_lines if as_json else write_csv)(rows, stream)
+        stream.detach()
+        
+        if not count:
+            await context.bot.send_message(
+                update.effective_chat.id, f"{EMOJIS['info']} Пока нечего выгружать - список пуст."
+            )
+            return
+        raw.seek(0)
+        await context.bot.send_document(
+            update.effective_chat.id, raw,
+            filename=f"todos_{user_id}.{'jsonl' if as_json else 'csv'}",
+            caption=f"📤 Записей: {count}. Этот файл можно загрузить обратно через /import."
+        )
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена добавления задачи"""
     query = update.callback_query
@@ -1017,20 +1505,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await back_to_main(update, context)
     return ConversationHandler.END
 
-def main():
-    """Запуск бота"""
-    # Создаём приложение
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Запускаем планировщик напоминаний
-    scheduler.start()
-    
-    # Регистрируем функцию для корректного завершения
-    async def stop_scheduler(app):
-        scheduler.shutdown()
-    
-    application.post_stop = stop_scheduler
+def create_handlers() -> List[BaseHandler]:
+    """Обработчики бота в порядке проверки (группа 0)
     
+    Отдельно от build_application: фронт шардирования по ним определяет
+    allowed_updates, не открывая хранилище.
+    """
     # Обработчик ConversationHandler для добавления задачи
     conv_handler = ConversationHandler(
         entry_points=[
@@ -1045,6 +1525,7 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, timezone_received),
                 CallbackQueryHandler(show_all_timezones, pattern="^show_all_tz$"),
                 CallbackQueryHandler(timezone_button_selected, pattern="^tz_"),
+                CallbackQueryHandler(timezone_search_page, pattern="^tzpage_"),
                 CallbackQueryHandler(cancel, pattern="^back_to_main$")
             ],
             States.WAITING_REMINDER_TIME.value: [
@@ -1056,76 +1537,227 @@ def main():
             CallbackQueryHandler(cancel, pattern="^back_to_main$"),
             CommandHandler("start", start)
         ],
-        per_message=False
+        per_message=False,
+        name="add_task",
+        persistent=True,
+        conversation_timeout=config.SESSION_TTL
     )
     
     # ConversationHandler для добавления simple todo
     simple_todo_handler = ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(simple_todo_menu, pattern="^simple_todo_menu$"),
+            CallbackQueryHandler(simple_todo_menu, pattern=r"^simple_todo_menu(:(next|prev):\d+)?$"),
             CallbackQueryHandler(simple_todo_add_start, pattern="^simple_todo_add$")
         ],
         states={
             2: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, simple_todo_text_received),
-                CallbackQueryHandler(simple_todo_menu, pattern="^simple_todo_menu$")
+                CallbackQueryHandler(simple_todo_menu, pattern=r"^simple_todo_menu(:(next|prev):\d+)?$")
             ]
         },
         fallbacks=[
-            CallbackQueryHandler(simple_todo_menu, pattern="^simple_todo_menu$"),
+            CallbackQueryHandler(simple_todo_menu, pattern=r"^simple_todo_menu(:(next|prev):\d+)?$"),
             CallbackQueryHandler(back_to_main, pattern="^back_to_main$")
         ],
-        per_message=False
+        per_message=False,
+        name="simple_todo",
+        persistent=True,
+        conversation_timeout=config.SESSION_TTL
     )
     
     # ConversationHandler для ежедневных напоминаний
     everyday_reminder_handler = ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(everyday_reminder_menu, pattern="^everyday_reminder_menu$"),
+            CallbackQueryHandler(everyday_reminder_menu, pattern=r"^everyday_reminder_menu(:(next|prev):\d+)?$"),
             CallbackQueryHandler(everyday_reminder_add_start, pattern="^everyday_reminder_add$")
         ],
         states={
             States.WAITING_EVERYDAY_TASK_NAME.value: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, everyday_task_name_received),
-                CallbackQueryHandler(everyday_reminder_menu, pattern="^everyday_reminder_menu$")
+                CallbackQueryHandler(everyday_reminder_menu, pattern=r"^everyday_reminder_menu(:(next|prev):\d+)?$")
             ],
             States.WAITING_EVERYDAY_TIMEZONE.value: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, everyday_timezone_received),
                 CallbackQueryHandler(everyday_timezone_button_selected, pattern="^tz_"),
-                CallbackQueryHandler(everyday_reminder_menu, pattern="^everyday_reminder_menu$")
+                CallbackQueryHandler(timezone_search_page, pattern="^tzpage_"),
+                CallbackQueryHandler(everyday_reminder_menu, pattern=r"^everyday_reminder_menu(:(next|prev):\d+)?$")
             ],
             States.WAITING_EVERYDAY_REMINDER_TIME.value: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, everyday_reminder_time_received),
-                CallbackQueryHandler(everyday_reminder_menu, pattern="^everyday_reminder_menu$")
+                CallbackQueryHandler(everyday_reminder_menu, pattern=r"^everyday_reminder_menu(:(next|prev):\d+)?$")
             ]
         },
         fallbacks=[
-            CallbackQueryHandler(everyday_reminder_menu, pattern="^everyday_reminder_menu$"),
+            CallbackQueryHandler(everyday_reminder_menu, pattern=r"^everyday_reminder_menu(:(next|prev):\d+)?$"),
             CallbackQueryHandler(back_to_main, pattern="^back_to_main$")
         ],
-        per_message=False
+        per_message=False,
+        name="everyday_reminder",
+        persistent=True,
+        conversation_timeout=config.SESSION_TTL
     )
     
-    # Обработчики команд и кнопок
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(conv_handler)
-    application.add_handler(simple_todo_handler)
-    application.add_handler(everyday_reminder_handler)
-    application.add_handler(CallbackQueryHandler(pending_tasks, pattern="^pending_tasks$"))
-    application.add_handler(CallbackQueryHandler(completed_tasks, pattern="^completed_tasks$"))
-    application.add_handler(CallbackQueryHandler(back_to_main, pattern="^back_to_main$"))
-    application.add_handler(CallbackQueryHandler(complete_todo, pattern="^complete_"))
-    application.add_handler(CallbackQueryHandler(delete_todo, pattern="^delete_"))
-    application.add_handler(CallbackQueryHandler(simple_todo_complete, pattern="^simple_todo_complete_"))
-    application.add_handler(CallbackQueryHandler(simple_todo_delete, pattern="^simple_todo_delete_"))
-    application.add_handler(CallbackQueryHandler(everyday_reminder_delete, pattern="^everyday_reminder_delete_"))
-    
-    # Обработчик для неизвестных текстовых сообщений (должен быть последним)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unknown_message))
+    # ConversationHandler для массового импорта
+    import_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("import", import_start),
+            CallbackQueryHandler(import_start, pattern="^bulk_import$")
+        ],
+        states={
+            States.WAITING_IMPORT.value: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, import_text_received),
+                MessageHandler(filters.Document.ALL, import_document_received),
+                CallbackQueryHandler(cancel, pattern="^back_to_main$")
+            ]
+        },
+        fallbacks=[
+            CallbackQueryHandler(cancel, pattern="^back_to_main$"),
+            CommandHandler("start", start)
+        ],
+        per_message=False,
+        name="bulk_import",
+        persistent=True,
+        conversation_timeout=config.SESSION_TTL
+    )
+    
+    return [
+        # Обработчики команд и кнопок
+        CommandHandler("start", start),
+        CommandHandler("export", export_tasks),
+        CallbackQueryHandler(export_tasks, pattern="^export$"),
+        import_handler,
+        conv_handler,
+        simple_todo_handler,
+        everyday_reminder_handler,
+        CallbackQueryHandler(pending_tasks, pattern=r"^pending_tasks(:(next|prev):\d+)?$"),
+        CallbackQueryHandler(completed_tasks, pattern=r"^completed_tasks(:(next|prev):\d+)?$"),
+        CallbackQueryHandler(
+            task_selection, pattern=r"^(pending_tasks|completed_tasks):(select|pick|apply|clear)"
+        ),
+        CallbackQueryHandler(back_to_main, pattern="^back_to_main$"),
+        CallbackQueryHandler(complete_todo, pattern="^complete_"),
+        CallbackQueryHandler(delete_todo, pattern="^delete_"),
+        CallbackQueryHandler(simple_todo_complete, pattern="^simple_todo_complete_"),
+        CallbackQueryHandler(simple_todo_delete, pattern="^simple_todo_delete_"),
+        CallbackQueryHandler(everyday_reminder_delete, pattern="^everyday_reminder_delete_"),
+        CallbackQueryHandler(everyday_reminder_toggle, pattern="^everyday_reminder_toggle_"),
+        # Обработчик для неизвестных текстовых сообщений (должен быть последним)
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unknown_message),
+    ]
+
+def build_application(token: str, base_url: Optional[str] = None) -> Application:
+    """Создаёт приложение со всеми обработчиками
+    
+    base_url позволяет направить запросы к Bot API на другой сервер
+    (например, на локальную заглушку Telegram в fake_telegram.py).
+    """
+    global bot_app, update_filter
+    
+    if db is None:
+        open_storage()
+    
+    # Создаём приложение; ограниченная очередь обновлений сдерживает
+    # приём (webhook отвечает медленнее), если обработчики не успевают:
+    # из очереди берётся не больше MAX_PENDING_UPDATES необработанных.
+    # Обновления разных пользователей обрабатываются параллельно,
+    # одного пользователя - по порядку
+    update_queue = AdmissionQueue(config.UPDATE_QUEUE_SIZE, config.MAX_PENDING_UPDATES)
+    builder = Application.builder().token(token).update_queue(
+        update_queue
+    ).concurrent_updates(
+        PerUserUpdateProcessor(config.MAX_CONCURRENT_UPDATES, update_queue)
+    ).connection_pool_size(
+        # По умолчанию у бота одно соединение к Bot API - на нём
+        # параллельные обработчики и воркеры отправки стояли бы в очереди
+        config.MAX_CONCURRENT_UPDATES + config.SEND_WORKERS
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    # Диалоги и user_data переживают перезапуск и не копятся в памяти
+    persistence = SessionPersistence(db, config.SESSION_TTL, config.MAX_RESIDENT_SESSIONS,
+                                     config.SESSION_SAVE_INTERVAL, config.SESSION_EXPIRE_INTERVAL)
+    application = builder.persistence(persistence).build()
+    persistence.attach(application)
+    bot_app = application
+    
+    # Восстанавливаем напоминания из базы и запускаем диспетчер
+    # (ему нужен работающий event loop, поэтому в post_init)
+    warm_up_task: Optional[asyncio.Task] = None
+    
+    async def start_dispatcher(app):
+        nonlocal warm_up_task
+        sender.start()
+        # post_init идёт до start(), поэтому задачу отслеживаем сами
+        warm_up_task = asyncio.create_task(warm_up())
+    
+    async def warm_up():
+        # Запуск не ждёт ни напоминаний, ни индекса поясов: диспетчер
+        # начинает рассылку, когда все напоминания разложены (иначе
+        # пропущенные при смене экземпляра минуты разошлись бы не целиком)
+        await restore_reminders()
+        dispatcher.start()
+        # Индекс поясов строится заранее, чтобы не задерживать первый поиск
+        await asyncio.to_thread(get_timezone_index)
+    
+    application.post_init = start_dispatcher
+    
+    # Регистрируем функции для корректного завершения
+    async def stop_dispatcher(app):
+        if warm_up_task is not None and not warm_up_task.done():
+            warm_up_task.cancel()
+            try:
+                await warm_up_task
+            except asyncio.CancelledError:
+                pass
+        await dispatcher.stop()
+        await sender.stop(config.SEND_DRAIN_TIMEOUT)
+    
+    async def flush_database(app):
+        # Дописываем накопленные групповой фиксацией изменения. Сессии
+        # сохраняются в shutdown() уже после post_stop, поэтому база
+        # закрывается (и файл отдаётся резерву) только в post_shutdown
+        close_storage()
+    
+    async def post_stop(app):
+        await stop_dispatcher(app)
+        if update_filter.dropped:
+            logger.info(f"🚫 Всего отброшено обновлений: {dict(update_filter.dropped)}")
+    
+    application.post_stop = post_stop
+    application.post_shutdown = flush_database
+    
+    application.add_handlers(create_handlers())
+    
+    # Типы обновлений выводятся из обработчиков; остальные отбрасываются
+    # в группе -1 ещё до диспетчеризации
+    update_filter = UpdateFilter(allowed_update_types(application.handlers))
+    application.add_handler(TypeHandler(Update, update_filter), group=-1)
+    logger.info(f"📨 Принимаемые типы обновлений: {', '.join(update_filter.allowed)}")
+    
+    return application
+
+def main():
+    """Запуск бота"""
+    application = build_application(BOT_TOKEN, base_url=os.getenv("TELEGRAM_BASE_URL"))
     
     # Запуск бота
-    logger.info("🤖 Бот запущен!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if SHARD_COUNT > 1:
+        logger.info(f"🤖 Бот запущен (шард {SHARD_INDEX} из {SHARD_COUNT})!")
+    else:
+        logger.info("🤖 Бот запущен!")
+    if os.getenv("UPDATE_MODE", config.UPDATE_MODE) == "webhook":
+        asyncio.run(serve_webhook(
+            application,
+            host=os.getenv("WEBHOOK_HOST", config.WEBHOOK_HOST),
+            port=int(os.getenv("WEBHOOK_PORT", config.WEBHOOK_PORT)),
+            path=config.WEBHOOK_PATH,
+            webhook_url=os.getenv("WEBHOOK_URL"),
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            max_concurrency=config.WEBHOOK_MAX_CONCURRENCY,
+            allowed_updates=list(update_filter.allowed)
+        ))
+    else:
+        application.run_polling(allowed_updates=list(update_filter.allowed))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,227 @@
+"""Массовый импорт и экспорт задач пользователя
+
+Поддерживаемые форматы:
+    строки  - каждая строка сообщения - отдельная запись: "ЧЧ:ММ [N/S] текст"
+              становится задачей с напоминанием, просто "текст" - simple todo
+    CSV     - заголовок с колонками EXPORT_FIELDS (обязательна только task)
+    JSON    - массив объектов или JSON Lines (по объекту на строку)
+
+Файлы читаются потоково: по строке CSV или по объекту JSON за раз, а
+экспорт пишется в поток по одной записи.
+"""
+import csv
+import json
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import pytz
+
+import config
+from database import TYPE_COLLECTIONS
+from timezones import registry
+
+# Колонки CSV и ключи JSON; при импорте обязательна только task
+EXPORT_FIELDS = ("type", "task", "time", "timezone", "repeat_count", "repeat_interval",
+                 "completed", "active")
+
+TIME_RE = re.compile(r"^\d{1,2}:\d{2}$")
+REPEAT_RE = re.compile(r"^(\d+)(?:/(\d+))?$")
+# Пробелы, запятые и скобки массива между объектами JSON
+JSON_SEPARATORS_RE = re.compile(r"[\s,\[\]]*")
+
+TRUE_VALUES = ("1", "true", "yes", "да", "+")
+FALSE_VALUES = ("0", "false", "no", "нет", "-")
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[Tuple[int, Dict]]:
+    """Разбирает список (строки сообщения или текстового файла): по записи на непустую строку"""
+    for number, line in enumerate(lines, 1):
+        parts = line.split(None, 2)
+        if not parts:
+            continue
+        if not TIME_RE.match(parts[0]):
+            yield number, {"type": "simple", "task": line}
+            continue
+        raw = {"type": "todo", "time": parts[0]}
+        rest = parts[1:]
+        repeat = REPEAT_RE.match(rest[0]) if rest else None
+        if repeat:
+            raw["repeat_count"], raw["repeat_interval"] = repeat.groups()
+            rest = rest[1:]
+        raw["task"] = " ".join(rest)
+        yield number, raw
+
+
+def parse_csv(stream: TextIO) -> Iterator[Tuple[int, Dict]]:
+    """Читает CSV с заголовком построчно"""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None or "task" not in reader.fieldnames:
+        raise ValueError("в заголовке CSV нет колонки task")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_json(stream: TextIO, chunk_size: int = 65536) -> Iterator[Tuple[int, Dict]]:
+    """Читает массив объектов JSON или JSON Lines, не загружая файл целиком
+
+    Файл читается кусками по chunk_size символов, объекты разбираются по
+    одному через raw_decode; в памяти держится только недочитанный хвост.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    number = 0
+    while True:
+        position = JSON_SEPARATORS_RE.match(buffer, position).end()
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("нет данных", buffer, position)
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                if position < len(buffer):
+                    raise
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        number += 1
+        yield number, value
+
+
+def _flag(value, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"не понял значение «{value}»")
+
+
+def _bounded(value, limit: int, name: str) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} должно быть числом")
+    if not 1 <= number <= limit:
+        raise ValueError(f"{name} должно быть от 1 до {limit}")
+    return number
+
+
+def validate_record(raw, default_timezone: str) -> Dict:
+    """Проверяет одну запись импорта и приводит её к виду для add_items
+
+    Бросает ValueError с понятным пользователю описанием ошибки.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("ожидался объект с полем task")
+    kind = str(raw.get("type") or "").strip().lower() or ("todo" if raw.get("time") else "simple")
+    if kind not in TYPE_COLLECTIONS:
+        raise ValueError(f"неизвестный тип «{kind}» (todo, simple или everyday)")
+    task = str(raw.get("task") or "").strip()
+    if not task:
+        raise ValueError("пустой текст задачи")
+    if len(task) > config.IMPORT_MAX_TASK_LENGTH:
+        raise ValueError(f"задача длиннее {config.IMPORT_MAX_TASK_LENGTH} символов")
+
+    record = {"type": kind, "task": task}
+    if kind == "simple":
+        record["completed"] = _flag(raw.get("completed"), False)
+        return record
+
+    try:
+        time = datetime.strptime(str(raw.get("time") or "").strip(), "%H:%M")
+    except ValueError:
+        raise ValueError("время должно быть в формате ЧЧ:ММ")
+    timezone = str(raw.get("timezone") or "").strip() or default_timezone
+    try:
+        timezone = registry.name(timezone)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"неизвестный часовой пояс «{timezone}»")
+    record.update(
+        time=f"{time.hour:02d}:{time.minute:02d}",
+        timezone=timezone,
+        repeat_count=_bounded(raw.get("repeat_count"), config.REMINDER_MAX_REPEATS,
+                              "число повторов"),
+        repeat_interval=_bounded(raw.get("repeat_interval"), config.REMINDER_MAX_REPEAT_INTERVAL,
+                                 "интервал повторов"),
+    )
+    if kind == "everyday":
+        record["active"] = _flag(raw.get("active"), True)
+    else:
+        record["completed"] = _flag(raw.get("completed"), False)
+    return record
+
+
+def read_records(rows: Iterable[Tuple[int, Dict]], default_timezone: str,
+                 max_items: int, max_errors: int = 10) -> Tuple[List[Dict], List[str]]:
+    """Проверяет записи по мере чтения
+
+    Возвращает (проверенные записи, ошибки). Чтение останавливается после
+    max_errors ошибок или если записей больше max_items.
+    """
+    records: List[Dict] = []
+    errors: List[str] = []
+    try:
+        for number, raw in rows:
+            if len(records) >= max_items:
+                errors.append(f"больше {max_items} записей за раз")
+                break
+            try:
+                records.append(validate_record(raw, default_timezone))
+            except ValueError as e:
+                errors.append(f"{number}: {e}")
+                if len(errors) >= max_errors:
+                    break
+    except (ValueError, csv.Error) as e:
+        # Сюда попадают и ошибки JSON, и неверная кодировка
+        errors.append(f"файл не разобрать: {e}")
+    return records, errors
+
+
+def export_rows(items: Iterable[Tuple[str, Dict]], user_timezone: str) -> Iterator[Dict]:
+    """Превращает записи хранилища в строки экспорта (колонки EXPORT_FIELDS)"""
+    for kind, item in items:
+        row = {"type": kind, "task": item["task"]}
+        if kind != "simple":
+            row.update(
+                time=item["reminder_time"],
+                timezone=item.get("timezone", user_timezone),
+                repeat_count=item.get("repeat_count"),
+                repeat_interval=item.get("repeat_interval"),
+            )
+        if kind == "everyday":
+            row["active"] = item["active"]
+        else:
+            row["completed"] = item["completed"]
+        yield row
+
+
+def write_csv(rows: Iterable[Dict], stream: TextIO) -> int:
+    """Пишет строки экспорта в CSV; возвращает число записей"""
+    writer = csv.DictWriter(stream, EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_json_lines(rows: Iterable[Dict], stream: TextIO) -> int:
+    """Пишет строки экспорта в JSON Lines; возвращает число записей"""
+    count = 0
+    for row in rows:
+        stream.write(json.dumps({key: value for key, value in row.items() if value is not None},
+                                ensure_ascii=False))
+        stream.write("\n")
+        count += 1
+    return count
@@ -27,6 +27,50 @@ TIMEZONE_EXAMPLES = [
     "GMT-8 - Лос-Анджелес",
 ]
 
+# Популярные пояса для быстрого выбора
+POPULAR_TIMEZONES = [
+    'Europe/Moscow',      # GMT+3
+    'Asia/Baku',          # GMT+4
+    'Asia/Tashkent',      # GMT+5
+    'Asia/Kolkata',       # GMT+5:30
+    'Asia/Bangkok',       # GMT+7
+    'Asia/Shanghai',      # GMT+8
+    'Europe/London',      # GMT+0
+    'Europe/Berlin',      # GMT+1
+    'Europe/Istanbul',    # GMT+3
+    'America/New_York',   # GMT-5
+    'America/Los_Angeles',# GMT-8
+    'Australia/Sydney',   # GMT+10
+]
+
+# Русские названия городов для поиска часового пояса
+TIMEZONE_ALIASES = {
+    "москва": "Europe/Moscow",
+    "санкт-петербург": "Europe/Moscow",
+    "питер": "Europe/Moscow",
+    "калининград": "Europe/Kaliningrad",
+    "самара": "Europe/Samara",
+    "екатеринбург": "Asia/Yekaterinburg",
+    "новосибирск": "Asia/Novosibirsk",
+    "красноярск": "Asia/Krasnoyarsk",
+    "иркутск": "Asia/Irkutsk",
+    "владивосток": "Asia/Vladivostok",
+    "киев": "Europe/Kyiv",
+    "минск": "Europe/Minsk",
+    "баку": "Asia/Baku",
+    "тбилиси": "Asia/Tbilisi",
+    "ереван": "Asia/Yerevan",
+    "ташкент": "Asia/Tashkent",
+    "алматы": "Asia/Almaty",
+    "дубай": "Asia/Dubai",
+    "стамбул": "Europe/Istanbul",
+    "лондон": "Europe/London",
+    "берлин": "Europe/Berlin",
+    "нью-йорк": "America/New_York",
+}
+# Сколько найденных поясов показывать на одной странице
+TIMEZONE_SEARCH_PAGE_SIZE = 8
+
 # Примеры времени
 TIME_EXAMPLES = [
     "09:00 - 9 утра",
@@ -37,3 +81,104 @@ TIME_EXAMPLES = [
 # Сохранение данных
 DATABASE_FILE = "todos.json"
 AUTO_SAVE_ENABLED = True
+
+# Режим хранения: "json" (полная перезапись файла), "wal" (журнал изменений)
+# или "sqlite" (также выбирается автоматически для DATABASE_FILE с расширением .db)
+STORAGE_MODE = "json"
+# Откуда однократно перенести данные при первом запуске на SQLite
+JSON_MIGRATION_SOURCE = "todos.json"
+# Через сколько записей журнал сжимается в снапшот
+WAL_COMPACT_EVERY = 1000
+# Групповая фиксация: изменения пишутся одной пачкой раз в GROUP_COMMIT_INTERVAL
+# секунд или сразу после GROUP_COMMIT_MAX_PENDING изменений (0 - писать сразу)
+GROUP_COMMIT_INTERVAL = 0.2
+GROUP_COMMIT_MAX_PENDING = 500
+# Отправка напоминаний: число воркеров, общий лимит сообщений в секунду,
+# минимальный интервал между сообщениями в один чат и число повторов
+SEND_WORKERS = 8
+SEND_RATE_PER_SECOND = 30
+SEND_PER_CHAT_INTERVAL = 1.0
+SEND_MAX_RETRIES = 3
+# Сколько секунд при остановке бот дописывает очередь отправки. Напоминания,
+# не отправленные за это время, досылает следующий экземпляр
+SEND_DRAIN_TIMEOUT = 10
+# Как часто (в секундах) журнал SQLite сбрасывается на диск фоновым потоком
+SQLITE_CHECKPOINT_INTERVAL = 1.0
+# Повторы напоминания: сколько сообщений отправить при срабатывании и с каким
+# интервалом (в секундах); пользователь может задать свои, например "09:00 3/10"
+REMINDER_REPEAT_COUNT = 5
+REMINDER_REPEAT_INTERVAL = 3
+REMINDER_MAX_REPEATS = 10
+REMINDER_MAX_REPEAT_INTERVAL = 3600
+# Получение обновлений: "polling" (getUpdates) или "webhook" (встроенный HTTP-сервер).
+# Для webhook в .env задаются WEBHOOK_URL (публичный адрес) и WEBHOOK_SECRET
+UPDATE_MODE = "polling"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/webhook"
+# Сколько запросов webhook разбирается одновременно
+WEBHOOK_MAX_CONCURRENCY = 64
+# Размер очереди необработанных обновлений
+UPDATE_QUEUE_SIZE = 1000
+# Сколько обновлений обрабатывается одновременно (обновления одного
+# пользователя всегда обрабатываются по порядку; 1 - строго последовательно)
+MAX_CONCURRENT_UPDATES = 32
+# Сколько обновлений забрано из очереди и ещё не обработано (выполняются или
+# ждут предыдущих обновлений того же пользователя). Остальные ждут в очереди
+MAX_PENDING_UPDATES = 256
+
+# Сколько записей показывать на одной странице списка
+LIST_PAGE_SIZE = 10
+# Сколько символов задачи показывать в списке (длинные обрезаются)
+LIST_TASK_PREVIEW = 200
+# Для скольких пользователей хранить отрисованные списки
+RENDER_CACHE_USERS = 10000
+
+# Массовый импорт: записей за раз, размер файла (байт), длина задачи
+IMPORT_MAX_ITEMS = 1000
+IMPORT_MAX_FILE_SIZE = 1024 * 1024
+IMPORT_MAX_TASK_LENGTH = 1000
+
+# Сессии (состояние диалогов и user_data) хранятся рядом с задачами.
+# Сессия без активности дольше SESSION_TTL секунд удаляется, а незаконченный
+# диалог завершается; в памяти держится не больше MAX_RESIDENT_SESSIONS
+# пользователей, остальные выгружаются на диск
+SESSION_TTL = 24 * 60 * 60
+MAX_RESIDENT_SESSIONS = 10000
+# Как часто (в секундах) изменения user_data сбрасываются в хранилище
+SESSION_SAVE_INTERVAL = 60
+# Как часто (в секундах) удаляются просроченные сессии - с диска и из памяти
+SESSION_EXPIRE_INTERVAL = 10 * 60
+
+# Шардирование (python sharding.py): пользователи распределяются по хешу
+# user_id между SHARD_COUNT процессами-воркерами. У каждого воркера свой
+# файл данных (todos.shard0.json, ...) и свои напоминания; воркер i
+# принимает обновления от фронта на 127.0.0.1:SHARD_BASE_PORT + i
+SHARD_COUNT = 4
+SHARD_BASE_PORT = 18443
+# Через сколько секунд перезапускать упавший воркер
+SHARD_RESTART_DELAY = 1.0
+# Таймаут long polling фронта (getUpdates), в секундах
+SHARD_POLL_TIMEOUT = 10
+# Сколько раз фронт (polling) пересылает обновление, которое шард не принял;
+# до тех пор оно не подтверждается Telegram и запрашивается заново
+SHARD_FORWARD_ATTEMPTS = 3
+
+# Несколько экземпляров бота на одном файле данных: работает тот, кто
+# захватил блокировку (todos.json.lock), остальные ждут в горячем резерве и
+# проверяют её каждые LEADER_POLL_INTERVAL секунд
+LEADER_POLL_INTERVAL = 0.2
+# Как часто владелец обновляет отметку в файле блокировки (в секундах)
+LEADER_HEARTBEAT_INTERVAL = 1.0
+# За сколько последних минут новый владелец досылает напоминания, которые
+# прежний не успел разослать (например, при перезапуске на границе минуты)
+REMINDER_CATCHUP_MINUTES = 5
+
+# Сколько предыдущих копий снапшота хранить (todos.json.1, todos.json.2, ...):
+# если основной файл повреждён, данные загружаются из последней целой копии
+SNAPSHOT_GENERATIONS = 3
+
+# Напоминания восстанавливаются из базы в фоне, уже после запуска бота:
+# после каждых REMINDER_RESTORE_BATCH напоминаний управление возвращается
+# обработчикам обновлений
+REMINDER_RESTORE_BATCH = 1000
@@ -0,0 +1 @@
+# Корень проекта в sys.path: тесты импортируют модули бота напрямую
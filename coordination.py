@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class StoreLease:
+    """Исключительное владение файлом данных среди экземпляров бота на одной машине
+
+    Владелец держит flock на файле блокировки (например, todos.json.lock):
+    пока она у него, только он читает и пишет файл данных и рассылает
+    напоминания. Остальные экземпляры ждут в горячем резерве и пробуют
+    захватить блокировку каждые poll_interval секунд. Ядро снимает flock,
+    как только процесс владельца завершается (даже при падении), поэтому
+    резерв подхватывает работу почти сразу.
+
+    В сам файл блокировки владелец раз в heartbeat_interval секунд пишет
+    отметку: pid, хост, время и то, что вернёт state(). Новый владелец
+    видит в previous последнюю отметку прежнего (например, до какой
+    минуты тот разослал напоминания), а резерв по устаревшей отметке
+    замечает зависшего владельца.
+    """
+
+    def __init__(self, path: str, heartbeat_interval: float = 1.0, poll_interval: float = 0.2,
+                 state: Optional[Callable[[], Dict]] = None):
+        self.path = path
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.state = state
+        # Последняя отметка прежнего владельца
+        self.previous: Dict = {}
+        self._fd: Optional[int] = None
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def holder(self) -> Optional[Dict]:
+        """Отметка текущего владельца из файла блокировки"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.loads(f.read() or "null")
+        except (OSError, ValueError):
+            # Файла ещё нет или владелец как раз его переписывает
+            return None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Захватывает блокировку; с blocking=False - только если она свободна"""
+        if self.held:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        stale_reported = False
+        while not self._try_lock(fd):
+            if not blocking:
+                os.close(fd)
+                return False
+            holder = self.holder()
+            if (not stale_reported and holder is not None
+                    and time.time() - holder.get("heartbeat", 0) > 3 * self.heartbeat_interval):
+                logger.warning(f"⚠️ Владелец {self.path} (pid {holder.get('pid')}) "
+                               f"не обновляет отметку — возможно, завис")
+                stale_reported = True
+            time.sleep(self.poll_interval)
+
+        self._fd = fd
+        self.previous = self.holder() or {}
+        self._since = time.time()
+        self._write()
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, name="lease-heartbeat",
+                                           daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def release(self):
+        """Записывает последнюю отметку и отпускает блокировку"""
+        if not self.held:
+            return
+        self._stop.set()
+        self._heartbeat.join()
+        self._write(released=True)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        if fcntl is None:
+            # Без flock экземпляры не различить: считаем, что бот один
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _write(self, released: bool = False):
+        record = {"pid": os.getpid(), "host": socket.gethostname(), "since": self._since,
+                  "heartbeat": time.time(), "released": released}
+        if self.state is not None:
+            record.update(self.state())
+        data = json.dumps(record).encode()
+        with self._write_lock:
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, data, 0)
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._write()
+            except Exception as e:
+                logger.error(f"✗ Не удалось обновить отметку {self.path}: {e}")
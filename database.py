@@ -1,50 +1,367 @@
 import json
+import logging
 import os
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import BackgroundWriter, GroupCommitter, JsonFileStore, SessionStore, WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+# Коллекции пользователя, у записей которых есть собственный ID
+COLLECTIONS = ("todos", "simple_todos", "everyday_reminders")
+
+# Тип записи при импорте/экспорте -> коллекция пользователя
+TYPE_COLLECTIONS = {"todo": "todos", "simple": "simple_todos", "everyday": "everyday_reminders"}
+
+# Поле-отметка записи в каждой коллекции (для подсчётов в заголовках списков)
+FLAG_FIELDS = {"todos": "completed", "simple_todos": "completed", "everyday_reminders": "active"}
+
+
+def session_path(filename: str) -> str:
+    """Файл сессий рядом с файлом данных: todos.json -> todos.sessions.db"""
+    return os.path.splitext(filename)[0] + ".sessions.db"
+
+
+def normalize_ids(user: Dict) -> bool:
+    """Заполняет счётчики next_ids пользователя и исправляет повторяющиеся ID
+    
+    Старые версии выдавали id = len(list), поэтому после удаления ID могли
+    повторяться; такие записи получают новые номера. Списки упорядочиваются
+    по ID - на этом держится постраничный вывод. Возвращает True, если
+    записи пришлось перенумеровать или переставить.
+    """
+    next_ids = user.setdefault("next_ids", {})
+    changed = False
+    for collection in COLLECTIONS:
+        items = user.get(collection, [])
+        next_id = max([next_ids.get(collection, 0)] + [item["id"] + 1 for item in items])
+        seen = set()
+        for item in items:
+            if item["id"] in seen:
+                item["id"] = next_id
+                next_id += 1
+                changed = True
+            seen.add(item["id"])
+        next_ids[collection] = next_id
+        if any(a["id"] > b["id"] for a, b in zip(items, items[1:])):
+            items.sort(key=lambda item: item["id"])
+            changed = True
+    return changed
+
+
+class LazyUsers(dict):
+    """user_id -> данные пользователя с разбором JSON при первом обращении
+    
+    Пользователи из файла лежат сырыми строками JSON: при старте их не
+    нужно разбирать, а в памяти они занимают не больше, чем в файле.
+    Первое чтение через [] или get() разбирает строку, кладёт результат
+    на её место и вызывает on_load(user_id_str).
+    """
+    
+    def __init__(self, rows: Dict, on_load: Callable[[str], None]):
+        super().__init__(rows)
+        self._on_load = on_load
+    
+    def __getitem__(self, user_id_str: str) -> Dict:
+        value = dict.__getitem__(self, user_id_str)
+        if isinstance(value, str):
+            value = self._hydrate(user_id_str, value)
+        return value
+    
+    def get(self, user_id_str: str, default=None):
+        if user_id_str not in self:
+            return default
+        return self[user_id_str]
+    
+    def peek(self, user_id_str: str) -> Dict:
+        """Данные пользователя без сохранения разобранного - для обхода всех"""
+        value = dict.__getitem__(self, user_id_str)
+        return json.loads(value) if isinstance(value, str) else value
+    
+    def _hydrate(self, user_id_str: str, text: str) -> Dict:
+        value = json.loads(text)
+        dict.__setitem__(self, user_id_str, value)
+        self._on_load(user_id_str)
+        return value
+
+
+def _position(items: List[Dict], item_id: int) -> int:
+    """Позиция первой записи с ID больше item_id (бинарный поиск по ID)"""
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high) // 2
+        if items[middle]["id"] <= item_id:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
 
 class TodoDatabase:
-    """Простая база данных для хранения задач"""
+    """Простая база данных для хранения задач
+    
+    Данные держатся в памяти, поэтому чтение мгновенное, а у каждой
+    коллекции пользователя есть индекс id -> запись для поиска за O(1).
+    При старте пользователи не разбираются: файл только делится на строки
+    JSON пользователей (LazyUsers), а разбор и индекс строятся при первом
+    обращении к пользователю, так что запуск не зависит от объёма данных.
+    ID выдаются из сохраняемых счётчиков next_ids и никогда не повторяются,
+    даже после удаления записей. Запись на диск
+    выполняет отдельный поток (BackgroundWriter), так что обработчики бота
+    не ждут диск. Изменения фиксируются группами (GroupCommitter): раз в
+    commit_interval секунд или после commit_max_pending мутаций.
     
-    def __init__(self, filename: str = "todos.json"):
+    storage_mode:
+        "json" - после каждого изменения файл перезаписывается целиком
+        "wal"  - изменения дописываются в журнал, который периодически
+                 сжимается в снапшот в фоновом потоке
+    """
+    
+    def __init__(self, filename: str = "todos.json", storage_mode: str = "json",
+                 wal_compact_every: int = 1000, commit_interval: float = 0,
+                 commit_max_pending: int = 500, snapshot_generations: int = 3):
         self.filename = filename
-        self.data = self._load_data()
+        self.storage_mode = storage_mode
+        self.snapshot_generations = snapshot_generations
+        if storage_mode not in ("json", "wal"):
+            raise ValueError(f"Неизвестный режим хранения: {storage_mode}")
+        self._store = self._open_store(filename, wal_compact_every)
+        self.data = LazyUsers(self._load_data(), self._on_user_loaded)
+        self._writer = BackgroundWriter(self._store)
+        self._dirty = set()
+        self._committer = GroupCommitter(self._commit, commit_interval, commit_max_pending)
+        # user_id -> версия данных, растёт при каждом изменении
+        self._versions: Dict[str, int] = {}
+        
+        # Сессии (состояние диалогов и user_data) - отдельный файл SQLite
+        # рядом с задачами (todos.json -> todos.sessions.db): в памяти их нет,
+        # каждая читается с диска по ключу
+        self._sessions = SessionStore(session_path(filename))
+        
+        # user_id -> коллекция -> id -> запись (только для разобранных пользователей)
+        self._index: Dict[str, Dict[str, Dict[int, Dict]]] = {}
+        # Записи журнала WAL уже разобраны - индексируем их сразу
+        for user_id_str, value in list(dict.items(self.data)):
+            if not isinstance(value, str):
+                self._on_user_loaded(user_id_str)
+    
+    def _open_store(self, filename: str, wal_compact_every: int):
+        if self.storage_mode == "wal":
+            return WriteAheadLog(filename, compact_every=wal_compact_every,
+                                 generations=self.snapshot_generations)
+        return JsonFileStore(filename, generations=self.snapshot_generations)
     
     def _load_data(self) -> Dict:
         """Загружает данные из файла"""
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        return self._store.load()
+    
+    def _save_data(self, user_id_str: str):
+        """Отмечает пользователя изменённым до ближайшей групповой фиксации"""
+        self._versions[user_id_str] = self._versions.get(user_id_str, 0) + 1
+        self._dirty.add(user_id_str)
+        self._committer.mark()
+    
+    def _commit(self):
+        """Передаёт изменённых пользователей в поток записи"""
+        for user_id_str in self._dirty:
+            value = self.data.get(user_id_str)
+            self._writer.submit(user_id_str, None if value is None else self._store.encode(value))
+        self._dirty.clear()
+    
+    def _on_user_loaded(self, user_id_str: str):
+        """Индексирует только что разобранного пользователя"""
+        if self._index_user(user_id_str):
+            logger.warning(f"⚠️ Исправлены повторяющиеся ID у пользователя {user_id_str}")
+            self._save_data(user_id_str)
+    
+    def _index_user(self, user_id_str: str) -> bool:
+        """Строит индекс записей пользователя; True, если ID были исправлены"""
+        user = self.data[user_id_str]
+        changed = normalize_ids(user)
+        self._index[user_id_str] = {
+            collection: {item["id"]: item for item in user.get(collection, [])}
+            for collection in COLLECTIONS
+        }
+        return changed
+    
+    def _user(self, user_id_str: str, timezone: str = "UTC") -> Dict:
+        """Возвращает данные пользователя, создавая их при первом обращении"""
+        user = self.data.get(user_id_str)
+        if user is None:
+            user = self.data[user_id_str] = {"todos": [], "timezone": timezone}
+            self._index_user(user_id_str)
+        return user
+    
+    def _user_index(self, user_id_str: str) -> Optional[Dict[str, Dict[int, Dict]]]:
+        """Индекс записей пользователя (пользователь разбирается, если ещё не был)"""
+        if self.data.get(user_id_str) is None:
+            return None
+        return self._index[user_id_str]
+    
+    def _find(self, user_id_str: str, collection: str, item_id: int) -> Optional[Dict]:
+        """Находит запись по ID за O(1)"""
+        index = self._user_index(user_id_str)
+        if index is None:
+            return None
+        return index[collection].get(item_id)
+    
+    def _append(self, user_id_str: str, collection: str, item: Dict) -> Dict:
+        """Присваивает записи следующий ID пользователя и добавляет её"""
+        user = self.data[user_id_str]
+        next_ids = user["next_ids"]
+        item["id"] = next_ids[collection]
+        next_ids[collection] += 1
+        user.setdefault(collection, []).append(item)
+        self._index[user_id_str][collection][item["id"]] = item
+        return item
+    
+    def _remove(self, user_id_str: str, collection: str, item_id: int) -> bool:
+        """Удаляет запись по ID; False, если её нет
+        
+        Позиция в списке ищется бинарным поиском, а не сравнением записей
+        по очереди. Сам del сдвигает хвост списка, но список должен
+        оставаться отсортированным по ID для get_page.
+        """
+        item = self._find(user_id_str, collection, item_id)
+        if item is None:
+            return False
+        del self._index[user_id_str][collection][item_id]
+        items = self.data[user_id_str][collection]
+        del items[_position(items, item_id) - 1]
+        return True
+    
+    def data_version(self, user_id: int) -> int:
+        """Версия данных пользователя: меняется при каждом их изменении
+        
+        Счётчик живёт только в памяти процесса и нужен для кэширования
+        отрисованных экранов.
+        """
+        return self._versions.get(str(user_id), 0)
+    
+    def get_page(self, user_id: int, collection: str, completed: Optional[bool] = None,
+                 after_id: Optional[int] = None, before_id: Optional[int] = None,
+                 limit: int = 10) -> Tuple[List[Dict], bool, bool]:
+        """Страница записей коллекции по курсору
+        
+        Записи идут по возрастанию ID: after_id - следующая страница после
+        записи, before_id - предыдущая страница перед ней, без курсора -
+        первая. completed отбирает задачи по статусу. Возвращает
+        (записи, есть_предыдущая, есть_следующая). Просматриваются только
+        записи рядом со страницей, а не весь список.
+        """
+        items = self.data.get(str(user_id), {}).get(collection, [])
+        
+        def matches(item: Dict) -> bool:
+            return completed is None or item["completed"] == completed
+        
+        def scan(start: int, step: int, count: int) -> List[Dict]:
+            found = []
+            position = start
+            while 0 <= position < len(items) and len(found) < count:
+                if matches(items[position]):
+                    found.append(items[position])
+                position += step
+            return found
+        
+        if before_id is not None:
+            start = _position(items, before_id - 1)
+            page = scan(start - 1, -1, limit + 1)
+            has_prev = len(page) > limit
+            page = page[:limit][::-1]
+            has_next = bool(scan(start, 1, 1))
+        else:
+            start = _position(items, after_id) if after_id is not None else 0
+            page = scan(start, 1, limit + 1)
+            has_next = len(page) > limit
+            page = page[:limit]
+            has_prev = bool(scan(start - 1, -1, 1))
+        return page, has_prev, has_next
+    
+    def count_items(self, user_id: int, collection: str) -> Tuple[int, int]:
+        """Сколько записей в коллекции всего и сколько из них отмечено
+        (completed для задач, active для ежедневных напоминаний)"""
+        items = self.data.get(str(user_id), {}).get(collection, [])
+        field = FLAG_FIELDS[collection]
+        return len(items), sum(1 for item in items if item[field])
+    
+    def _remove_many(self, user_id_str: str, collection: str,
+                     item_ids: Iterable[int]) -> List[int]:
+        """Удаляет несколько записей за один проход по списку; возвращает удалённые ID"""
+        index = self._user_index(user_id_str)
+        if index is None:
+            return []
+        items = index[collection]
+        removed = [item_id for item_id in dict.fromkeys(item_ids)
+                   if items.pop(item_id, None) is not None]
+        if removed:
+            user = self.data[user_id_str]
+            user[collection] = [item for item in user[collection] if item["id"] in items]
+        return removed
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Фиксирует накопленные изменения и ждёт их записи на диск"""
+        self._committer.commit_now()
+        return self._writer.flush(timeout)
+    
+    def close(self):
+        """Записывает оставшиеся изменения и завершает работу с хранилищем"""
+        self._committer.commit_now()
+        self._writer.close()
+        self._store.close()
+        self._sessions.close()
+    
+    def load_session(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """Сохранённая сессия и время её последнего обновления (unix time)"""
+        return self._sessions.load(key)
+    
+    def save_session(self, key: str, value: Dict, updated_at: float):
+        """Сохраняет сессию"""
+        self._sessions.save(key, value, updated_at)
+    
+    def delete_session(self, key: str):
+        """Удаляет сессию, если она есть"""
+        self._sessions.delete(key)
+    
+    def iter_sessions(self, prefix: str) -> Iterator[Tuple[str, Dict, float]]:
+        """Перебирает сессии с ключом, начинающимся с prefix: (ключ, значение, время)"""
+        return self._sessions.iter(prefix)
     
-    def _save_data(self):
-        """Сохраняет данные в файл"""
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+    def expire_sessions(self, before: float) -> List[str]:
+        """Удаляет сессии, не обновлявшиеся с момента before; возвращает их ключи"""
+        return self._sessions.expire(before)
     
     def add_todo(self, user_id: int, task: str, timezone: str, 
-                 reminder_time: str) -> bool:
-        """Добавляет новую задачу"""
+                 reminder_time: str, repeat_count: Optional[int] = None,
+                 repeat_interval: Optional[int] = None) -> Optional[Dict]:
+        """Добавляет новую задачу и возвращает её (None при неверном времени)
+        
+        repeat_count и repeat_interval - сколько сообщений отправить при
+        срабатывании и с каким интервалом (сек); None - по умолчанию бота.
+        """
         user_id_str = str(user_id)
-        if user_id_str not in self.data:
-            self.data[user_id_str] = {"todos": [], "timezone": timezone}
         
         # Проверяем валидность времени
         try:
             datetime.strptime(reminder_time, "%H:%M")
         except ValueError:
-            return False
+            return None
         
-        self.data[user_id_str]["timezone"] = timezone
-        self.data[user_id_str]["todos"].append({
-            "id": len(self.data[user_id_str]["todos"]),
+        todo = {
+            "id": None,
             "task": task,
             "completed": False,
             "created_at": datetime.now().isoformat(),
-            "reminder_time": reminder_time
-        })
-        self._save_data()
-        return True
+            "reminder_time": reminder_time,
+            "timezone": timezone
+        }
+        _set_repeat(todo, repeat_count, repeat_interval)
+        self._user(user_id_str, timezone)["timezone"] = timezone
+        self._append(user_id_str, "todos", todo)
+        self._save_data(user_id_str)
+        return todo
     
     def get_pending_todos(self, user_id: int) -> List[Dict]:
         """Получает незавершённые задачи"""
@@ -63,24 +380,53 @@ class TodoDatabase:
     def complete_todo(self, user_id: int, todo_id: int) -> bool:
         """Отмечает задачу как завершённую"""
         user_id_str = str(user_id)
-        if user_id_str in self.data:
-            for todo in self.data[user_id_str]["todos"]:
-                if todo["id"] == todo_id:
-                    todo["completed"] = True
-                    self._save_data()
-                    return True
-        return False
+        todo = self._find(user_id_str, "todos", todo_id)
+        if todo is None:
+            return False
+        todo["completed"] = True
+        self._save_data(user_id_str)
+        return True
     
     def delete_todo(self, user_id: int, todo_id: int) -> bool:
         """Удаляет задачу"""
         user_id_str = str(user_id)
-        if user_id_str in self.data:
-            self.data[user_id_str]["todos"] = [
-                t for t in self.data[user_id_str]["todos"] if t["id"] != todo_id
-            ]
-            self._save_data()
-            return True
-        return False
+        if not self._remove(user_id_str, "todos", todo_id):
+            return False
+        self._save_data(user_id_str)
+        return True
+    
+    def complete_todos(self, user_id: int, todo_ids: Iterable[int]) -> List[int]:
+        """Отмечает несколько задач завершёнными за одно сохранение
+        
+        Возвращает ID задач, которые действительно были завершены
+        (несуществующие и уже завершённые пропускаются).
+        """
+        user_id_str = str(user_id)
+        completed = []
+        for todo_id in dict.fromkeys(todo_ids):
+            todo = self._find(user_id_str, "todos", todo_id)
+            if todo is not None and not todo["completed"]:
+                todo["completed"] = True
+                completed.append(todo_id)
+        if completed:
+            self._save_data(user_id_str)
+        return completed
+    
+    def delete_todos(self, user_id: int, todo_ids: Iterable[int]) -> List[int]:
+        """Удаляет несколько задач за одно сохранение; возвращает удалённые ID"""
+        user_id_str = str(user_id)
+        deleted = self._remove_many(user_id_str, "todos", todo_ids)
+        if deleted:
+            self._save_data(user_id_str)
+        return deleted
+    
+    def clear_completed_todos(self, user_id: int) -> List[int]:
+        """Удаляет все завершённые задачи; возвращает их ID"""
+        user_id_str = str(user_id)
+        if user_id_str not in self.data:
+            return []
+        return self.delete_todos(user_id, [t["id"] for t in self.data[user_id_str]["todos"]
+                                           if t["completed"]])
     
     def get_user_timezone(self, user_id: int) -> str:
         """Получает часовой пояс пользователя"""
@@ -92,19 +438,14 @@ class TodoDatabase:
     def add_simple_todo(self, user_id: int, task: str) -> bool:
         """Добавляет простой todo без напоминания"""
         user_id_str = str(user_id)
-        if user_id_str not in self.data:
-            self.data[user_id_str] = {"todos": [], "timezone": "UTC", "simple_todos": []}
-        
-        if "simple_todos" not in self.data[user_id_str]:
-            self.data[user_id_str]["simple_todos"] = []
-        
-        self.data[user_id_str]["simple_todos"].append({
-            "id": len(self.data[user_id_str]["simple_todos"]),
+        self._user(user_id_str)
+        self._append(user_id_str, "simple_todos", {
+            "id": None,
             "task": task,
             "completed": False,
             "created_at": datetime.now().isoformat()
         })
-        self._save_data()
+        self._save_data(user_id_str)
         return True
     
     def get_simple_todos(self, user_id: int) -> list:
@@ -117,57 +458,46 @@ class TodoDatabase:
     def complete_simple_todo(self, user_id: int, todo_id: int) -> bool:
         """Отмечает простой todo как завершённый"""
         user_id_str = str(user_id)
-        if user_id_str in self.data and "simple_todos" in self.data[user_id_str]:
-            for todo in self.data[user_id_str]["simple_todos"]:
-                if todo["id"] == todo_id:
-                    todo["completed"] = True
-                    self._save_data()
-                    return True
-        return False
+        todo = self._find(user_id_str, "simple_todos", todo_id)
+        if todo is None:
+            return False
+        todo["completed"] = True
+        self._save_data(user_id_str)
+        return True
     
     def delete_simple_todo(self, user_id: int, todo_id: int) -> bool:
         """Удаляет простой todo"""
         user_id_str = str(user_id)
-        if user_id_str in self.data and "simple_todos" in self.data[user_id_str]:
-            self.data[user_id_str]["simple_todos"] = [
-                t for t in self.data[user_id_str]["simple_todos"] if t["id"] != todo_id
-            ]
-            self._save_data()
-            return True
-        return False
+        if not self._remove(user_id_str, "simple_todos", todo_id):
+            return False
+        self._save_data(user_id_str)
+        return True
     
     def add_everyday_reminder(self, user_id: int, task: str, timezone: str, 
-                             reminder_time: str) -> bool:
-        """Добавляет ежедневное напоминание"""
+                             reminder_time: str, repeat_count: Optional[int] = None,
+                             repeat_interval: Optional[int] = None) -> Optional[Dict]:
+        """Добавляет ежедневное напоминание и возвращает его (None при неверном времени)"""
         user_id_str = str(user_id)
-        if user_id_str not in self.data:
-            self.data[user_id_str] = {
-                "todos": [], 
-                "timezone": timezone,
-                "simple_todos": [],
-                "everyday_reminders": []
-            }
-        
-        if "everyday_reminders" not in self.data[user_id_str]:
-            self.data[user_id_str]["everyday_reminders"] = []
         
         # Проверяем валидность времени
         try:
             datetime.strptime(reminder_time, "%H:%M")
         except ValueError:
-            return False
+            return None
         
-        self.data[user_id_str]["timezone"] = timezone
-        self.data[user_id_str]["everyday_reminders"].append({
-            "id": len(self.data[user_id_str]["everyday_reminders"]),
+        reminder = {
+            "id": None,
             "task": task,
             "timezone": timezone,
             "reminder_time": reminder_time,
             "created_at": datetime.now().isoformat(),
             "active": True
-        })
-        self._save_data()
-        return True
+        }
+        _set_repeat(reminder, repeat_count, repeat_interval)
+        self._user(user_id_str, timezone)["timezone"] = timezone
+        self._append(user_id_str, "everyday_reminders", reminder)
+        self._save_data(user_id_str)
+        return reminder
     
     def get_everyday_reminders(self, user_id: int) -> List[Dict]:
         """Получает все ежедневные напоминания"""
@@ -176,24 +506,122 @@ class TodoDatabase:
             return []
         return self.data[user_id_str].get("everyday_reminders", [])
     
+    def get_everyday_reminder(self, user_id: int, reminder_id: int) -> Optional[Dict]:
+        """Получает одно ежедневное напоминание по ID"""
+        return self._find(str(user_id), "everyday_reminders", reminder_id)
+    
     def delete_everyday_reminder(self, user_id: int, reminder_id: int) -> bool:
         """Удаляет ежедневное напоминание"""
         user_id_str = str(user_id)
-        if user_id_str in self.data and "everyday_reminders" in self.data[user_id_str]:
-            self.data[user_id_str]["everyday_reminders"] = [
-                r for r in self.data[user_id_str]["everyday_reminders"] if r["id"] != reminder_id
-            ]
-            self._save_data()
-            return True
-        return False
+        if not self._remove(user_id_str, "everyday_reminders", reminder_id):
+            return False
+        self._save_data(user_id_str)
+        return True
     
     def toggle_everyday_reminder(self, user_id: int, reminder_id: int) -> bool:
         """Включает/выключает ежедневное напоминание"""
         user_id_str = str(user_id)
-        if user_id_str in self.data and "everyday_reminders" in self.data[user_id_str]:
-            for reminder in self.data[user_id_str]["everyday_reminders"]:
-                if reminder["id"] == reminder_id:
-                    reminder["active"] = not reminder["active"]
-                    self._save_data()
-                    return True
-        return False
+        reminder = self._find(user_id_str, "everyday_reminders", reminder_id)
+        if reminder is None:
+            return False
+        reminder["active"] = not reminder["active"]
+        self._save_data(user_id_str)
+        return True
+    
+    def add_items(self, user_id: int, records: List[Dict]) -> List[Tuple[str, Dict]]:
+        """Добавляет пачку записей разных типов за одно сохранение
+        
+        records - записи, проверенные bulk.validate_record. Возвращает пары
+        (тип, запись) с присвоенными ID в том же порядке.
+        """
+        user_id_str = str(user_id)
+        user = self._user(user_id_str)
+        now = datetime.now().isoformat()
+        created = []
+        for record in records:
+            kind = record["type"]
+            item = {"id": None, "task": record["task"]}
+            if kind == "everyday":
+                item.update(timezone=record["timezone"], reminder_time=record["time"],
+                            created_at=now, active=record["active"])
+            else:
+                item.update(completed=record["completed"], created_at=now)
+            if kind == "todo":
+                item.update(reminder_time=record["time"], timezone=record["timezone"])
+                # Как и add_todo: пояс последней задачи становится поясом пользователя
+                user["timezone"] = record["timezone"]
+            if kind != "simple":
+                _set_repeat(item, record["repeat_count"], record["repeat_interval"])
+            created.append((kind, self._append(user_id_str, TYPE_COLLECTIONS[kind], item)))
+        if created:
+            self._save_data(user_id_str)
+        return created
+    
+    def iter_items(self, user_id: int) -> Iterator[Tuple[str, Dict]]:
+        """Перебирает все записи пользователя как (тип, запись) - для экспорта"""
+        user = self.data.get(str(user_id), {})
+        for kind, collection in TYPE_COLLECTIONS.items():
+            for item in user.get(collection, []):
+                yield kind, item
+    
+    def iter_reminders(self) -> Iterator[Tuple]:
+        """Перебирает все напоминания, которые должны быть запланированы
+        
+        Возвращает кортежи (kind, user_id, item_id, task, reminder_time, timezone,
+        repeat_count, repeat_interval), где kind - "todo" для незавершённых задач
+        или "everyday" для активных ежедневных напоминаний.
+        
+        Ещё не разобранные пользователи разбираются временно и в памяти не
+        остаются. Напоминания пользователя собираются целиком до первого
+        yield, поэтому обход можно прерывать await-ами, пока бот меняет данные.
+        """
+        for user_id_str in list(self.data):
+            if user_id_str not in self.data:
+                continue
+            user = self.data.peek(user_id_str)
+            # У задач из старых файлов пояса нет - берём пояс пользователя
+            user_timezone = user.get("timezone", "UTC")
+            reminders = [
+                ("todo", user_id_str, todo["id"], todo["task"],
+                 todo["reminder_time"], todo.get("timezone", user_timezone),
+                 todo.get("repeat_count"), todo.get("repeat_interval"))
+                for todo in user.get("todos", []) if not todo["completed"]
+            ]
+            reminders.extend(
+                ("everyday", user_id_str, reminder["id"], reminder["task"],
+                 reminder["reminder_time"], reminder["timezone"],
+                 reminder.get("repeat_count"), reminder.get("repeat_interval"))
+                for reminder in user.get("everyday_reminders", []) if reminder["active"]
+            )
+            yield from reminders
+
+
+def _set_repeat(item: Dict, repeat_count: Optional[int], repeat_interval: Optional[int]):
+    """Сохраняет в записи настройки повторов, если они заданы"""
+    if repeat_count is not None:
+        item["repeat_count"] = repeat_count
+    if repeat_interval is not None:
+        item["repeat_interval"] = repeat_interval
+
+
+def open_database(filename: str, storage_mode: str = "json",
+                  migrate_from: Optional[str] = None,
+                  checkpoint_interval: float = 1.0, commit_interval: float = 0,
+                  commit_max_pending: int = 500, **options):
+    """Создаёт хранилище задач по имени файла и режиму хранения
+    
+    Режим "sqlite" выбирается явно или по расширению файла (.db, .sqlite).
+    Если SQLite база пуста, а migrate_from указывает на todos.json,
+    данные переносятся один раз при старте.
+    """
+    if storage_mode == "sqlite" or filename.endswith(SQLITE_SUFFIXES):
+        from sqlite_database import SQLiteTodoDatabase, migrate_json_to_sqlite
+        
+        db = SQLiteTodoDatabase(filename, checkpoint_interval=checkpoint_interval,
+                                commit_interval=commit_interval,
+                                commit_max_pending=commit_max_pending)
+        if migrate_from and migrate_json_to_sqlite(migrate_from, db):
+            logger.info(f"📦 Данные перенесены из {migrate_from} в {filename}")
+        return db
+    return TodoDatabase(filename, storage_mode, commit_interval=commit_interval,
+                        commit_max_pending=commit_max_pending, **options)
@@ -0,0 +1,308 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pytz
+
+from timezones import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderEntry:
+    """Одно ежедневное напоминание в диспетчере (только компактные поля)"""
+
+    __slots__ = ("key", "user_id", "task", "hour", "minute", "timezone",
+                 "repeat_count", "repeat_interval", "cancelled")
+
+    def __init__(self, key: str, user_id: int, task: str, hour: int, minute: int,
+                 timezone: str, repeat_count: int = 1, repeat_interval: int = 0):
+        self.key = key
+        self.user_id = user_id
+        self.task = task
+        self.hour = hour
+        self.minute = minute
+        self.timezone = timezone
+        self.repeat_count = repeat_count
+        self.repeat_interval = repeat_interval
+        self.cancelled = False
+
+
+class FollowUp:
+    """Повторное сообщение напоминания (#2, #3, ...), ожидающее отправки"""
+
+    __slots__ = ("key", "user_id", "task", "number", "total", "interval", "cancelled")
+
+    def __init__(self, key: str, user_id: int, task: str, number: int, total: int,
+                 interval: int):
+        self.key = key
+        self.user_id = user_id
+        self.task = task
+        self.number = number
+        self.total = total
+        self.interval = interval
+        self.cancelled = False
+
+
+class ReminderDispatcher:
+    """Диспетчер напоминаний на «колесе времени» с шагом в одну минуту
+
+    Напоминания раскладываются по корзинам, ключ корзины — номер UTC-минуты
+    (секунды от эпохи // 60). Номера непустых корзин лежат в куче, поэтому
+    добавление стоит O(log m), где m — число различных минут, а не число
+    напоминаний. Диспетчер просыпается раз в минуту, забирает все
+    наступившие корзины, отправляет напоминания и перекладывает каждое
+    в корзину следующего срабатывания.
+
+    Повторные сообщения одного срабатывания (FollowUp) лежат в отдельной
+    куче по времени отправки с точностью до секунды — вместо спящих
+    корутин. На каждый ключ ожидает не больше одного повтора, поэтому
+    cancel_followups отменяет оставшиеся повторы за O(1).
+
+    send(user_id, task, number, total, minute) получает UTC-минуту
+    срабатывания для первого сообщения и None для повторов: по ней
+    отправка сообщает, какие минуты разосланы целиком.
+    """
+
+    def __init__(self, send: Callable[[int, str, int, int, Optional[int]], Awaitable[None]]):
+        self._send = send
+        self._buckets: Dict[int, List[ReminderEntry]] = {}
+        self._minutes: List[int] = []
+        self._entries: Dict[str, ReminderEntry] = {}
+        # (час, минута, пояс) -> (ближайшая UTC-минута срабатывания,
+        # минута, после которой она искалась)
+        self._next_fire: Dict[Tuple[int, int, str], Tuple[int, int]] = {}
+        self._followups: List[Tuple[float, int, FollowUp]] = []
+        self._followup_by_key: Dict[str, FollowUp] = {}
+        self._followup_seq = 0
+        self._task: Optional[asyncio.Task] = None
+        # Последняя UTC-минута, напоминания которой уже переданы в send
+        self.dispatched_minute: Optional[int] = None
+        # Ключи, изменённые во время restore: их версия из базы уже устарела
+        self._touched: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: str, user_id: int, task: str, reminder_time: str,
+                 timezone: str, repeat_count: int = 1, repeat_interval: int = 0,
+                 now_minute: Optional[int] = None):
+        """Добавляет напоминание (или заменяет существующее с тем же ключом)"""
+        if self._touched is not None:
+            self._touched.add(key)
+        self._schedule(key, user_id, task, reminder_time, timezone,
+                       repeat_count, repeat_interval, now_minute)
+
+    def _schedule(self, key: str, user_id: int, task: str, reminder_time: str,
+                  timezone: str, repeat_count: int, repeat_interval: int,
+                  now_minute: Optional[int]):
+        hour, minute = map(int, reminder_time.split(':'))
+        # Проверяем пояс до изменения состояния; все записи с одним поясом
+        # хранят одну и ту же строку из реестра
+        timezone = registry.name(timezone)
+        self._cancel(key)
+        entry = ReminderEntry(key, user_id, task, hour, minute, timezone,
+                              repeat_count, repeat_interval)
+        self._entries[key] = entry
+        if now_minute is None:
+            now_minute = int(time.time() // 60)
+        self._put(entry, now_minute)
+
+    def cancel(self, key: str) -> bool:
+        """Отменяет напоминание; сама запись удаляется из корзины лениво"""
+        if self._touched is not None:
+            self._touched.add(key)
+        return self._cancel(key)
+
+    def _cancel(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry.cancelled = True
+        return True
+
+    def cancel_followups(self, key: str) -> bool:
+        """Отменяет оставшиеся повторы текущего срабатывания напоминания"""
+        followup = self._followup_by_key.pop(key, None)
+        if followup is None:
+            return False
+        followup.cancelled = True
+        return True
+
+    def rebuild(self, reminders: Iterable[Tuple[str, int, str, str, str, int, int]],
+                after_minute: Optional[int] = None) -> int:
+        """Пересоздаёт все напоминания из кортежей
+        (key, user_id, task, time, timezone, repeat_count, repeat_interval)
+
+        Каждое напоминание планируется на первое срабатывание после
+        after_minute (по умолчанию - после текущей минуты). Если передать
+        минуту в прошлом, пропущенные с тех пор срабатывания будут
+        разосланы сразу после запуска.
+        """
+        now_minute = self._reset(after_minute)
+        count = 0
+        for reminder in reminders:
+            count += self._restore_one(reminder, now_minute)
+        return count
+
+    async def restore(self, reminders: Iterable[Tuple[str, int, str, str, str, int, int]],
+                      after_minute: Optional[int] = None, batch_size: int = 1000) -> int:
+        """То же, что rebuild, но с возвратом управления в event loop
+        каждые batch_size напоминаний
+
+        Пока идёт восстановление, бот уже обрабатывает обновления. Ключи,
+        которые за это время запланированы или отменены через schedule и
+        cancel, восстановление пропускает: их состояние новее прочитанного.
+        """
+        now_minute = self._reset(after_minute)
+        self._touched = set()
+        count = 0
+        try:
+            for number, reminder in enumerate(reminders, 1):
+                if reminder[0] not in self._touched:
+                    count += self._restore_one(reminder, now_minute)
+                if number % batch_size == 0:
+                    await asyncio.sleep(0)
+        finally:
+            self._touched = None
+        return count
+
+    def _reset(self, after_minute: Optional[int]) -> int:
+        self._buckets.clear()
+        self._minutes.clear()
+        self._entries.clear()
+        self._next_fire.clear()
+        now_minute = int(time.time() // 60) if after_minute is None else after_minute
+        self.dispatched_minute = now_minute
+        return now_minute
+
+    def _restore_one(self, reminder: Tuple[str, int, str, str, str, int, int],
+                     now_minute: int) -> int:
+        key, user_id, task, reminder_time, timezone, repeat_count, repeat_interval = reminder
+        try:
+            self._schedule(key, user_id, task, reminder_time, timezone,
+                           repeat_count, repeat_interval, now_minute)
+            return 1
+        except Exception as e:
+            logger.error(f"✗ Не удалось запланировать напоминание {key}: {e}")
+            return 0
+
+    def start(self):
+        """Запускает цикл диспетчера в текущем event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает цикл диспетчера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _fire_minute(self, hour: int, minute: int, timezone: str, after_minute: int) -> int:
+        """Ближайшая UTC-минута после after_minute, когда в поясе наступит ЧЧ:ММ"""
+        cache_key = (hour, minute, timezone)
+        cached = self._next_fire.get(cache_key)
+        # Найденная минута верна для любого after_minute между минутой, от
+        # которой шёл поиск, и ею самой. Раньше этой минуты (досылка после
+        # смены экземпляра) срабатывание могло быть ещё до неё
+        if cached is not None and cached[1] <= after_minute < cached[0]:
+            return cached[0]
+
+        tz = registry.get(timezone)
+        after = datetime.fromtimestamp(after_minute * 60, pytz.utc)
+        local_date = after.astimezone(tz).date()
+        while True:
+            local = tz.localize(datetime(local_date.year, local_date.month, local_date.day,
+                                         hour, minute))
+            fire_minute = int(local.timestamp() // 60)
+            if fire_minute > after_minute:
+                break
+            local_date += timedelta(days=1)
+        self._next_fire[cache_key] = (fire_minute, after_minute)
+        return fire_minute
+
+    def _put(self, entry: ReminderEntry, after_minute: int):
+        fire_minute = self._fire_minute(entry.hour, entry.minute, entry.timezone, after_minute)
+        bucket = self._buckets.get(fire_minute)
+        if bucket is None:
+            bucket = self._buckets[fire_minute] = []
+            heapq.heappush(self._minutes, fire_minute)
+        bucket.append(entry)
+
+    def _pop_due(self, now_minute: int) -> List[Tuple[int, ReminderEntry]]:
+        """Забирает напоминания из всех наступивших корзин и планирует их заново
+
+        Возвращает пары (минута срабатывания, напоминание).
+        """
+        due = []
+        while self._minutes and self._minutes[0] <= now_minute:
+            fire_minute = heapq.heappop(self._minutes)
+            for entry in self._buckets.pop(fire_minute, ()):
+                if entry.cancelled:
+                    continue
+                due.append((fire_minute, entry))
+                self._put(entry, now_minute)
+        return due
+
+    def _push_followup(self, followup: FollowUp, due: float):
+        self._followup_seq += 1
+        heapq.heappush(self._followups, (due, self._followup_seq, followup))
+        self._followup_by_key[followup.key] = followup
+
+    async def _fire(self, entry: ReminderEntry, now: float, minute: int):
+        """Отправляет первое сообщение срабатывания и планирует повторы"""
+        # Незавершённые повторы прошлого срабатывания больше не нужны
+        self.cancel_followups(entry.key)
+        await self._send(entry.user_id, entry.task, 1, entry.repeat_count, minute)
+        if entry.repeat_count > 1:
+            self._push_followup(
+                FollowUp(entry.key, entry.user_id, entry.task, 2, entry.repeat_count,
+                         entry.repeat_interval),
+                now + entry.repeat_interval
+            )
+
+    async def _fire_followups(self, now: float):
+        """Отправляет все наступившие повторы и планирует следующие"""
+        while self._followups and self._followups[0][0] <= now:
+            _, _, followup = heapq.heappop(self._followups)
+            if followup.cancelled:
+                continue
+            self._followup_by_key.pop(followup.key, None)
+            await self._send(followup.user_id, followup.task, followup.number, followup.total,
+                             None)
+            if followup.number < followup.total:
+                self._push_followup(
+                    FollowUp(followup.key, followup.user_id, followup.task,
+                             followup.number + 1, followup.total, followup.interval),
+                    now + followup.interval
+                )
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            wake = (now // 60 + 1) * 60 + 0.01
+            if self._followups:
+                wake = min(wake, self._followups[0][0])
+            if self._minutes and self._minutes[0] <= now // 60:
+                # Пропущенные минуты (после rebuild с after_minute) - сразу
+                wake = now
+            await asyncio.sleep(max(0.0, wake - now))
+
+            now = time.time()
+            now_minute = int(now // 60)
+            due = self._pop_due(now_minute)
+            if due:
+                logger.info(f"⏰ Срабатывает напоминаний: {len(due)}")
+            for fire_minute, entry in due:
+                await self._fire(entry, now, fire_minute)
+            # Минута считается переданной, только когда переданы все её
+            # напоминания: остановка посреди цикла оставляет прежнюю минуту
+            self.dispatched_minute = now_minute
+            await self._fire_followups(now)
@@ -0,0 +1,245 @@
+"""Локальная заглушка Telegram для замера пропускной способности webhook
+
+Поднимает фальшивый Bot API (отвечает на getMe, sendMessage и т.д. без
+сети), запускает бота в режиме webhook и отправляет ему пачку
+синтетических обновлений по нескольким keep-alive соединениям.
+
+Использование: python fake_telegram.py --updates 5000 --users 500 --connections 32 --latency 0.05
+С --shards N замеряется шардированный запуск (sharding.py): фронт и N воркеров.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+from webhook import RequestError, WebhookServer, read_request, write_response
+
+BOT_TOKEN = "123456:FAKE-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+# Методы, которыми бот отвечает пользователю: по ним считаем обработанные обновления
+REPLY_METHODS = ("sendMessage", "editMessageText")
+
+
+class FakeBotAPI:
+    """Фальшивый сервер Bot API: принимает любые методы и отвечает успехом"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_id = 0
+        self._server = None
+        self.port = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    def replies(self) -> int:
+        return sum(self.calls[method] for method in REPLY_METHODS)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                _, target, headers, body = request
+                method = target.rsplit("/", 1)[-1]
+                self.calls[method] += 1
+                params = self._params(headers, body or b"")
+                if self.latency:
+                    # Время ответа настоящего Bot API
+                    await asyncio.sleep(self.latency)
+                result = {"ok": True, "result": self._result(method, params)}
+                write_response(writer, 200, body=json.dumps(result).encode())
+                await writer.drain()
+        except (ConnectionError, RequestError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _params(headers: Dict[str, str], body: bytes) -> Dict:
+        if headers.get("content-type", "").startswith("application/json"):
+            return json.loads(body or b"{}")
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    def _result(self, method: str, params: Dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", "")
+            }
+        return True
+
+
+def synthetic_updates(count: int, users: int) -> List[bytes]:
+    """Готовит обновления: чередование /start и нажатия «Активные задачи»"""
+    updates = []
+    now = int(time.time())
+    for update_id in range(count):
+        user_id = 1000 + update_id % users
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        if update_id % 2 == 0:
+            update = {"update_id": update_id, "message": {
+                "message_id": update_id, "date": now, "chat": chat, "from": user,
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+            }}
+        else:
+            update = {"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": str(user_id),
+                "data": "pending_tasks",
+                "message": {"message_id": update_id, "date": now, "chat": chat,
+                            "from": BOT_USER, "text": "menu"}
+            }}
+        updates.append(json.dumps(update).encode())
+    return updates
+
+
+async def post_updates(port: int, path: str, updates: List[bytes], connections: int):
+    """Отправляет обновления по connections keep-alive соединениям"""
+    async def worker(chunk: List[bytes]):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for body in chunk:
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+
+    await asyncio.gather(*(worker(updates[i::connections]) for i in range(connections)))
+
+
+async def run(count: int, users: int, connections: int, latency: float):
+    api = FakeBotAPI(latency)
+    await api.start()
+
+    # Бот импортируется после настройки окружения, чтобы не трогать todos.json
+    data_dir = tempfile.mkdtemp(prefix="fake-telegram-")
+    os.environ["DATABASE_FILE"] = os.path.join(data_dir, "todos.json")
+    import bot
+    # Строка лога на каждый запрос к Bot API заметно искажает замер
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    application = bot.build_application(BOT_TOKEN, base_url=api.base_url)
+    await application.initialize()
+    await application.start()
+    server = WebhookServer(application, "127.0.0.1", 0)
+    await server.start()
+
+    updates = synthetic_updates(count, users)
+    started = time.perf_counter()
+    await post_updates(server.port, server.path, updates, connections)
+    accepted = time.perf_counter() - started
+    while api.replies() < count:
+        await asyncio.sleep(0.01)
+    processed = time.perf_counter() - started
+
+    print(f"Обновлений: {count}, пользователей: {users}, соединений: {connections}, "
+          f"задержка Bot API: {latency * 1000:.0f} мс")
+    print(f"Приём webhook:  {accepted:.2f} с ({count / accepted:.0f} обновлений/с)")
+    print(f"Обработка:      {processed:.2f} с ({count / processed:.0f} обновлений/с)")
+    print(f"Вызовы Bot API: {dict(api.calls)}")
+
+    await server.stop()
+    await application.stop()
+    await application.shutdown()
+    bot.db.close()
+    await api.stop()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_sharded(count: int, users: int, connections: int, latency: float, shards: int):
+    api = FakeBotAPI(latency)
+    await api.start()
+
+    # Воркеры - отдельные процессы, настройки получают через окружение
+    data_dir = tempfile.mkdtemp(prefix="fake-telegram-")
+    port = free_port()
+    os.environ.update(DATABASE_FILE=os.path.join(data_dir, "todos.json"),
+                      TELEGRAM_BOT_TOKEN=BOT_TOKEN, WEBHOOK_HOST="127.0.0.1",
+                      WEBHOOK_PORT=str(port), WEBHOOK_URL="")
+    os.environ.pop("WEBHOOK_SECRET", None)
+    from sharding import serve_sharded
+    from config import WEBHOOK_PATH
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    stop_event = asyncio.Event()
+    front = asyncio.create_task(serve_sharded(BOT_TOKEN, shards, "webhook", api.base_url,
+                                              stop_event))
+    # getMe вызывают фронт и каждый воркер при запуске
+    while api.calls["getMe"] < shards + 1:
+        await asyncio.sleep(0.1)
+
+    updates = synthetic_updates(count, users)
+    started = time.perf_counter()
+    await post_updates(port, WEBHOOK_PATH, updates, connections)
+    accepted = time.perf_counter() - started
+    while api.replies() < count:
+        await asyncio.sleep(0.01)
+    processed = time.perf_counter() - started
+
+    print(f"Обновлений: {count}, пользователей: {users}, соединений: {connections}, "
+          f"задержка Bot API: {latency * 1000:.0f} мс, шардов: {shards}")
+    print(f"Приём webhook:  {accepted:.2f} с ({count / accepted:.0f} обновлений/с)")
+    print(f"Обработка:      {processed:.2f} с ({count / processed:.0f} обновлений/с)")
+    print(f"Вызовы Bot API: {dict(api.calls)}")
+
+    stop_event.set()
+    await front
+    await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="задержка ответа фальшивого Bot API, с")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="число процессов-воркеров (шардированный запуск)")
+    args = parser.parse_args()
+    if args.shards > 1:
+        asyncio.run(run_sharded(args.updates, args.users, args.connections, args.latency,
+                                args.shards))
+    else:
+        asyncio.run(run(args.updates, args.users, args.connections, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, MutableMapping, Optional, Set, Tuple, Union
+
+from telegram.ext import (Application, BasePersistence, ContextTypes, ConversationHandler,
+                          PersistenceInput)
+
+from updates import PerUserUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Ключ и словарь состояний ConversationHandler (как в BasePersistence)
+ConversationKey = Tuple[Union[int, str], ...]
+ConversationDict = MutableMapping[ConversationKey, object]
+
+
+class SessionPersistence(BasePersistence):
+    """Состояние диалогов и context.user_data в том же хранилище, что и задачи
+
+    Сохраняются только user_data и состояния ConversationHandler — данные
+    чатов и бота бот не использует. Хранилище - база задач (db): отдельный
+    файл сессий рядом с todos.json или таблица sessions в SQLite, поэтому
+    перезапуск не сбрасывает незаконченные диалоги.
+
+    Память ограничена:
+    - user_data не загружается при старте: данные пользователя поднимаются
+      с диска при его следующем обновлении (refresh_user_data);
+    - в памяти держится не больше max_resident пользователей; давно не
+      заходивший (LRU) сбрасывается на диск и выгружается из приложения.
+      Пользователь, чьё обновление ещё обрабатывается, не выгружается:
+      обработчик продолжает менять его context.user_data;
+    - сессии без активности дольше ttl секунд удаляются совсем — и из
+      памяти, и с диска. Проверка идёт раз в expire_interval секунд через
+      job_queue приложения: так удаляются и состояния диалогов,
+      восстановленные с диска (conversation_timeout у ConversationHandler
+      завершает только диалоги, начатые в этом процессе).
+    """
+
+    USER_PREFIX = "user:"
+    CONVERSATION_PREFIX = "conv:"
+
+    def __init__(self, db, ttl: float, max_resident: int, update_interval: float = 60,
+                 expire_interval: float = 600):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = db
+        self.ttl = ttl
+        self.max_resident = max_resident
+        self.expire_interval = expire_interval
+        self.application: Optional[Application] = None
+        # user_id -> время последнего обновления, от давних к недавним
+        self._resident: "OrderedDict[int, float]" = OrderedDict()
+        # Выгружены из памяти, но должны остаться на диске
+        self._spilled: Set[int] = set()
+        self.spilled = 0
+        self.restored = 0
+        self.expired = 0
+
+    def attach(self, application: Application):
+        """Приложение, из user_data которого выгружаются пользователи"""
+        self.application = application
+        if application.job_queue is None:
+            logger.warning("⚠️ Нет job_queue: просроченные сессии удаляются только при запуске")
+        else:
+            application.job_queue.run_repeating(self._expire_job, self.expire_interval,
+                                                name="expire-sessions")
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.USER_PREFIX}{user_id}"
+
+    def _conversation_prefix(self, name: str) -> str:
+        return f"{self.CONVERSATION_PREFIX}{name}:"
+
+    def _save_user(self, user_id: int, data: Dict, updated_at: float):
+        if data:
+            self.db.save_session(self._user_key(user_id), data, updated_at)
+        else:
+            self.db.delete_session(self._user_key(user_id))
+
+    def _in_flight(self, user_id: int) -> bool:
+        processor = self.application.update_processor
+        return isinstance(processor, PerUserUpdateProcessor) and processor.is_busy(user_id)
+
+    def _evict(self, now: float):
+        """Удаляет просроченные сессии и выгружает лишние на диск
+
+        Занятые пользователи пропускаются и выгружаются при одном из
+        следующих вызовов, когда их обновления будут обработаны.
+        """
+        excess = len(self._resident) - self.max_resident
+        expired: List[int] = []
+        spilled: List[Tuple[int, float]] = []
+        # Список от давних к недавним: просроченные идут первыми
+        for user_id, last_seen in self._resident.items():
+            is_expired = last_seen < now - self.ttl
+            if not is_expired and excess <= len(expired) + len(spilled):
+                break
+            if self._in_flight(user_id):
+                continue
+            if is_expired:
+                expired.append(user_id)
+            else:
+                spilled.append((user_id, last_seen))
+
+        for user_id in expired:
+            del self._resident[user_id]
+            # drop_user_data приложения удалит и копию на диске
+            self.application.drop_user_data(user_id)
+            self.expired += 1
+        for user_id, last_seen in spilled:
+            del self._resident[user_id]
+            self._save_user(user_id, self.application.user_data.get(user_id), last_seen)
+            self._spilled.add(user_id)
+            self.application.drop_user_data(user_id)
+            self.spilled += 1
+
+    def _conversation_states(self) -> Dict[str, ConversationDict]:
+        """Состояния диалогов постоянных ConversationHandler по имени
+
+        У PTB нет публичного способа завершить диалог извне, поэтому
+        берётся словарь состояний самого обработчика.
+        """
+        return {
+            handler.name: handler._conversations  # pylint: disable=protected-access
+            for handlers in self.application.handlers.values()
+            for handler in handlers
+            if isinstance(handler, ConversationHandler) and handler.persistent
+        }
+
+    def expire(self, now: float) -> List[str]:
+        """Удаляет просроченные сессии с диска и из памяти; возвращает ключи удалённых"""
+        self._evict(now)
+        expired = self.db.expire_sessions(now - self.ttl)
+        states = self._conversation_states() if self.application is not None else {}
+        for session_key in expired:
+            if not session_key.startswith(self.CONVERSATION_PREFIX):
+                continue
+            name, _, key = session_key[len(self.CONVERSATION_PREFIX):].partition(":")
+            conversations = states.get(name)
+            if conversations is not None:
+                conversations.pop(tuple(json.loads(key)), None)
+        if expired:
+            logger.info(f"🧹 Удалено просроченных сессий: {len(expired)}")
+        return expired
+
+    async def _expire_job(self, context: ContextTypes.DEFAULT_TYPE):
+        self.expire(time.time())
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        # Ничего не загружаем заранее, только чистим просроченное
+        self.expire(time.time())
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        prefix = self._conversation_prefix(name)
+        cutoff = time.time() - self.ttl
+        return {
+            tuple(json.loads(key[len(prefix):])): value["state"]
+            for key, value, updated_at in self.db.iter_sessions(prefix)
+            if updated_at >= cutoff
+        }
+
+    async def update_conversation(self, name: str, key: ConversationKey,
+                                  new_state: Optional[object]) -> None:
+        session_key = self._conversation_prefix(name) + json.dumps(list(key))
+        if new_state is None:
+            self.db.delete_session(session_key)
+        else:
+            self.db.save_session(session_key, {"state": new_state}, time.time())
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._save_user(user_id, data, self._resident.get(user_id, time.time()))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._spilled:
+            self._spilled.discard(user_id)
+            if user_id in self._resident:
+                # Пользователь вернулся раньше, чем приложение обработало
+                # выгрузку: сохраняем то, что у него сейчас
+                self._save_user(user_id, self.application.user_data.get(user_id),
+                                self._resident[user_id])
+            return
+        self.db.delete_session(self._user_key(user_id))
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        now = time.time()
+        if user_id not in self._resident and not user_data:
+            stored = self.db.load_session(self._user_key(user_id))
+            if stored is not None and stored[1] >= now - self.ttl:
+                user_data.update(stored[0])
+                self.restored += 1
+        self._resident[user_id] = now
+        self._resident.move_to_end(user_id)
+        self._evict(now)
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        logger.info(f"💾 Сессии: в памяти {len(self._resident)}, выгружено на диск "
+                    f"{self.spilled}, поднято с диска {self.restored}, просрочено {self.expired}")
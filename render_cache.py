@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class RenderCache:
+    """Кэш отрисованных экранов бота по пользователям
+
+    Экран (текст и клавиатура) хранится вместе с ключом: версией данных
+    пользователя и курсором страницы. Пока ключ не изменился, экран не
+    форматируется заново и хранилище не читается. Кроме того, для каждого
+    пользователя запоминается текст, показанный в последнем сообщении: если
+    в нём уже тот же экран, edit_message_text не вызывается (Telegram на
+    такой вызов отвечает ошибкой "message is not modified").
+
+    Хранится не больше max_users пользователей; давно не заходившие
+    вытесняются первыми.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        # user_id -> {"views": {view: (key, экран)}, "shown": (message_id, текст)}
+        self._users: "OrderedDict[int, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, user_id: int) -> Dict:
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = {"views": {}, "shown": None}
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: int, view: str, key: Hashable) -> Optional[Tuple[Any, ...]]:
+        """Готовый экран view, если он отрисован с тем же ключом"""
+        cached = self._entry(user_id)["views"].get(view)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        return None
+
+    def put(self, user_id: int, view: str, key: Hashable, rendered: Tuple[Any, ...]):
+        """Запоминает экран view, отрисованный с ключом key"""
+        self._entry(user_id)["views"][view] = (key, rendered)
+
+    def is_shown(self, user_id: int, message_id: Optional[int], text: str) -> bool:
+        """Показан ли уже text в сообщении message_id"""
+        if message_id is None:
+            return False
+        return self._entry(user_id)["shown"] == (message_id, text)
+
+    def set_shown(self, user_id: int, message_id: Optional[int], text: str):
+        """Запоминает, что в сообщении message_id показан text"""
+        self._entry(user_id)["shown"] = None if message_id is None else (message_id, text)
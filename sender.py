@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель скорости «ведро токенов»"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (например, после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ждёт и забирает один токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ReminderSender:
+    """Очередь отправки сообщений с пулом воркеров
+
+    Сообщения копятся в очередях своих чатов, а workers воркеров разбирают
+    общую очередь чатов, готовых к отправке. Общая скорость ограничена
+    ведром токенов (лимит Telegram — около 30 сообщений в секунду), а
+    сообщения в один чат отправляются не чаще раза в per_chat_interval
+    секунд: пока слот чата не наступил, чат ждёт по таймеру, не занимая
+    воркер. На RetryAfter вся отправка ставится на паузу, а сообщение
+    возвращается в начало очереди своего чата.
+
+    Сообщение может нести минуту срабатывания напоминания. Пока сообщения
+    минуты не отправлены (или не отброшены как недоставляемые), она не
+    считается разосланной: completed_minute передаётся резерву при смене
+    экземпляра, и тот досылает всё, что осталось в очереди.
+    """
+
+    def __init__(self, send_message: Callable[[int, str], Awaitable], workers: int = 8,
+                 rate: float = 30, per_chat_interval: float = 1.0, max_retries: int = 3,
+                 stats_interval: float = 60):
+        self._send_message = send_message
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.stats_interval = stats_interval
+        self._bucket = TokenBucket(rate)
+        # Чаты, чей слот наступил; каждый чат стоит здесь не больше одного раза
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        # Очереди сообщений чатов: чат есть здесь, пока он в _ready, ждёт
+        # таймера в _timers или его сообщение забрал воркер
+        self._chats: Dict[int, Deque[Tuple]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._chat_next: Dict[int, float] = {}
+        self._waiting = 0
+        # Сообщения, которые ещё не отправлены и не отброшены
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Минута срабатывания -> сколько её сообщений ещё не отправлено
+        self._pending: Dict[int, int] = {}
+        # Читается из потока отметки о владении, поэтому хранится готовым
+        self._oldest_pending: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {"sent": 0, "failed": 0, "retried": 0, "lag_total": 0.0, "lag_max": 0.0}
+
+    def send(self, chat_id: int, text: str, minute: Optional[int] = None):
+        """Ставит сообщение в очередь отправки (не блокирует)
+
+        minute - UTC-минута срабатывания, к которой относится сообщение.
+        """
+        if minute is not None:
+            self._pending[minute] = self._pending.get(minute, 0) + 1
+            self._update_oldest()
+        self._unfinished += 1
+        self._idle.clear()
+        self._enqueue((chat_id, text, time.monotonic(), 0, minute))
+
+    def completed_minute(self, dispatched_minute: Optional[int]) -> Optional[int]:
+        """Последняя минута не позже dispatched_minute, все сообщения которой ушли"""
+        oldest = self._oldest_pending
+        if dispatched_minute is None or oldest is None:
+            return dispatched_minute
+        return min(dispatched_minute, oldest - 1)
+
+    def _update_oldest(self):
+        self._oldest_pending = min(self._pending) if self._pending else None
+
+    def _done(self, minute: Optional[int]):
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.set()
+        if minute is None:
+            return
+        self._pending[minute] -= 1
+        if not self._pending[minute]:
+            del self._pending[minute]
+            self._update_oldest()
+
+    def _enqueue(self, item: Tuple, first: bool = False):
+        """Кладёт сообщение в очередь его чата (first - в начало, для повтора)"""
+        chat_id = item[0]
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+            self._schedule(chat_id)
+        if first:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+        self._waiting += 1
+
+    def _schedule(self, chat_id: int):
+        """Ставит чат в очередь готовых сразу или по таймеру к его слоту"""
+        delay = self._chat_next.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(
+                delay, self._wake, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    def _wake(self, chat_id: int):
+        del self._timers[chat_id]
+        self._ready.put_nowait(chat_id)
+
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def stats(self) -> Dict:
+        """Текущие метрики: глубина очереди, число отправок и задержка отправки"""
+        sent = self._stats["sent"]
+        return {
+            "queue_depth": self._waiting,
+            "sent": sent,
+            "failed": self._stats["failed"],
+            "retried": self._stats["retried"],
+            "lag_avg": self._stats["lag_total"] / sent if sent else 0.0,
+            "lag_max": self._stats["lag_max"]
+        }
+
+    def start(self):
+        """Запускает воркеры в текущем event loop"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._report()))
+
+    async def stop(self, drain_timeout: float = 0):
+        """Останавливает воркеры, сначала до drain_timeout секунд дописывая очередь
+
+        Оставшиеся сообщения не отправляются; их минуты не попадают в
+        completed_minute.
+        """
+        if drain_timeout > 0 and self._tasks:
+            try:
+                await asyncio.wait_for(self._idle.wait(), drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        if self._unfinished:
+            logger.warning(f"⚠️ Не отправлено сообщений при остановке: {self._unfinished}")
+
+    def _take(self, chat_id: int) -> Tuple:
+        """Забирает первое сообщение чата и резервирует следующий слот чата"""
+        queue = self._chats[chat_id]
+        item = queue.popleft()
+        self._waiting -= 1
+        self._chat_next[chat_id] = time.monotonic() + self.per_chat_interval
+        if queue:
+            self._schedule(chat_id)
+        else:
+            del self._chats[chat_id]
+        return item
+
+    async def _worker(self):
+        while True:
+            chat_id, text, enqueued, attempt, minute = self._take(await self._ready.get())
+            done = True
+            try:
+                await self._bucket.acquire()
+                await self._send_message(chat_id, text)
+            except RetryAfter as e:
+                logger.warning(f"⚠️ Telegram просит подождать {e.retry_after} с")
+                self._bucket.pause(e.retry_after)
+                done = not self._retry(chat_id, text, enqueued, attempt, minute)
+            except (Forbidden, BadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — повтор не поможет
+                self._stats["failed"] += 1
+                logger.error(f"✗ Сообщение для {chat_id} не отправлено: {e}")
+            except NetworkError as e:
+                done = not self._retry(chat_id, text, enqueued, attempt, minute)
+                logger.warning(f"⚠️ Сетевая ошибка при отправке {chat_id}: {e}")
+            except asyncio.CancelledError:
+                # Остановка посреди отправки: сообщение остаётся неотправленным
+                done = False
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"✗ Ошибка при отправке напоминания: {e}")
+            else:
+                lag = time.monotonic() - enqueued
+                self._stats["sent"] += 1
+                self._stats["lag_total"] += lag
+                self._stats["lag_max"] = max(self._stats["lag_max"], lag)
+            finally:
+                if done:
+                    self._done(minute)
+
+    def _retry(self, chat_id: int, text: str, enqueued: float, attempt: int,
+               minute: Optional[int]) -> bool:
+        """Возвращает сообщение в начало очереди чата; False, если попытки кончились"""
+        if attempt >= self.max_retries:
+            self._stats["failed"] += 1
+            logger.error(f"✗ Сообщение для {chat_id} не отправлено после {attempt + 1} попыток")
+            return False
+        self._stats["retried"] += 1
+        self._enqueue((chat_id, text, enqueued, attempt + 1, minute), first=True)
+        return True
+
+    async def _report(self):
+        """Периодически пишет метрики в лог и чистит устаревшие слоты чатов"""
+        last_sent = 0
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            now = time.monotonic()
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+            stats = self.stats()
+            if stats["sent"] != last_sent or stats["queue_depth"]:
+                last_sent = stats["sent"]
+                logger.info(
+                    f"📊 Отправка: в очереди {stats['queue_depth']}, отправлено {stats['sent']}, "
+                    f"ошибок {stats['failed']}, повторов {stats['retried']}, "
+                    f"задержка ср. {stats['lag_avg']:.2f} с / макс. {stats['lag_max']:.2f} с"
+                )
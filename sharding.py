@@ -0,0 +1,514 @@
+"""Шардированный запуск бота на нескольких ядрах
+
+Пользователи распределяются по хешу user_id между SHARD_COUNT
+процессами-воркерами. Каждый воркер - обычный bot.py в режиме webhook на
+127.0.0.1: у него свой файл данных (todos.shard0.json, ...), свои сессии и
+свой диспетчер напоминаний только для своих пользователей. Тонкий
+фронт-процесс (этот модуль) получает обновления из Telegram (polling или
+webhook), определяет user_id и пересылает обновление нужному воркеру;
+упавший воркер перезапускается.
+
+Использование: python sharding.py [--shards 4]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import sqlite3
+import sys
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from telegram import Bot
+
+import config
+from coordination import StoreLease
+from database import SQLITE_SUFFIXES
+from sqlite_database import SQLiteTodoDatabase
+from storage import JsonFileStore, WriteAheadLog, snapshot_body, write_snapshot
+from updates import allowed_update_types
+from webhook import WebhookServer, read_response
+
+logger = logging.getLogger(__name__)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    """Номер шарда пользователя (одинаковый во всех процессах и запусках)"""
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def shard_path(filename: str, index: int, shards: int) -> str:
+    """Файл данных шарда: todos.json -> todos.shard2.json (без шардов - как есть)"""
+    if shards <= 1:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return f"{root}.shard{index}{ext}"
+
+
+def current_shard() -> Tuple[int, int]:
+    """(номер шарда, число шардов) текущего процесса; одиночный бот - (0, 1)
+
+    Воркерам номер и число шардов передаёт фронт через SHARD_INDEX и
+    SHARD_COUNT.
+    """
+    if "SHARD_INDEX" not in os.environ:
+        return 0, 1
+    return int(os.environ["SHARD_INDEX"]), int(os.environ["SHARD_COUNT"])
+
+
+def update_user_id(update: Dict) -> Optional[int]:
+    """user_id из обновления в виде JSON (для постов каналов - id чата)"""
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+            chat = value.get("chat")
+            if chat:
+                return chat["id"]
+    return None
+
+
+def _layout_path(filename: str) -> str:
+    return filename + ".shards"
+
+
+def check_shard_layout(filename: str, shards: int):
+    """Проверяет, что данные разложены под shards шардов
+
+    Число шардов записывается рядом с файлом данных (todos.json.shards)
+    при первом шардированном запуске. С другим числом (в том числе
+    одиночным bot.py) пользователи попали бы в файлы без их данных, поэтому
+    запуск отказывается стартовать с ValueError. Если записи нет, данные
+    ещё не шардировались.
+    """
+    try:
+        with open(_layout_path(filename), encoding="utf-8") as f:
+            recorded = json.load(f)["shards"]
+    except FileNotFoundError:
+        return
+    if recorded != shards:
+        raise ValueError(
+            f"Данные {filename} разложены по {recorded} шардам, а запуск - с {shards}. "
+            f"Запусти с прежним числом шардов (--shards / SHARD_COUNT)"
+        )
+
+
+def record_shard_layout(filename: str, shards: int):
+    """Записывает число шардов, под которое разложены данные"""
+    path = _layout_path(filename)
+    if os.path.exists(path):
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"shards": shards}, f)
+    os.replace(tmp_path, path)
+
+
+def _store_exists(filename: str) -> bool:
+    # В режиме WAL данные могут быть пока только в журнале
+    return os.path.exists(filename) or os.path.exists(filename + ".wal")
+
+
+def split_store(filename: str, storage_mode: str, shards: int) -> int:
+    """Однократно раскладывает данные одиночного бота по файлам шардов
+
+    Выполняется, только если ни одного файла шардов ещё нет; исходный файл
+    не трогается и остаётся резервной копией. Возвращает число
+    перенесённых пользователей.
+    """
+    targets = [shard_path(filename, index, shards) for index in range(shards)]
+    if any(_store_exists(target) for target in targets) or not _store_exists(filename):
+        return 0
+    store_class = WriteAheadLog if storage_mode == "wal" else JsonFileStore
+    source = store_class(filename)
+    data = source.load()
+    source.close()
+
+    parts: List[Dict[str, str]] = [{} for _ in range(shards)]
+    for user_id_str, value in data.items():
+        # Строки пользователей из снапшота переносятся как есть, без разбора
+        parts[shard_for(int(user_id_str), shards)][user_id_str] = (
+            value if isinstance(value, str) else JsonFileStore.encode(value)
+        )
+    # Шард получает готовый снапшот - и в режиме json, и в режиме wal (там
+    # это снапшот под пустым журналом): строки снапшота многострочные и в
+    # журнал, где запись - одна строка, их писать нельзя
+    for target_path, part in zip(targets, parts):
+        write_snapshot(target_path, snapshot_body(part.items()))
+    return len(data)
+
+
+# Таблицы SQLite с данными пользователей; сессии не переносятся
+SQLITE_USER_TABLES = ("users", "todos", "simple_todos", "everyday_reminders", "id_counters")
+
+
+def split_sqlite(filename: str, shards: int) -> int:
+    """Однократно раскладывает базу SQLite одиночного бота по базам шардов
+
+    Как и split_store: только если ни одной базы шардов ещё нет, исходная
+    база не трогается. Возвращает число перенесённых пользователей.
+    """
+    targets = [shard_path(filename, index, shards) for index in range(shards)]
+    if any(os.path.exists(target) for target in targets) or not os.path.exists(filename):
+        return 0
+    source = SQLiteTodoDatabase(filename)
+    empty = source.is_empty()
+    source.close()
+    if empty:
+        return 0
+    for target in targets:
+        # Пустая база шарда с актуальной схемой
+        SQLiteTodoDatabase(target).close()
+
+    conn = sqlite3.connect(filename, isolation_level=None)
+    conn.create_function("shard_for", 1, lambda user_id: shard_for(int(user_id), shards),
+                         deterministic=True)
+    try:
+        for index, target in enumerate(targets):
+            conn.execute("ATTACH DATABASE ? AS shard", (target,))
+            conn.execute("BEGIN")
+            for table in SQLITE_USER_TABLES:
+                columns = ", ".join(row[1] for row in
+                                    conn.execute(f"PRAGMA main.table_info({table})"))
+                conn.execute(f"INSERT INTO shard.{table} ({columns}) SELECT {columns} "
+                             f"FROM main.{table} WHERE shard_for(user_id) = ?", (index,))
+            conn.execute("COMMIT")
+            conn.execute("DETACH DATABASE shard")
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class ShardWorker:
+    """Процесс-воркер одного шарда и соединение фронта с ним
+
+    Обновления пересылаются по одному keep-alive соединению строго по
+    очереди, поэтому обновления одного пользователя приходят воркеру в
+    исходном порядке. Пока воркер недоступен (запускается или
+    перезапускается), пересылка повторяется, а отправитель ждёт.
+    """
+
+    def __init__(self, index: int, shards: int, port: int, path: str, secret: str,
+                 env: Dict[str, str], restart_delay: float = 1.0):
+        self.index = index
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.env = dict(env, SHARD_INDEX=str(index), SHARD_COUNT=str(shards),
+                        UPDATE_MODE="webhook", WEBHOOK_HOST="127.0.0.1",
+                        WEBHOOK_PORT=str(port), WEBHOOK_SECRET=secret,
+                        # Адрес webhook в Telegram регистрирует фронт, не воркер
+                        WEBHOOK_URL="")
+        self.restart_delay = restart_delay
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.forwarded = 0
+        self.restarts = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        await self._spawn()
+        self._tasks = [asyncio.create_task(self._supervise()),
+                       asyncio.create_task(self._forward_loop())]
+
+    async def stop(self, timeout: float = 30):
+        """Дожидается пересылки очереди и останавливает процесс"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Шард {self.index}: не переслано обновлений: {self._queue.qsize()}")
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._disconnect()
+        if self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Шард {self.index} не завершился за {timeout} с, убиваю")
+                self.process.kill()
+                await self.process.wait()
+
+    async def forward(self, body: bytes) -> int:
+        """Пересылает обновление воркеру; возвращает HTTP-статус его ответа"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((body, future))
+        return await future
+
+    async def _spawn(self):
+        # Своя сессия: Ctrl+C в терминале получает только фронт, а воркеры
+        # он останавливает сам, дослав им очередь
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=self.env, start_new_session=True
+        )
+        logger.info(f"🧩 Шард {self.index} запущен (pid {self.process.pid}, порт {self.port})")
+
+    async def _supervise(self):
+        """Перезапускает воркер, если он завершился сам"""
+        while True:
+            code = await self.process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logger.error(f"✗ Шард {self.index} завершился с кодом {code}, "
+                         f"перезапуск через {self.restart_delay} с")
+            await asyncio.sleep(self.restart_delay)
+            await self._spawn()
+
+    async def _forward_loop(self):
+        while True:
+            body, future = await self._queue.get()
+            while True:
+                try:
+                    status = await self._post(body)
+                    break
+                except (OSError, asyncio.IncompleteReadError):
+                    # Воркер ещё не слушает порт или перезапускается
+                    self._disconnect()
+                    await asyncio.sleep(0.1)
+            self.forwarded += 1
+            if not future.done():
+                future.set_result(status)
+            self._queue.task_done()
+
+    async def _post(self, body: bytes) -> int:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self._writer.write(
+            f"POST {self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            f"Content-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {self.secret}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await self._writer.drain()
+        status, _ = await read_response(self._reader)
+        return status
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class ShardRouter:
+    """Выбирает воркер по user_id обновления и пересылает ему обновление"""
+
+    def __init__(self, workers: List[ShardWorker]):
+        self.workers = workers
+
+    async def route(self, body: bytes) -> int:
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"⚠️ Некорректное обновление: {e}")
+            return 400
+        # Обновления без пользователя получает первый шард
+        index = 0 if user_id is None else shard_for(user_id, len(self.workers))
+        return await self.workers[index].forward(body)
+
+
+class RouterServer(WebhookServer):
+    """Webhook фронта: вместо очереди приложения отдаёт обновления роутеру"""
+
+    def __init__(self, router: ShardRouter, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.router = router
+
+    async def _dispatch(self, body: bytes) -> int:
+        return await self.router.route(body)
+
+
+async def poll_updates(bot: Bot, router: ShardRouter, stop_event: asyncio.Event,
+                       timeout: int = 10, allowed_updates: Optional[List[str]] = None,
+                       max_attempts: int = 3):
+    """Получает обновления через getUpdates и раздаёт их воркерам
+
+    Telegram подтверждается (offset) только до первого обновления, которое
+    шард не принял: оно приходит в следующем getUpdates снова и
+    пересылается ещё раз, но не больше max_attempts раз - потом
+    пропускается с ошибкой в логе. Принятые обновления после него повторно
+    не пересылаются.
+    """
+    offset = None
+    # Принятые шардами, но ещё не подтверждённые обновления
+    accepted: Set[int] = set()
+    attempts: Dict[int, int] = {}
+    while not stop_event.is_set():
+        fetch = asyncio.create_task(bot.get_updates(offset=offset, timeout=timeout,
+                                                    read_timeout=timeout + 5,
+                                                    allowed_updates=allowed_updates))
+        stop = asyncio.create_task(stop_event.wait())
+        await asyncio.wait((fetch, stop), return_when=asyncio.FIRST_COMPLETED)
+        if not fetch.done():
+            fetch.cancel()
+            break
+        stop.cancel()
+        try:
+            updates = fetch.result()
+        except Exception as e:
+            logger.error(f"✗ Ошибка getUpdates: {e}")
+            await asyncio.sleep(1)
+            continue
+        pending = [update for update in updates if update.update_id not in accepted]
+        # Пересылки запускаются по порядку, поэтому очереди воркеров
+        # получают обновления в порядке Telegram
+        statuses = await asyncio.gather(*(router.route(json.dumps(update.to_dict()).encode())
+                                          for update in pending))
+        rejected = False
+        for update, status in zip(pending, statuses):
+            update_id = update.update_id
+            if status == 200:
+                accepted.add(update_id)
+                continue
+            attempts[update_id] = attempts.get(update_id, 0) + 1
+            if attempts[update_id] >= max_attempts:
+                logger.error(f"✗ Шард не принял обновление {update_id} (HTTP {status}) "
+                             f"за {max_attempts} попыток, пропускаю")
+                accepted.add(update_id)
+            else:
+                logger.warning(f"⚠️ Шард не принял обновление {update_id} (HTTP {status}), "
+                               f"повторю")
+                rejected = True
+        for update in updates:
+            if update.update_id not in accepted:
+                break
+            offset = update.update_id + 1
+        if offset is not None:
+            accepted = {update_id for update_id in accepted if update_id >= offset}
+            attempts = {update_id: n for update_id, n in attempts.items() if update_id >= offset}
+        if rejected:
+            await asyncio.sleep(1)
+    if offset is not None:
+        # Подтверждаем Telegram последние пересланные обновления
+        await bot.get_updates(offset=offset, timeout=0, limit=1)
+
+
+def bot_allowed_updates() -> List[str]:
+    """Типы обновлений, которые нужны обработчикам бота (как у одиночного bot.py)"""
+    # bot импортирует этот модуль, поэтому импорт - здесь
+    from bot import create_handlers
+    return allowed_update_types({0: create_handlers()})
+
+
+async def serve_sharded(token: str, shards: int, update_mode: str = "polling",
+                        base_url: Optional[str] = None,
+                        stop_event: Optional[asyncio.Event] = None,
+                        allowed_updates: Optional[List[str]] = None) -> List[ShardWorker]:
+    """Запускает воркеры и фронт до сигнала остановки
+
+    allowed_updates по умолчанию выводятся из обработчиков бота: Telegram не
+    присылает фронту обновления, которые воркеры всё равно отбросили бы.
+    """
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+    database_file = os.getenv("DATABASE_FILE", config.DATABASE_FILE)
+    storage_mode = os.getenv("STORAGE_MODE", config.STORAGE_MODE)
+    check_shard_layout(database_file, shards)
+    if storage_mode == "sqlite" or database_file.endswith(SQLITE_SUFFIXES):
+        moved = split_sqlite(database_file, shards)
+        if not moved and not any(os.path.exists(shard_path(database_file, index, shards))
+                                 for index in range(shards)):
+            # Базы ещё нет: SQLite-воркер сам переносит в свою базу свою
+            # часть todos.json
+            moved = split_store(config.JSON_MIGRATION_SOURCE, "json", shards)
+    else:
+        moved = split_store(database_file, storage_mode, shards)
+    if moved:
+        logger.info(f"📦 Пользователи ({moved}) разложены по {shards} шардам")
+    record_shard_layout(database_file, shards)
+
+    if allowed_updates is None:
+        allowed_updates = bot_allowed_updates()
+    logger.info(f"📨 Принимаемые типы обновлений: {', '.join(allowed_updates)}")
+
+    # Воркеры принимают обновления только от фронта
+    secret = secrets.token_hex(16)
+    env = dict(os.environ)
+    if base_url:
+        env["TELEGRAM_BASE_URL"] = base_url
+    workers = [
+        ShardWorker(index, shards, config.SHARD_BASE_PORT + index, config.WEBHOOK_PATH,
+                    secret, env, config.SHARD_RESTART_DELAY)
+        for index in range(shards)
+    ]
+    for worker in workers:
+        await worker.start()
+    router = ShardRouter(workers)
+
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    server = None
+    try:
+        async with bot:
+            if update_mode == "webhook":
+                webhook_secret = os.getenv("WEBHOOK_SECRET")
+                server = RouterServer(
+                    router, os.getenv("WEBHOOK_HOST", config.WEBHOOK_HOST),
+                    int(os.getenv("WEBHOOK_PORT", config.WEBHOOK_PORT)),
+                    config.WEBHOOK_PATH, webhook_secret, config.WEBHOOK_MAX_CONCURRENCY
+                )
+                await server.start()
+                webhook_url = os.getenv("WEBHOOK_URL")
+                if webhook_url:
+                    await bot.set_webhook(webhook_url + config.WEBHOOK_PATH,
+                                          secret_token=webhook_secret,
+                                          max_connections=min(config.WEBHOOK_MAX_CONCURRENCY, 100),
+                                          allowed_updates=allowed_updates)
+                await stop_event.wait()
+            else:
+                await poll_updates(bot, router, stop_event, config.SHARD_POLL_TIMEOUT,
+                                   allowed_updates, config.SHARD_FORWARD_ATTEMPTS)
+    finally:
+        if server is not None:
+            await server.stop()
+        await asyncio.gather(*(worker.stop() for worker in workers))
+        logger.info(f"🧩 Переслано обновлений по шардам: {[w.forwarded for w in workers]}")
+    return workers
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int,
+                        default=int(os.getenv("SHARD_COUNT", config.SHARD_COUNT)))
+    args = parser.parse_args()
+
+    # Второй фронт на тех же данных (или одиночный bot.py) ждёт в резерве,
+    # пока работает первый: getUpdates в Telegram может вызывать только один
+    database_file = os.getenv("DATABASE_FILE", config.DATABASE_FILE)
+    lease = StoreLease(database_file + ".lock", config.LEADER_HEARTBEAT_INTERVAL,
+                       config.LEADER_POLL_INTERVAL)
+    if not lease.acquire(blocking=False):
+        logger.info(f"⏸️ Файлом {database_file} владеет другой экземпляр, жду в резерве")
+        lease.acquire()
+    try:
+        asyncio.run(serve_sharded(os.getenv("TELEGRAM_BOT_TOKEN"), args.shards,
+                                  os.getenv("UPDATE_MODE", config.UPDATE_MODE)))
+    finally:
+        lease.release()
+
+
+if __name__ == "__main__":
+    main()
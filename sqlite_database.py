@@ -0,0 +1,684 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import FLAG_FIELDS, TYPE_COLLECTIONS, normalize_ids
+from storage import GroupCommitter, read_snapshot
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    timezone TEXT NOT NULL DEFAULT 'UTC'
+);
+CREATE TABLE IF NOT EXISTS todos (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    task TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    reminder_time TEXT NOT NULL,
+    timezone TEXT NOT NULL,
+    repeat_count INTEGER,
+    repeat_interval INTEGER,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_todos_user_completed ON todos (user_id, completed);
+CREATE INDEX IF NOT EXISTS idx_todos_reminder ON todos (reminder_time, timezone);
+CREATE TABLE IF NOT EXISTS simple_todos (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    task TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE TABLE IF NOT EXISTS everyday_reminders (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    task TEXT NOT NULL,
+    timezone TEXT NOT NULL,
+    reminder_time TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    repeat_count INTEGER,
+    repeat_interval INTEGER,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_everyday_reminder ON everyday_reminders (reminder_time, timezone);
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS id_counters (
+    user_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    next_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, collection)
+);
+"""
+
+class SQLiteTodoDatabase:
+    """Хранилище задач на SQLite с тем же API, что и TodoDatabase
+
+    Данные не держатся в памяти целиком: каждый запрос идёт по индексу
+    (user_id, ...), поэтому память и время поиска не зависят от числа
+    пользователей.
+
+    В режиме WAL с synchronous=NORMAL коммит только дописывает страницы в
+    журнал без fsync. Синхронизацию с диском (checkpoint) выполняет фоновый
+    поток раз в checkpoint_interval секунд, поэтому обработчики бота не ждут
+    диск, а задержка сброса на диск ограничена этим интервалом.
+
+    Мутации выполняются внутри общей транзакции (каждая под своим SAVEPOINT),
+    которая фиксируется группой раз в commit_interval секунд или после
+    commit_max_pending мутаций.
+    """
+
+    def __init__(self, filename: str = "todos.db", checkpoint_interval: float = 1.0,
+                 commit_interval: float = 0, commit_max_pending: int = 500):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA wal_autocheckpoint=0")
+        self.conn.executescript(SCHEMA)
+        self._committer = GroupCommitter(self._commit, commit_interval, commit_max_pending)
+        # user_id -> версия данных, растёт при каждом изменении
+        self._versions: Dict[str, int] = {}
+
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checkpointer = threading.Thread(
+            target=self._run_checkpointer, name="sqlite-checkpointer", daemon=True
+        )
+        self._checkpointer.start()
+
+    def _run_checkpointer(self):
+        conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._checkpoint_conn = conn
+        while not self._stop.wait(self.checkpoint_interval):
+            self._checkpoint()
+        self._checkpoint()
+        conn.close()
+
+    def _checkpoint(self):
+        with self._checkpoint_lock:
+            try:
+                self._checkpoint_conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except sqlite3.Error as e:
+                logger.error(f"✗ Ошибка при сбросе журнала SQLite: {e}")
+
+    @contextmanager
+    def _transaction(self, user_id_str: Optional[str] = None):
+        """Выполняет одну мутацию внутри текущей групповой транзакции
+
+        user_id_str - чьи данные меняются: его версия данных увеличивается.
+        """
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.execute("SAVEPOINT mutation")
+        try:
+            yield
+        except Exception:
+            self.conn.execute("ROLLBACK TO mutation")
+            self.conn.execute("RELEASE mutation")
+            raise
+        self.conn.execute("RELEASE mutation")
+        if user_id_str is not None:
+            self._versions[user_id_str] = self._versions.get(user_id_str, 0) + 1
+        self._committer.mark()
+
+    def _commit(self):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Фиксирует накопленные изменения и сбрасывает журнал SQLite на диск"""
+        self._committer.commit_now()
+        if not self._checkpoint_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        try:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            self._checkpoint_lock.release()
+        return True
+
+    def close(self):
+        """Фиксирует изменения, останавливает фоновый сброс и закрывает базу"""
+        self._committer.commit_now()
+        self._stop.set()
+        self._checkpointer.join()
+        self.conn.close()
+
+    def load_session(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """Сохранённая сессия и время её последнего обновления (unix time)"""
+        row = self.conn.execute(
+            "SELECT value, updated_at FROM sessions WHERE key = ?", (key,)
+        ).fetchone()
+        return (json.loads(row["value"]), row["updated_at"]) if row else None
+
+    def save_session(self, key: str, value: Dict, updated_at: float):
+        """Сохраняет сессию"""
+        with self._transaction():
+            self.conn.execute(
+                "INSERT INTO sessions (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "updated_at = excluded.updated_at",
+                (key, json.dumps(value, ensure_ascii=False), updated_at)
+            )
+
+    def delete_session(self, key: str):
+        """Удаляет сессию, если она есть"""
+        with self._transaction():
+            self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def iter_sessions(self, prefix: str) -> Iterator[Tuple[str, Dict, float]]:
+        """Перебирает сессии с ключом, начинающимся с prefix: (ключ, значение, время)"""
+        # Диапазон по первичному ключу вместо LIKE: prefix может содержать % и _
+        rows = self.conn.execute(
+            "SELECT key, value, updated_at FROM sessions WHERE key >= ? AND key < ?",
+            (prefix, prefix + "\uffff")
+        ).fetchall()
+        for row in rows:
+            yield row["key"], json.loads(row["value"]), row["updated_at"]
+
+    def expire_sessions(self, before: float) -> List[str]:
+        """Удаляет сессии, не обновлявшиеся с момента before; возвращает их ключи"""
+        with self._transaction():
+            keys = [row["key"] for row in self.conn.execute(
+                "SELECT key FROM sessions WHERE updated_at < ?", (before,)
+            )]
+            self.conn.execute("DELETE FROM sessions WHERE updated_at < ?", (before,))
+        return keys
+
+    def is_empty(self) -> bool:
+        """Проверяет, есть ли в базе хотя бы один пользователь"""
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def _set_timezone(self, user_id_str: str, timezone: str):
+        self.conn.execute(
+            "INSERT INTO users (user_id, timezone) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET timezone = excluded.timezone",
+            (user_id_str, timezone)
+        )
+
+    def _ensure_user(self, user_id_str: str):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id_str,)
+        )
+
+    def _next_id(self, table: str, user_id_str: str) -> int:
+        """Выдаёт следующий ID из счётчика пользователя (ID не переиспользуются)"""
+        row = self.conn.execute(
+            "SELECT next_id FROM id_counters WHERE user_id = ? AND collection = ?",
+            (user_id_str, table)
+        ).fetchone()
+        # Счётчика ещё нет - у пользователя не было записей в этой коллекции
+        next_id = row[0] if row is not None else 0
+        self.conn.execute(
+            "INSERT INTO id_counters (user_id, collection, next_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id, collection) DO UPDATE SET next_id = excluded.next_id",
+            (user_id_str, table, next_id + 1)
+        )
+        return next_id
+
+    @staticmethod
+    def _with_repeat(item: Dict, row) -> Dict:
+        if row["repeat_count"] is not None:
+            item["repeat_count"] = row["repeat_count"]
+        if row["repeat_interval"] is not None:
+            item["repeat_interval"] = row["repeat_interval"]
+        return item
+
+    @classmethod
+    def _todo(cls, row) -> Dict:
+        return cls._with_repeat({
+            "id": row["id"],
+            "task": row["task"],
+            "completed": bool(row["completed"]),
+            "created_at": row["created_at"],
+            "reminder_time": row["reminder_time"]
+        }, row)
+
+    @staticmethod
+    def _simple_todo(row) -> Dict:
+        return {
+            "id": row["id"],
+            "task": row["task"],
+            "completed": bool(row["completed"]),
+            "created_at": row["created_at"]
+        }
+
+    @classmethod
+    def _everyday_reminder(cls, row) -> Dict:
+        return cls._with_repeat({
+            "id": row["id"],
+            "task": row["task"],
+            "timezone": row["timezone"],
+            "reminder_time": row["reminder_time"],
+            "created_at": row["created_at"],
+            "active": bool(row["active"])
+        }, row)
+
+    # Как превратить строку каждой коллекции в запись
+    _ROW_BUILDERS = {
+        "todos": "_todo",
+        "simple_todos": "_simple_todo",
+        "everyday_reminders": "_everyday_reminder",
+    }
+
+    def add_todo(self, user_id: int, task: str, timezone: str,
+                 reminder_time: str, repeat_count: Optional[int] = None,
+                 repeat_interval: Optional[int] = None) -> Optional[Dict]:
+        """Добавляет новую задачу и возвращает её (None при неверном времени)"""
+        user_id_str = str(user_id)
+        try:
+            datetime.strptime(reminder_time, "%H:%M")
+        except ValueError:
+            return None
+
+        with self._transaction(user_id_str):
+            self._set_timezone(user_id_str, timezone)
+            todo = {
+                "id": self._next_id("todos", user_id_str),
+                "task": task,
+                "completed": False,
+                "created_at": datetime.now().isoformat(),
+                "reminder_time": reminder_time
+            }
+            self.conn.execute(
+                "INSERT INTO todos (user_id, id, task, completed, created_at, "
+                "reminder_time, timezone, repeat_count, repeat_interval) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)",
+                (user_id_str, todo["id"], task, todo["created_at"], reminder_time, timezone,
+                 repeat_count, repeat_interval)
+            )
+        return self._with_repeat(todo, {"repeat_count": repeat_count,
+                                        "repeat_interval": repeat_interval})
+
+    def get_pending_todos(self, user_id: int) -> List[Dict]:
+        """Получает незавершённые задачи"""
+        rows = self.conn.execute(
+            "SELECT * FROM todos WHERE user_id = ? AND completed = 0 ORDER BY id",
+            (str(user_id),)
+        )
+        return [self._todo(row) for row in rows]
+
+    def get_completed_todos(self, user_id: int) -> List[Dict]:
+        """Получает завершённые задачи"""
+        rows = self.conn.execute(
+            "SELECT * FROM todos WHERE user_id = ? AND completed = 1 ORDER BY id",
+            (str(user_id),)
+        )
+        return [self._todo(row) for row in rows]
+
+    def complete_todo(self, user_id: int, todo_id: int) -> bool:
+        """Отмечает задачу как завершённую"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "UPDATE todos SET completed = 1 WHERE user_id = ? AND id = ?",
+                (str(user_id), todo_id)
+            )
+        return cursor.rowcount > 0
+
+    def delete_todo(self, user_id: int, todo_id: int) -> bool:
+        """Удаляет задачу"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "DELETE FROM todos WHERE user_id = ? AND id = ?",
+                (str(user_id), todo_id)
+            )
+        return cursor.rowcount > 0
+
+    def complete_todos(self, user_id: int, todo_ids: Iterable[int]) -> List[int]:
+        """Отмечает несколько задач завершёнными одной мутацией; возвращает их ID"""
+        user_id_str = str(user_id)
+        completed = []
+        with self._transaction(user_id_str):
+            for todo_id in dict.fromkeys(todo_ids):
+                cursor = self.conn.execute(
+                    "UPDATE todos SET completed = 1 WHERE user_id = ? AND id = ? AND completed = 0",
+                    (user_id_str, todo_id)
+                )
+                if cursor.rowcount:
+                    completed.append(todo_id)
+        return completed
+
+    def delete_todos(self, user_id: int, todo_ids: Iterable[int]) -> List[int]:
+        """Удаляет несколько задач одной мутацией; возвращает удалённые ID"""
+        user_id_str = str(user_id)
+        deleted = []
+        with self._transaction(user_id_str):
+            for todo_id in dict.fromkeys(todo_ids):
+                cursor = self.conn.execute(
+                    "DELETE FROM todos WHERE user_id = ? AND id = ?", (user_id_str, todo_id)
+                )
+                if cursor.rowcount:
+                    deleted.append(todo_id)
+        return deleted
+
+    def clear_completed_todos(self, user_id: int) -> List[int]:
+        """Удаляет все завершённые задачи; возвращает их ID"""
+        user_id_str = str(user_id)
+        with self._transaction(user_id_str):
+            deleted = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM todos WHERE user_id = ? AND completed = 1", (user_id_str,)
+            )]
+            self.conn.execute(
+                "DELETE FROM todos WHERE user_id = ? AND completed = 1", (user_id_str,)
+            )
+        return deleted
+
+    def data_version(self, user_id: int) -> int:
+        """Версия данных пользователя (см. TodoDatabase.data_version)"""
+        return self._versions.get(str(user_id), 0)
+
+    def get_page(self, user_id: int, collection: str, completed: Optional[bool] = None,
+                 after_id: Optional[int] = None, before_id: Optional[int] = None,
+                 limit: int = 10) -> Tuple[List[Dict], bool, bool]:
+        """Страница записей коллекции по курсору (см. TodoDatabase.get_page)
+
+        Читается limit + 1 строка по первичному ключу (user_id, id), а
+        соседняя страница проверяется запросом с LIMIT 1.
+        """
+        build = getattr(self, self._ROW_BUILDERS[collection])
+        where, params = "user_id = ?", [str(user_id)]
+        if completed is not None:
+            where += " AND completed = ?"
+            params.append(int(completed))
+
+        def select(condition: str, cursor_id: int, order: str, count: int) -> List:
+            return self.conn.execute(
+                f"SELECT * FROM {collection} WHERE {where} AND {condition} "
+                f"ORDER BY id {order} LIMIT ?",
+                (*params, cursor_id, count)
+            ).fetchall()
+
+        if before_id is not None:
+            rows = select("id < ?", before_id, "DESC", limit + 1)
+            has_prev = len(rows) > limit
+            rows = rows[:limit][::-1]
+            has_next = bool(select("id >= ?", before_id, "ASC", 1))
+        else:
+            start = after_id if after_id is not None else -1
+            rows = select("id > ?", start, "ASC", limit + 1)
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            has_prev = bool(select("id <= ?", start, "DESC", 1))
+        return [build(row) for row in rows], has_prev, has_next
+
+    def count_items(self, user_id: int, collection: str) -> Tuple[int, int]:
+        """Сколько записей в коллекции всего и сколько из них отмечено"""
+        row = self.conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM({FLAG_FIELDS[collection]}), 0) "
+            f"FROM {collection} WHERE user_id = ?",
+            (str(user_id),)
+        ).fetchone()
+        return row[0], row[1]
+
+    def get_user_timezone(self, user_id: int) -> str:
+        """Получает часовой пояс пользователя"""
+        row = self.conn.execute(
+            "SELECT timezone FROM users WHERE user_id = ?", (str(user_id),)
+        ).fetchone()
+        return row["timezone"] if row else "UTC"
+
+    def add_simple_todo(self, user_id: int, task: str) -> bool:
+        """Добавляет простой todo без напоминания"""
+        user_id_str = str(user_id)
+        with self._transaction(user_id_str):
+            self._ensure_user(user_id_str)
+            self.conn.execute(
+                "INSERT INTO simple_todos (user_id, id, task, completed, created_at) "
+                "VALUES (?, ?, ?, 0, ?)",
+                (user_id_str, self._next_id("simple_todos", user_id_str), task,
+                 datetime.now().isoformat())
+            )
+        return True
+
+    def get_simple_todos(self, user_id: int) -> list:
+        """Получает все простые todos"""
+        rows = self.conn.execute(
+            "SELECT * FROM simple_todos WHERE user_id = ? ORDER BY id",
+            (str(user_id),)
+        )
+        return [self._simple_todo(row) for row in rows]
+
+    def complete_simple_todo(self, user_id: int, todo_id: int) -> bool:
+        """Отмечает простой todo как завершённый"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "UPDATE simple_todos SET completed = 1 WHERE user_id = ? AND id = ?",
+                (str(user_id), todo_id)
+            )
+        return cursor.rowcount > 0
+
+    def delete_simple_todo(self, user_id: int, todo_id: int) -> bool:
+        """Удаляет простой todo"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "DELETE FROM simple_todos WHERE user_id = ? AND id = ?",
+                (str(user_id), todo_id)
+            )
+        return cursor.rowcount > 0
+
+    def add_everyday_reminder(self, user_id: int, task: str, timezone: str,
+                             reminder_time: str, repeat_count: Optional[int] = None,
+                             repeat_interval: Optional[int] = None) -> Optional[Dict]:
+        """Добавляет ежедневное напоминание и возвращает его (None при неверном времени)"""
+        user_id_str = str(user_id)
+        try:
+            datetime.strptime(reminder_time, "%H:%M")
+        except ValueError:
+            return None
+
+        with self._transaction(user_id_str):
+            self._set_timezone(user_id_str, timezone)
+            reminder = {
+                "id": self._next_id("everyday_reminders", user_id_str),
+                "task": task,
+                "timezone": timezone,
+                "reminder_time": reminder_time,
+                "created_at": datetime.now().isoformat(),
+                "active": True
+            }
+            self.conn.execute(
+                "INSERT INTO everyday_reminders (user_id, id, task, timezone, "
+                "reminder_time, created_at, active, repeat_count, repeat_interval) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)",
+                (user_id_str, reminder["id"], task, timezone, reminder_time,
+                 reminder["created_at"], repeat_count, repeat_interval)
+            )
+        return self._with_repeat(reminder, {"repeat_count": repeat_count,
+                                            "repeat_interval": repeat_interval})
+
+    def get_everyday_reminders(self, user_id: int) -> List[Dict]:
+        """Получает все ежедневные напоминания"""
+        rows = self.conn.execute(
+            "SELECT * FROM everyday_reminders WHERE user_id = ? ORDER BY id",
+            (str(user_id),)
+        )
+        return [self._everyday_reminder(row) for row in rows]
+
+    def get_everyday_reminder(self, user_id: int, reminder_id: int) -> Optional[Dict]:
+        """Получает одно ежедневное напоминание по ID"""
+        row = self.conn.execute(
+            "SELECT * FROM everyday_reminders WHERE user_id = ? AND id = ?",
+            (str(user_id), reminder_id)
+        ).fetchone()
+        return self._everyday_reminder(row) if row else None
+
+    def delete_everyday_reminder(self, user_id: int, reminder_id: int) -> bool:
+        """Удаляет ежедневное напоминание"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "DELETE FROM everyday_reminders WHERE user_id = ? AND id = ?",
+                (str(user_id), reminder_id)
+            )
+        return cursor.rowcount > 0
+
+    def toggle_everyday_reminder(self, user_id: int, reminder_id: int) -> bool:
+        """Включает/выключает ежедневное напоминание"""
+        with self._transaction(str(user_id)):
+            cursor = self.conn.execute(
+                "UPDATE everyday_reminders SET active = NOT active "
+                "WHERE user_id = ? AND id = ?",
+                (str(user_id), reminder_id)
+            )
+        return cursor.rowcount > 0
+
+    def add_items(self, user_id: int, records: List[Dict]) -> List[Tuple[str, Dict]]:
+        """Добавляет пачку записей разных типов одной мутацией (см. TodoDatabase.add_items)"""
+        user_id_str = str(user_id)
+        now = datetime.now().isoformat()
+        created = []
+        with self._transaction(user_id_str):
+            self._ensure_user(user_id_str)
+            for record in records:
+                kind = record["type"]
+                item_id = self._next_id(TYPE_COLLECTIONS[kind], user_id_str)
+                if kind == "simple":
+                    self.conn.execute(
+                        "INSERT INTO simple_todos (user_id, id, task, completed, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (user_id_str, item_id, record["task"], int(record["completed"]), now)
+                    )
+                    created.append((kind, {"id": item_id, "task": record["task"],
+                                           "completed": record["completed"], "created_at": now}))
+                    continue
+                repeat = {"repeat_count": record["repeat_count"],
+                          "repeat_interval": record["repeat_interval"]}
+                if kind == "todo":
+                    self._set_timezone(user_id_str, record["timezone"])
+                    self.conn.execute(
+                        "INSERT INTO todos (user_id, id, task, completed, created_at, "
+                        "reminder_time, timezone, repeat_count, repeat_interval) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (user_id_str, item_id, record["task"], int(record["completed"]), now,
+                         record["time"], record["timezone"], record["repeat_count"],
+                         record["repeat_interval"])
+                    )
+                    item = {"id": item_id, "task": record["task"], "completed": record["completed"],
+                            "created_at": now, "reminder_time": record["time"]}
+                else:
+                    self.conn.execute(
+                        "INSERT INTO everyday_reminders (user_id, id, task, timezone, "
+                        "reminder_time, created_at, active, repeat_count, repeat_interval) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (user_id_str, item_id, record["task"], record["timezone"], record["time"],
+                         now, int(record["active"]), record["repeat_count"],
+                         record["repeat_interval"])
+                    )
+                    item = {"id": item_id, "task": record["task"], "timezone": record["timezone"],
+                            "reminder_time": record["time"], "created_at": now,
+                            "active": record["active"]}
+                created.append((kind, self._with_repeat(item, repeat)))
+        return created
+
+    def iter_items(self, user_id: int) -> Iterator[Tuple[str, Dict]]:
+        """Перебирает все записи пользователя как (тип, запись), читая строки курсором"""
+        user_id_str = str(user_id)
+        for row in self.conn.execute(
+            "SELECT * FROM todos WHERE user_id = ? ORDER BY id", (user_id_str,)
+        ):
+            todo = self._todo(row)
+            todo["timezone"] = row["timezone"]
+            yield "todo", todo
+        for row in self.conn.execute(
+            "SELECT * FROM simple_todos WHERE user_id = ? ORDER BY id", (user_id_str,)
+        ):
+            yield "simple", self._simple_todo(row)
+        for row in self.conn.execute(
+            "SELECT * FROM everyday_reminders WHERE user_id = ? ORDER BY id", (user_id_str,)
+        ):
+            yield "everyday", self._everyday_reminder(row)
+
+    def iter_reminders(self) -> Iterator[Tuple]:
+        """Перебирает все напоминания, которые должны быть запланированы
+
+        Возвращает кортежи (kind, user_id, item_id, task, reminder_time, timezone,
+        repeat_count, repeat_interval), где kind - "todo" для незавершённых задач
+        или "everyday" для активных ежедневных напоминаний.
+        """
+        yield from self.conn.execute(
+            "SELECT 'todo', user_id, id, task, reminder_time, timezone, "
+            "repeat_count, repeat_interval FROM todos WHERE completed = 0"
+        )
+        yield from self.conn.execute(
+            "SELECT 'everyday', user_id, id, task, reminder_time, timezone, "
+            "repeat_count, repeat_interval FROM everyday_reminders WHERE active = 1"
+        )
+
+    def import_json_data(self, data: Dict):
+        """Загружает данные в формате todos.json одной транзакцией"""
+        users, todos, simple_todos, reminders, counters = [], [], [], [], []
+        for user_id_str, user in data.items():
+            # Старые файлы могли содержать повторяющиеся id
+            normalize_ids(user)
+            timezone = user.get("timezone", "UTC")
+            users.append((user_id_str, timezone))
+            counters.extend((user_id_str, collection, next_id)
+                            for collection, next_id in user["next_ids"].items())
+            for t in user.get("todos", []):
+                todos.append((user_id_str, t["id"], t["task"], int(t["completed"]),
+                              t["created_at"], t["reminder_time"], t.get("timezone", timezone),
+                              t.get("repeat_count"), t.get("repeat_interval")))
+            for t in user.get("simple_todos", []):
+                simple_todos.append((user_id_str, t["id"], t["task"],
+                                     int(t["completed"]), t["created_at"]))
+            for r in user.get("everyday_reminders", []):
+                reminders.append((user_id_str, r["id"], r["task"], r["timezone"],
+                                  r["reminder_time"], r["created_at"], int(r["active"]),
+                                  r.get("repeat_count"), r.get("repeat_interval")))
+
+        with self._transaction():
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO users (user_id, timezone) VALUES (?, ?)", users)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO todos (user_id, id, task, completed, created_at, "
+                "reminder_time, timezone, repeat_count, repeat_interval) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", todos)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO simple_todos VALUES (?, ?, ?, ?, ?)", simple_todos)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO everyday_reminders (user_id, id, task, timezone, "
+                "reminder_time, created_at, active, repeat_count, repeat_interval) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", reminders)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO id_counters (user_id, collection, next_id) "
+                "VALUES (?, ?, ?)", counters)
+        self._committer.commit_now()
+        logger.info(f"📥 Импортировано пользователей: {len(users)}, задач: {len(todos)}, "
+                    f"simple todos: {len(simple_todos)}, напоминаний: {len(reminders)}")
+
+
+def migrate_json_to_sqlite(json_path: str, db: SQLiteTodoDatabase) -> bool:
+    """Однократно переносит todos.json в пустую SQLite базу"""
+    if not os.path.exists(json_path) or not db.is_empty():
+        return False
+    db.import_json_data(read_snapshot(json_path))
+    return True
+
+
+if __name__ == "__main__":
+    # Использование: python sqlite_database.py todos.json todos.db
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 3:
+        print("Использование: python sqlite_database.py <todos.json> <todos.db>")
+        sys.exit(1)
+    target = SQLiteTodoDatabase(sys.argv[2])
+    if not migrate_json_to_sqlite(sys.argv[1], target):
+        print("Миграция не выполнена: файл не найден или база уже не пуста")
+    target.close()
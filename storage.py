@@ -0,0 +1,513 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Служебный ключ снапшота с контрольной суммой (id пользователей - числа,
+# поэтому он ни с кем не совпадёт)
+SNAPSHOT_META_KEY = "_snapshot"
+
+
+def _encode(obj) -> str:
+    """Компактная сериализация одной записи журнала"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def snapshot_body(rows: Iterable[Tuple[str, str]]) -> str:
+    """Тело снапшота из уже сериализованных пользователей"""
+    return ",\n".join(f"  {json.dumps(user_id_str)}: {text}" for user_id_str, text in rows)
+
+
+def _generation_path(path: str, generation: int) -> str:
+    return path if generation == 0 else f"{path}.{generation}"
+
+
+def _fsync_dir(path: str):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(path: str, body: str, generations: int = 3):
+    """Атомарно записывает снапшот и хранит generations предыдущих копий
+
+    Файл остаётся обычным JSON; второй строкой идёт служебный ключ
+    SNAPSHOT_META_KEY с CRC32 и длиной остальной части файла. Снапшот
+    пишется во временный файл с fsync, старые копии сдвигаются
+    (todos.json -> todos.json.1 -> todos.json.2 ...), затем временный файл
+    атомарно переименовывается в path. Обрыв записи в любой момент
+    оставляет на диске целую копию.
+    """
+    rest = (body + "\n}" if body else "}").encode("utf-8")
+    meta = json.dumps({"crc32": zlib.crc32(rest), "length": len(rest)})
+    head = f'{{\n  "{SNAPSHOT_META_KEY}": {meta}{"," if body else ""}\n'.encode("utf-8")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(head + rest)
+        f.flush()
+        os.fsync(f.fileno())
+    for generation in range(generations, 0, -1):
+        source = _generation_path(path, generation - 1)
+        if os.path.exists(source):
+            os.replace(source, _generation_path(path, generation))
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+# Пользователь верхнего уровня в снапшоте: строка с отступом ровно в два
+# пробела и ключом. Внутри строк JSON перевода строки быть не может, а
+# вложенные значения идут с отступом не меньше четырёх пробелов.
+ROW_START = '\n  "'
+ROW_KEY_RE = re.compile(r'("(?:[^"\\]|\\.)*"): ')
+
+
+def _split_rows(text: str) -> Optional[Dict[str, str]]:
+    """Делит снапшот на сырые строки JSON пользователей, не разбирая их
+
+    Работает для файлов, где каждый пользователь начинается с новой строки
+    с отступом в два пробела (так пишут write_snapshot и json.dump(indent=2)):
+    вложенные строки имеют отступ больше, поэтому ключи верхнего уровня
+    находятся простым поиском. Для другой разметки возвращает None.
+    """
+    text = text.rstrip()
+    if not (text.startswith("{\n") and text.endswith("}")):
+        return None
+    rows: Dict[str, str] = {}
+    end = len(text) - 1
+    position = text.find(ROW_START, 0, end)
+    if position != 1:
+        return None
+    while position != -1:
+        key = ROW_KEY_RE.match(text, position + len(ROW_START) - 1)
+        if key is None:
+            return None
+        following = text.find(ROW_START, key.end(), end)
+        if following == -1:
+            value = text[key.end():end].rstrip()
+        elif text[following - 1] == ",":
+            value = text[key.end():following - 1]
+        else:
+            return None
+        name = key.group(1)
+        rows[json.loads(name) if "\\" in name else name[1:-1]] = value
+        position = following
+    return rows
+
+
+def _parse_snapshot(path: str) -> Dict:
+    """Читает и проверяет один снапшот; ValueError, если он повреждён
+
+    Значения - сырые строки JSON пользователей (их разбирает тот, кто
+    обращается к пользователю) или уже разобранные данные, если разметка
+    файла не позволила разделить его без разбора.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    # Смещения вместо partition: файл может весить десятки мегабайт
+    meta_start = content.find(b"\n") + 1
+    meta_end = content.find(b"\n", meta_start)
+    meta_line = content[meta_start:meta_end] if meta_end != -1 else b""
+    checked = (content[:meta_start] == b"{\n"
+               and meta_line.lstrip().startswith(f'"{SNAPSHOT_META_KEY}"'.encode()))
+    if checked:
+        meta = json.loads(meta_line.decode("utf-8").split(":", 1)[1].rstrip(","))
+        rest = memoryview(content)[meta_end + 1:]
+        if len(rest) != meta["length"] or zlib.crc32(rest) != meta["crc32"]:
+            raise ValueError("контрольная сумма не совпадает")
+    text = content.decode("utf-8")
+    rows = _split_rows(text)
+    if rows is None or not checked:
+        # Без контрольной суммы (файл записан старой версией) целостность
+        # проверяется полным разбором
+        data = json.loads(text or "{}")
+        if not isinstance(data, dict):
+            raise ValueError("ожидался объект JSON")
+        if rows is None:
+            rows = data
+    rows.pop(SNAPSHOT_META_KEY, None)
+    return rows
+
+
+def read_snapshot_rows(path: str, generations: int = 3) -> Dict:
+    """Загружает снапшот как user_id -> сырая строка JSON (или разобранные данные)
+
+    Если основной файл повреждён - последнюю целую копию. Возвращает {},
+    только если снапшота нет совсем. Если все копии повреждены, бросает
+    ValueError: пустые данные затёрли бы копии при следующей записи.
+    """
+    found = False
+    for generation in range(generations + 1):
+        candidate = _generation_path(path, generation)
+        if not os.path.exists(candidate):
+            continue
+        found = True
+        try:
+            rows = _parse_snapshot(candidate)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"✗ Снапшот {candidate} повреждён: {e}")
+            continue
+        if generation:
+            logger.warning(f"⚠️ Данные загружены из предыдущей копии {candidate}")
+        return rows
+    if found:
+        raise ValueError(f"Все копии {path} повреждены")
+    return {}
+
+
+def read_snapshot(path: str, generations: int = 3) -> Dict:
+    """Загружает снапшот целиком (все пользователи разобраны)"""
+    return {
+        user_id_str: json.loads(value) if isinstance(value, str) else value
+        for user_id_str, value in read_snapshot_rows(path, generations).items()
+    }
+
+
+class JsonFileStore:
+    """Хранение всех данных одним JSON-файлом (формат todos.json).
+
+    Каждый пользователь сериализуется отдельно, а поток записи собирает
+    файл из уже готовых строк — так при изменении одного пользователя
+    не приходится заново сериализовать всех остальных.
+    """
+
+    def __init__(self, filename: str, generations: int = 3):
+        self.filename = filename
+        self.generations = generations
+        self._rows: Dict[str, str] = {}
+
+    @staticmethod
+    def encode(value: Dict) -> str:
+        """Сериализует данные пользователя с отступами, как json.dump(indent=2)"""
+        return json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+
+    def load(self) -> Dict:
+        """Загружает данные из файла (или из последней целой копии)
+
+        Пользователи не разбираются: значения - их сырые строки JSON, они же
+        без изменений уходят в следующую запись файла.
+        """
+        rows = read_snapshot_rows(self.filename, self.generations)
+        self._rows = {
+            user_id_str: value if isinstance(value, str) else self.encode(value)
+            for user_id_str, value in rows.items()
+        }
+        return rows
+
+    def write(self, updates: Dict[str, Optional[str]]):
+        """Применяет изменения и перезаписывает файл (вызывается из потока записи)"""
+        for user_id_str, text in updates.items():
+            if text is None:
+                self._rows.pop(user_id_str, None)
+            else:
+                self._rows[user_id_str] = text
+        write_snapshot(self.filename, snapshot_body(self._rows.items()), self.generations)
+
+    def close(self):
+        pass
+
+
+class WriteAheadLog:
+    """Журнал изменений для TodoDatabase.
+
+    Каждая мутация дописывает в конец журнала одну строку вида
+    ``{"u": "<user_id>", "v": {...}}`` с актуальным состоянием пользователя.
+    Когда записей становится больше ``compact_every``, журнал ротируется и
+    в фоновом потоке сливается со снапшотом (основным JSON-файлом).
+    """
+
+    def __init__(self, snapshot_path: str, compact_every: int = 1000, generations: int = 3):
+        self.snapshot_path = snapshot_path
+        self.generations = generations
+        self.log_path = snapshot_path + ".wal"
+        self.rotated_path = self.log_path + ".1"
+        self.compact_every = compact_every
+        self._records = 0
+        self._log = None
+        self._compactor: Optional[threading.Thread] = None
+
+    def load(self) -> Dict:
+        """Загружает снапшот и проигрывает поверх него журналы"""
+        data = self._read_snapshot()
+        self._replay(self.rotated_path, data)
+        self._records = self._replay(self.log_path, data)
+        self._truncate_torn_tail(self.log_path)
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        return data
+
+    @staticmethod
+    def encode(value: Dict) -> str:
+        """Сериализует данные пользователя для записи в журнал"""
+        return _encode(value)
+
+    def write(self, updates: Dict[str, Optional[str]]):
+        """Дописывает состояния пользователей в журнал (вызывается из потока записи)"""
+        lines = [
+            f'{{"u":{json.dumps(user_id_str)},"v":{"null" if text is None else text}}}\n'
+            for user_id_str, text in updates.items()
+        ]
+        self._log.write("".join(lines))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._records += len(lines)
+        if self._records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Ротирует журнал и запускает фоновое сжатие в снапшот"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.rotated_path):
+            # Предыдущее сжатие не завершилось (например, упал процесс) —
+            # сначала доводим его до конца, не трогая текущий журнал
+            self._start_compactor()
+            return
+
+        self._log.close()
+        os.replace(self.log_path, self.rotated_path)
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._records = 0
+        self._start_compactor()
+
+    def close(self):
+        """Дожидается фонового сжатия и закрывает журнал"""
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _start_compactor(self):
+        self._compactor = threading.Thread(
+            target=self._compact_rotated, name="wal-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def _compact_rotated(self):
+        """Сливает ротированный журнал со снапшотом (выполняется в фоне)"""
+        try:
+            data = self._read_snapshot()
+            self._replay(self.rotated_path, data)
+            write_snapshot(self.snapshot_path,
+                           snapshot_body((user_id_str,
+                                          value if isinstance(value, str) else _encode(value))
+                                         for user_id_str, value in data.items()),
+                           self.generations)
+            os.remove(self.rotated_path)
+            logger.info(f"🗜️ Журнал сжат в снапшот {self.snapshot_path}")
+        except Exception as e:
+            logger.error(f"✗ Ошибка при сжатии журнала: {e}")
+
+    def _read_snapshot(self) -> Dict:
+        # Пользователи снапшота - сырые строки JSON, записи журнала - разобранные
+        return read_snapshot_rows(self.snapshot_path, self.generations)
+
+    @staticmethod
+    def _truncate_torn_tail(path: str):
+        """Отрезает недописанную последнюю строку, чтобы новые записи не склеились с ней"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+
+    @staticmethod
+    def _replay(path: str, data: Dict) -> int:
+        """Применяет записи журнала к data, возвращает число записей"""
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после падения процесса
+                    logger.warning(f"⚠️ Повреждённая запись в {path} пропущена")
+                    continue
+                if record["v"] is None:
+                    data.pop(record["u"], None)
+                else:
+                    data[record["u"]] = record["v"]
+                count += 1
+        return count
+
+
+class BackgroundWriter:
+    """Отдельный поток, который пишет изменения на диск.
+
+    Обработчики бота только кладут уже сериализованные данные в очередь и
+    сразу продолжают работу. Поток забирает из очереди всё накопившееся,
+    оставляет по одной (последней) записи на пользователя и передаёт пачку
+    хранилищу — одна запись и один fsync на пачку.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store):
+        self.store = store
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id_str: str, text: Optional[str]):
+        """Ставит в очередь новое состояние пользователя (None — удаление)"""
+        self._queue.put((user_id_str, text))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока всё отправленное ранее окажется на диске"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Дописывает очередь и останавливает поток"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch: Dict[str, Optional[str]] = {}
+            waiters = []
+            for item in items:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch[item[0]] = item[1]
+
+            if batch:
+                try:
+                    self.store.write(batch)
+                except Exception as e:
+                    logger.error(f"✗ Ошибка при записи данных на диск: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+
+class GroupCommitter:
+    """Групповая фиксация изменений.
+
+    Мутации только вызывают mark(). Фиксация (commit) выполняется один раз
+    через interval секунд после первой несохранённой мутации или сразу,
+    как только их накопилось max_pending. Таймер ставится на текущий
+    event loop; вне event loop (или при interval <= 0) фиксация немедленная.
+    """
+
+    def __init__(self, commit: Callable[[], None], interval: float = 0.2,
+                 max_pending: int = 500):
+        self._commit = commit
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def mark(self):
+        """Отмечает одну несохранённую мутацию"""
+        self.pending += 1
+        if self.interval <= 0 or self.pending >= self.max_pending:
+            self.commit_now()
+            return
+        if self._handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.commit_now()
+                return
+            self._handle = loop.call_later(self.interval, self.commit_now)
+
+    def commit_now(self):
+        """Немедленно фиксирует все накопленные мутации"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self.pending:
+            self.pending = 0
+            self._commit()
+
+
+class SessionStore:
+    """Сессии (состояние диалогов и user_data) в отдельном файле SQLite
+
+    Для режимов json и wal: сессии не держатся в памяти, каждая читается
+    с диска по ключу, когда понадобится, а просроченные удаляются по
+    индексу времени. В режиме WAL с synchronous=NORMAL сохранение сессии -
+    одна короткая транзакция без fsync; файл не переписывается целиком.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at);
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def load(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """Сессия и время её последнего обновления (unix time)"""
+        row = self.conn.execute(
+            "SELECT value, updated_at FROM sessions WHERE key = ?", (key,)
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, key: str, value: Dict, updated_at: float):
+        self.conn.execute(
+            "INSERT INTO sessions (key, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+            "updated_at = excluded.updated_at",
+            (key, _encode(value), updated_at)
+        )
+
+    def delete(self, key: str):
+        self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def iter(self, prefix: str) -> Iterator[Tuple[str, Dict, float]]:
+        """Сессии с ключом, начинающимся с prefix: (ключ, значение, время)"""
+        # Диапазон по первичному ключу вместо LIKE: prefix может содержать % и _
+        rows = self.conn.execute(
+            "SELECT key, value, updated_at FROM sessions WHERE key >= ? AND key < ?",
+            (prefix, prefix + "\uffff")
+        ).fetchall()
+        for key, value, updated_at in rows:
+            yield key, json.loads(value), updated_at
+
+    def expire(self, before: float) -> List[str]:
+        """Удаляет сессии, не обновлявшиеся с момента before; возвращает их ключи"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            keys = [row[0] for row in self.conn.execute(
+                "SELECT key FROM sessions WHERE updated_at < ?", (before,)
+            )]
+            self.conn.execute("DELETE FROM sessions WHERE updated_at < ?", (before,))
+        return keys
+
+    def close(self):
+        self.conn.close()
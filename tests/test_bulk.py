@@ -0,0 +1,143 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from bulk import (export_rows, parse_csv, parse_json, parse_lines, read_records,
+                  validate_record, write_csv, write_json_lines)
+from database import TodoDatabase, open_database
+
+RECORDS = [
+    {"type": "todo", "task": "Позвонить маме", "time": "9:05", "timezone": "Europe/Moscow",
+     "repeat_count": "3", "repeat_interval": "10"},
+    {"type": "simple", "task": "Купить молоко", "completed": "да"},
+    {"type": "everyday", "task": "Таблетка", "time": "21:00", "active": "0"},
+]
+
+
+def test_parse_lines():
+    rows = list(parse_lines(["09:00 3/10 Выпить таблетку", "", "Купить молоко"]))
+    assert rows == [
+        (1, {"type": "todo", "time": "09:00", "repeat_count": "3", "repeat_interval": "10",
+             "task": "Выпить таблетку"}),
+        (3, {"type": "simple", "task": "Купить молоко"}),
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    '[{"task": "a"}, {"task": "b"}]',
+    '{"task": "a"}\n{"task": "b"}\n',
+])
+def test_parse_json_array_and_lines(text):
+    # Маленький кусок проверяет склейку объектов на границе чтения
+    rows = list(parse_json(io.StringIO(text), chunk_size=3))
+    assert rows == [(1, {"task": "a"}), (2, {"task": "b"})]
+
+
+def test_parse_csv_requires_task_column():
+    with pytest.raises(ValueError):
+        list(parse_csv(io.StringIO("type,time\nsimple,09:00\n")))
+
+
+def test_validate_record_normalizes():
+    assert validate_record(RECORDS[0], "UTC") == {
+        "type": "todo", "task": "Позвонить маме", "time": "09:05",
+        "timezone": "Europe/Moscow", "repeat_count": 3, "repeat_interval": 10,
+        "completed": False,
+    }
+    assert validate_record({"task": "x", "time": "10:00"}, "UTC")["type"] == "todo"
+
+
+@pytest.mark.parametrize("raw", [
+    {"task": ""},
+    {"task": "x", "type": "weekly"},
+    {"task": "x", "time": "25:00"},
+    {"task": "x", "time": "10:00", "timezone": "Mars/Olympus"},
+    {"task": "x", "time": "10:00", "repeat_count": "0"},
+    {"task": "x", "completed": "может быть"},
+    ["task"],
+])
+def test_validate_record_rejects(raw):
+    with pytest.raises(ValueError):
+        validate_record(raw, "UTC")
+
+
+def test_read_records_collects_errors():
+    rows = enumerate([RECORDS[1], {"task": ""}, RECORDS[2], {"type": "x", "task": "y"}], 1)
+    records, errors = read_records(rows, "UTC", max_items=10)
+    assert len(records) == 2
+    assert [error.split(":")[0] for error in errors] == ["2", "4"]
+    _, errors = read_records(enumerate([{"task": "a"}] * 3, 1), "UTC", max_items=2)
+    assert errors == ["больше 2 записей за раз"]
+
+
+def test_broken_file_is_an_error():
+    records, errors = read_records(parse_json(io.StringIO('[{"task": "a"}, {"task": ')),
+                                   "UTC", max_items=10)
+    assert errors and errors[0].startswith("файл не разобрать")
+
+
+@pytest.mark.parametrize("write, parse", [(write_csv, parse_csv),
+                                          (write_json_lines, parse_json)])
+def test_export_import_round_trip(tmp_path, write, parse):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    records, errors = read_records(enumerate(RECORDS, 1), "UTC", max_items=10)
+    assert not errors
+    db.add_items(1, records)
+
+    stream = io.StringIO()
+    assert write(export_rows(db.iter_items(1), db.get_user_timezone(1)), stream) == 3
+    stream.seek(0)
+    imported, errors = read_records(parse(stream), "UTC", max_items=10)
+    assert not errors
+    assert imported == records
+
+    # Повторный импорт того же файла получает новые ID, а не дубли
+    db.add_items(1, imported)
+    for collection in ("todos", "simple_todos", "everyday_reminders"):
+        ids = [item["id"] for item in db.data["1"][collection]]
+        assert ids == sorted(set(ids)) and len(ids) == 2
+    db.close()
+
+
+def test_import_with_errors_adds_nothing(tmp_path, monkeypatch):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    monkeypatch.setattr(bot, "db", db)
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1),
+                             message=SimpleNamespace(reply_text=reply_text))
+    rows = parse_lines(["Купить молоко", "25:99 Сломанное время"])
+    state = asyncio.run(bot.apply_import(update, None, rows))
+
+    assert state == bot.States.WAITING_IMPORT.value
+    assert "ничего не добавлено" in replies[0]
+    assert list(db.iter_items(1)) == []
+    db.close()
+
+
+@pytest.mark.parametrize("filename, mode", [("todos.json", "json"), ("todos.json", "wal"),
+                                            ("todos.db", "sqlite")])
+def test_imported_todos_keep_their_timezones(tmp_path, filename, mode):
+    path = str(tmp_path / filename)
+    db = open_database(path, mode)
+    text = ('{"task": "Москва", "time": "09:00", "timezone": "Europe/Moscow"}\n'
+            '{"task": "Токио", "time": "10:00", "timezone": "Asia/Tokyo"}\n')
+    records, errors = read_records(parse_json(io.StringIO(text)), "UTC", max_items=10)
+    assert not errors
+    db.add_items(1, records)
+    db.close()
+
+    db = open_database(path, mode)
+    reminders = sorted((task, time, timezone)
+                       for _, _, _, task, time, timezone, _, _ in db.iter_reminders())
+    assert reminders == [("Москва", "09:00", "Europe/Moscow"), ("Токио", "10:00", "Asia/Tokyo")]
+    exported = [(row["task"], row["timezone"])
+                for row in export_rows(db.iter_items(1), db.get_user_timezone(1))]
+    assert exported == [("Москва", "Europe/Moscow"), ("Токио", "Asia/Tokyo")]
+    db.close()
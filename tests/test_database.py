@@ -0,0 +1,19 @@
+from database import TodoDatabase
+
+
+def test_delete_keeps_list_sorted(tmp_path):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    for number in range(6):
+        db.add_simple_todo(1, f"task {number}")
+    assert [db.delete_simple_todo(1, item_id) for item_id in (0, 3, 5, 3)] == [
+        True, True, True, False
+    ]
+    assert [item["id"] for item in db.get_simple_todos(1)] == [1, 2, 4]
+
+    page, has_prev, has_next = db.get_page(1, "simple_todos", after_id=1, limit=1)
+    assert ([item["id"] for item in page], has_prev, has_next) == ([2], True, True)
+    db.close()
+
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    assert [item["id"] for item in db.get_simple_todos(1)] == [1, 2, 4]
+    db.close()
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytz
+
+from dispatcher import ReminderDispatcher
+from sender import ReminderSender
+
+
+async def _send(*args):
+    pass
+
+
+def clock(minute: int) -> str:
+    """ЧЧ:ММ по UTC для UTC-минуты minute"""
+    return datetime.fromtimestamp(minute * 60, pytz.utc).strftime("%H:%M")
+
+
+def due_keys(dispatcher: ReminderDispatcher, now_minute: int):
+    return sorted(entry.key for _, entry in dispatcher._pop_due(now_minute))
+
+
+def test_restore_catches_up_missed_minutes():
+    dispatcher = ReminderDispatcher(_send)
+    now_minute = int(time.time() // 60)
+    missed = clock(now_minute - 2)
+    reminders = [("missed", 1, "a", missed, "UTC", 1, 0),
+                 ("later", 2, "b", clock(now_minute + 5), "UTC", 1, 0)]
+
+    count = asyncio.run(dispatcher.restore(iter(reminders), after_minute=now_minute - 3))
+
+    assert count == 2
+    assert due_keys(dispatcher, now_minute) == ["missed"]
+
+
+def test_restore_catch_up_survives_concurrent_schedule():
+    dispatcher = ReminderDispatcher(_send)
+    now_minute = int(time.time() // 60)
+    missed = clock(now_minute - 1)
+    reminders = [(f"k{i}", i, "t", missed, "UTC", 1, 0) for i in range(3)]
+
+    async def handler():
+        # Пользователь добавляет напоминание на то же время, пока идёт
+        # восстановление: ближайшее срабатывание для него - завтра
+        await asyncio.sleep(0)
+        dispatcher.schedule("new", 9, "t", missed, "UTC")
+
+    async def scenario():
+        await asyncio.gather(
+            dispatcher.restore(iter(reminders), after_minute=now_minute - 2, batch_size=1),
+            handler()
+        )
+
+    asyncio.run(scenario())
+    assert due_keys(dispatcher, now_minute) == ["k0", "k1", "k2"]
+
+
+def test_restore_skips_keys_changed_meanwhile():
+    dispatcher = ReminderDispatcher(_send)
+    reminders = [(f"k{i}", i, "old", "10:00", "UTC", 1, 0) for i in range(5)]
+
+    async def handler():
+        await asyncio.sleep(0)
+        dispatcher.cancel("k3")
+        dispatcher.schedule("k4", 4, "new", "11:00", "UTC")
+
+    async def scenario():
+        return await asyncio.gather(dispatcher.restore(iter(reminders), batch_size=1), handler())
+
+    count, _ = asyncio.run(scenario())
+    assert count == 3
+    assert "k3" not in dispatcher._entries
+    assert dispatcher._entries["k4"].task == "new"
+
+
+def test_rebuild_replaces_everything():
+    dispatcher = ReminderDispatcher(_send)
+    dispatcher.schedule("gone", 1, "t", "10:00", "UTC")
+    assert dispatcher.rebuild([("kept", 2, "t", "10:00", "UTC", 1, 0)]) == 1
+    assert set(dispatcher._entries) == {"kept"}
+
+
+def handover(send_message, drain_timeout):
+    """Прежний экземпляр рассылает пропущенную минуту и останавливается;
+    возвращает (минуту для резерва, минуту срабатывания)"""
+    now_minute = int(time.time() // 60)
+    fire_minute = now_minute - 1
+
+    async def scenario():
+        sender = ReminderSender(send_message, workers=1, per_chat_interval=0)
+
+        async def send(user_id, task, number, total, minute):
+            sender.send(user_id, task, minute)
+
+        dispatcher = ReminderDispatcher(send)
+        dispatcher.rebuild([("k", 1, "t", clock(fire_minute), "UTC", 1, 0)],
+                           after_minute=fire_minute - 1)
+        sender.start()
+        dispatcher.start()
+        while dispatcher.dispatched_minute != now_minute:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        await sender.stop(drain_timeout)
+        return sender.completed_minute(dispatcher.dispatched_minute)
+
+    return asyncio.run(scenario()), fire_minute
+
+
+def test_handover_waits_for_queued_reminders():
+    sent = []
+
+    async def send_message(chat_id, text):
+        await asyncio.sleep(0.05)
+        sent.append(chat_id)
+
+    completed, fire_minute = handover(send_message, drain_timeout=5)
+    assert sent == [1]
+    assert completed >= fire_minute
+
+
+def test_handover_resends_reminders_left_in_queue():
+    async def send_message(chat_id, text):
+        await asyncio.sleep(3600)
+
+    completed, fire_minute = handover(send_message, drain_timeout=0.05)
+    # Резерв начинает с переданной минуты и досылает оставшееся в очереди
+    assert completed < fire_minute
+    standby = ReminderDispatcher(_send)
+    standby.rebuild([("k", 1, "t", clock(fire_minute), "UTC", 1, 0)], after_minute=completed)
+    assert due_keys(standby, fire_minute + 1) == ["k"]
+
+
+def test_busy_chat_does_not_hold_other_chats():
+    sent = []
+
+    async def send_message(chat_id, text):
+        sent.append((chat_id, text))
+
+    async def scenario():
+        sender = ReminderSender(send_message, workers=1, rate=1000, per_chat_interval=10)
+        for number in range(3):
+            sender.send(1, str(number))
+        sender.send(2, "0")
+        sender.start()
+        await asyncio.sleep(0.1)
+        depth = sender.queue_depth()
+        await sender.stop()
+        return depth
+
+    # Единственный воркер не ждёт слота первого чата и успевает во второй
+    assert asyncio.run(scenario()) == 2
+    assert sent == [(1, "0"), (2, "0")]
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler
+
+from database import TodoDatabase
+from persistence import SessionPersistence
+from updates import PerUserUpdateProcessor
+
+
+def test_sessions_live_on_disk(tmp_path):
+    path = str(tmp_path / "todos.json")
+    db = TodoDatabase(path)
+    db.save_session("user:1", {"step": "time"}, 100.0)
+    db.save_session("conv:add_task:[1, 1]", {"state": 2}, 200.0)
+    db.close()
+
+    db = TodoDatabase(path)
+    assert db.load_session("user:1") == ({"step": "time"}, 100.0)
+    assert [key for key, _, _ in db.iter_sessions("conv:add_task:")] == ["conv:add_task:[1, 1]"]
+    assert db.expire_sessions(150.0) == ["user:1"]
+    assert db.load_session("user:1") is None
+    db.close()
+
+
+def build(db, ttl=100, max_resident=2):
+    persistence = SessionPersistence(db, ttl, max_resident)
+    application = ApplicationBuilder().token("123:abc").persistence(persistence).concurrent_updates(
+        PerUserUpdateProcessor(4)
+    ).build()
+    persistence.attach(application)
+    handler = ConversationHandler(
+        entry_points=[CommandHandler("start", lambda update, context: None)],
+        states={1: []}, fallbacks=[], name="add_task", persistent=True
+    )
+    application.add_handler(handler)
+    return persistence, application, handler
+
+
+def test_expire_removes_restored_conversations(tmp_path):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    persistence, application, handler = build(db)
+    now = time.time()
+    db.save_session("conv:add_task:[1, 1]", {"state": 1}, now - 500)
+    db.save_session("conv:add_task:[2, 2]", {"state": 1}, now)
+    handler._conversations.update(asyncio.run(persistence.get_conversations("add_task")))
+    assert set(handler._conversations) == {(2, 2)}
+
+    db.save_session("conv:add_task:[1, 1]", {"state": 1}, now - 500)
+    handler._conversations[(1, 1)] = 1
+    assert persistence.expire(now) == ["conv:add_task:[1, 1]"]
+    assert set(handler._conversations) == {(2, 2)}
+    db.close()
+
+
+def test_spilled_user_data_restored_from_disk(tmp_path):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    persistence, application, _ = build(db, ttl=1000, max_resident=1)
+
+    async def scenario():
+        first = application.user_data[1]
+        await persistence.refresh_user_data(1, first)
+        first["page"] = 5
+        await persistence.refresh_user_data(2, application.user_data[2])
+        # Первый пользователь выгружен на диск и из приложения
+        assert 1 not in application.user_data
+        assert db.load_session("user:1")[0] == {"page": 5}
+        restored = application.user_data[1]
+        await persistence.refresh_user_data(1, restored)
+        return restored
+
+    assert asyncio.run(scenario()) == {"page": 5}
+    db.close()
+
+
+def test_user_in_flight_is_not_spilled(tmp_path):
+    db = TodoDatabase(str(tmp_path / "todos.json"))
+    persistence, application, _ = build(db, ttl=1000, max_resident=1)
+    processor = application.update_processor
+    update = Update.de_json({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "A"}}}, None)
+
+    async def scenario():
+        release = asyncio.Event()
+        data = application.user_data[1]
+
+        async def handler():
+            await persistence.refresh_user_data(1, data)
+            await release.wait()
+            data["page"] = 7
+
+        task = asyncio.create_task(processor.process_update(update, handler()))
+        await asyncio.sleep(0)
+        await persistence.refresh_user_data(2, application.user_data[2])
+        # Обработчик первого пользователя ещё работает - его данные в памяти
+        assert application.user_data[1] is data
+        release.set()
+        await task
+        await persistence.refresh_user_data(3, application.user_data[3])
+        # Теперь первый пользователь выгружается вместе со своими изменениями
+        assert 1 not in application.user_data
+        return db.load_session("user:1")[0]
+
+    assert asyncio.run(scenario()) == {"page": 7}
+    db.close()
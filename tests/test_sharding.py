@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from database import TodoDatabase
+from sharding import (check_shard_layout, record_shard_layout, shard_for, shard_path,
+                      split_sqlite, split_store)
+from sqlite_database import SQLiteTodoDatabase
+
+USERS = [str(user_id) for user_id in (1, 2, 3, 42, 1000, 123456789, 987654321, 555)]
+
+
+def make_store(path, storage_mode):
+    if storage_mode == "sqlite":
+        db = SQLiteTodoDatabase(str(path))
+    else:
+        # Частое сжатие: часть пользователей окажется в снапшоте, часть - в журнале
+        db = TodoDatabase(str(path), storage_mode=storage_mode, wal_compact_every=4)
+    for user_id in USERS:
+        db.add_todo(int(user_id), f"задача {user_id}", "UTC", "10:00")
+        db.add_simple_todo(int(user_id), "дело")
+    db.close()
+
+
+@pytest.mark.parametrize("written_by, storage_mode", [
+    ("json", "json"),
+    ("wal", "wal"),
+    # Файл, записанный в режиме json, после перехода на wal: строки
+    # пользователей в нём многострочные
+    ("json", "wal"),
+])
+def test_split_store_round_trip(tmp_path, written_by, storage_mode):
+    path = tmp_path / "todos.json"
+    make_store(path, written_by)
+
+    assert split_store(str(path), storage_mode, 3) == len(USERS)
+
+    loaded = {}
+    for index in range(3):
+        db = TodoDatabase(shard_path(str(path), index, 3), storage_mode=storage_mode)
+        for user_id in list(db.data):
+            assert shard_for(int(user_id), 3) == index
+            loaded[user_id] = db.data[user_id]
+        db.close()
+    assert set(loaded) == set(USERS)
+    for user_id in USERS:
+        assert [t["task"] for t in loaded[user_id]["todos"]] == [f"задача {user_id}"]
+        assert [t["task"] for t in loaded[user_id]["simple_todos"]] == ["дело"]
+
+
+def test_split_store_runs_once(tmp_path):
+    path = tmp_path / "todos.json"
+    make_store(path, "json")
+    assert split_store(str(path), "json", 2) == len(USERS)
+    assert split_store(str(path), "json", 2) == 0
+    # Исходный файл остаётся резервной копией
+    assert set(json.loads(path.read_text(encoding="utf-8"))) - {"_snapshot"} == set(USERS)
+
+
+def test_split_store_without_source(tmp_path):
+    assert split_store(str(tmp_path / "todos.json"), "json", 2) == 0
+
+
+def test_split_sqlite_round_trip(tmp_path):
+    path = tmp_path / "todos.db"
+    make_store(path, "sqlite")
+
+    assert split_sqlite(str(path), 3) == len(USERS)
+    assert split_sqlite(str(path), 3) == 0
+
+    seen = []
+    for index in range(3):
+        db = SQLiteTodoDatabase(shard_path(str(path), index, 3))
+        for user_id in USERS:
+            todos = db.get_pending_todos(int(user_id))
+            if shard_for(int(user_id), 3) != index:
+                assert todos == []
+                continue
+            seen.append(user_id)
+            assert [t["task"] for t in todos] == [f"задача {user_id}"]
+            assert [t["task"] for t in db.get_simple_todos(int(user_id))] == ["дело"]
+            # Счётчики ID переехали вместе с записями
+            db.add_todo(int(user_id), "ещё", "UTC", "11:00")
+            assert [t["id"] for t in db.get_pending_todos(int(user_id))] == [0, 1]
+        db.close()
+    assert sorted(seen) == sorted(USERS)
+
+
+def test_split_sqlite_skips_empty_database(tmp_path):
+    path = tmp_path / "todos.db"
+    SQLiteTodoDatabase(str(path)).close()
+    assert split_sqlite(str(path), 2) == 0
+    assert not (tmp_path / "todos.shard0.db").exists()
+
+
+def test_shard_count_change_is_refused(tmp_path):
+    path = str(tmp_path / "todos.json")
+    # До первого шардированного запуска подходит любое число
+    check_shard_layout(path, 1)
+    check_shard_layout(path, 4)
+    record_shard_layout(path, 4)
+    record_shard_layout(path, 2)
+
+    check_shard_layout(path, 4)
+    for shards in (1, 2, 8):
+        with pytest.raises(ValueError):
+            check_shard_layout(path, shards)
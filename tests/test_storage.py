@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from storage import read_snapshot, read_snapshot_rows, snapshot_body, write_snapshot
+
+
+def _write(path, users):
+    write_snapshot(str(path), snapshot_body(
+        (user_id, json.dumps(data)) for user_id, data in users.items()
+    ))
+
+
+def test_rows_stay_unparsed(tmp_path):
+    path = tmp_path / "todos.json"
+    _write(path, {"1": {"todos": []}})
+    assert read_snapshot_rows(str(path)) == {"1": '{"todos": []}'}
+
+
+def test_damaged_snapshot_falls_back_to_previous_generation(tmp_path):
+    path = tmp_path / "todos.json"
+    _write(path, {"1": {"v": 1}})
+    _write(path, {"1": {"v": 2}})
+    # Обрыв записи: файл обрезан, контрольная сумма не сходится
+    content = path.read_bytes()
+    path.write_bytes(content[:-10])
+    assert read_snapshot(str(path)) == {"1": {"v": 1}}
+
+
+def test_newest_intact_generation_is_used(tmp_path):
+    path = tmp_path / "todos.json"
+    for version in range(1, 4):
+        _write(path, {"1": {"v": version}})
+    path.write_bytes(b"garbage")
+    (tmp_path / "todos.json.1").write_bytes(b"{")
+    assert read_snapshot(str(path)) == {"1": {"v": 1}}
+
+
+def test_all_generations_damaged(tmp_path):
+    path = tmp_path / "todos.json"
+    _write(path, {"1": {"v": 1}})
+    path.write_bytes(b"{")
+    with pytest.raises(ValueError):
+        read_snapshot_rows(str(path))
+
+
+def test_missing_snapshot_is_empty(tmp_path):
+    assert read_snapshot_rows(str(tmp_path / "todos.json")) == {}
+
+
+def test_legacy_file_without_checksum(tmp_path):
+    path = tmp_path / "todos.json"
+    path.write_text(json.dumps({"5": {"todos": [], "timezone": "UTC"}}))
+    assert read_snapshot(str(path)) == {"5": {"todos": [], "timezone": "UTC"}}
@@ -0,0 +1,206 @@
+import asyncio
+import json
+
+import pytest
+from telegram import Update
+from telegram.ext import (CallbackQueryHandler, ChatMemberHandler, CommandHandler,
+                          ConversationHandler, MessageHandler, PollAnswerHandler, TypeHandler,
+                          filters)
+
+from sharding import ShardRouter, bot_allowed_updates, poll_updates
+from updates import AdmissionQueue, PerUserUpdateProcessor, allowed_update_types
+
+
+async def _noop(update, context):
+    pass
+
+
+def test_types_follow_handlers():
+    handlers = {0: [CommandHandler("start", _noop), CallbackQueryHandler(_noop)],
+                1: [PollAnswerHandler(_noop)]}
+    assert allowed_update_types(handlers) == [Update.MESSAGE, Update.CALLBACK_QUERY,
+                                              Update.POLL_ANSWER]
+
+
+def test_conversation_handler_is_walked():
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("add", _noop)],
+        states={1: [MessageHandler(filters.TEXT, _noop)]},
+        fallbacks=[ChatMemberHandler(_noop, ChatMemberHandler.ANY_CHAT_MEMBER)],
+    )
+    assert allowed_update_types({0: [conversation]}) == [
+        Update.MESSAGE, Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER
+    ]
+
+
+def test_unknown_handler_allows_everything():
+    assert allowed_update_types({0: [TypeHandler(Update, _noop)]}) == list(Update.ALL_TYPES)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_bot_needs_messages_and_callbacks():
+    assert bot_allowed_updates() == [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+class FakeBot:
+    def __init__(self, batches, stop_event):
+        self.batches = list(batches)
+        self.stop_event = stop_event
+        self.calls = []
+
+    async def get_updates(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("limit") == 1:
+            return []
+        if not self.batches:
+            self.stop_event.set()
+            await asyncio.sleep(3600)
+        return self.batches.pop(0)
+
+
+class FakeRouter(ShardRouter):
+    def __init__(self):
+        super().__init__([])
+        self.routed = []
+
+    async def route(self, body: bytes) -> int:
+        self.routed.append(json.loads(body)["update_id"])
+        return 200
+
+
+def test_sharded_front_passes_allowed_updates():
+    async def scenario():
+        stop_event = asyncio.Event()
+        update = Update.de_json({"update_id": 5}, None)
+        bot = FakeBot([[update]], stop_event)
+        router = FakeRouter()
+        await poll_updates(bot, router, stop_event, timeout=0,
+                           allowed_updates=[Update.MESSAGE])
+        return bot, router
+
+    bot, router = asyncio.run(scenario())
+    assert router.routed == [5]
+    assert bot.calls[0]["allowed_updates"] == [Update.MESSAGE]
+    # Последний вызов только подтверждает полученные обновления
+    assert bot.calls[-1]["offset"] == 6
+
+
+class RedeliveringBot:
+    """Как Telegram: отдаёт все обновления, начиная с offset"""
+
+    def __init__(self, update_ids, stop_event):
+        self.updates = [Update.de_json({"update_id": update_id}, None) for update_id in update_ids]
+        self.stop_event = stop_event
+        self.offsets = []
+
+    async def get_updates(self, offset=None, limit=None, **kwargs):
+        self.offsets.append(offset)
+        pending = [update for update in self.updates
+                   if offset is None or update.update_id >= offset]
+        if not pending and limit != 1:
+            self.stop_event.set()
+            await asyncio.sleep(3600)
+        return pending
+
+
+class FlakyRouter(FakeRouter):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = dict(failures)
+
+    async def route(self, body: bytes) -> int:
+        await super().route(body)
+        update_id = json.loads(body)["update_id"]
+        if self.failures.get(update_id, 0):
+            self.failures[update_id] -= 1
+            return 400
+        return 200
+
+
+@pytest.mark.parametrize("failures, routed, acked", [
+    # Обновление 2 принято со второй попытки; 3 и 4 повторно не пересылаются
+    ({2: 1}, [1, 2, 3, 4, 2], 5),
+    # Обновление 2 так и не принято - после трёх попыток оно пропускается
+    ({2: 10}, [1, 2, 3, 4, 2, 2], 5),
+])
+def test_rejected_update_is_not_acknowledged(failures, routed, acked):
+    async def scenario():
+        stop_event = asyncio.Event()
+        bot = RedeliveringBot([1, 2, 3, 4], stop_event)
+        router = FlakyRouter(failures)
+        await poll_updates(bot, router, stop_event, timeout=0, max_attempts=3)
+        return bot, router
+
+    bot, router = asyncio.run(scenario())
+    assert router.routed == routed
+    # Пока 2 не принято, Telegram не получает подтверждения дальше него
+    assert bot.offsets[1] == 2
+    assert bot.offsets[-1] == acked
+
+
+def message(update_id: int, user_id: int) -> Update:
+    return Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "U"}}}, None)
+
+
+def test_updates_wait_in_queue_until_admitted():
+    async def scenario():
+        queue = AdmissionQueue(maxsize=2, max_pending=2)
+        processor = PerUserUpdateProcessor(4, queue)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(update):
+            await release.wait()
+            done.append(update.update_id)
+
+        async def fetcher():
+            # Как Application: забирает обновление и сразу создаёт задачу
+            while True:
+                update = await queue.get()
+                asyncio.create_task(processor.process_update(update, handle(update)))
+                queue.task_done()
+
+        fetch_task = asyncio.create_task(fetcher())
+        for update_id in range(4):
+            await queue.put(message(update_id, update_id))
+        # Два обновления в работе, два ждут в очереди - пятое не принимается
+        await asyncio.sleep(0.01)
+        assert queue.qsize() == 2
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.put(message(4, 4)), 0.05)
+
+        release.set()
+        await queue.put(message(4, 4))
+        while len(done) < 5:
+            await asyncio.sleep(0.01)
+        fetch_task.cancel()
+        return sorted(done)
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+
+def test_busy_user_does_not_hold_a_slot():
+    async def scenario():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        order = []
+
+        async def handle(update_id):
+            if update_id == 1:
+                await release.wait()
+            order.append(update_id)
+
+        first = asyncio.create_task(processor.process_update(message(1, 1), handle(1)))
+        await asyncio.sleep(0)
+        # Второе обновление того же пользователя встаёт в его очередь и
+        # отдаёт слот; обновление другого пользователя не ждёт
+        await processor.process_update(message(2, 1), handle(2))
+        await processor.process_update(message(3, 2), handle(3))
+        assert order == [3] and processor.is_busy(1)
+        release.set()
+        await first
+        return order, processor.is_busy(1)
+
+    assert asyncio.run(scenario()) == ([3, 1, 2], False)
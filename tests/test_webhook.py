@@ -0,0 +1,80 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from webhook import WebhookServer, read_response
+
+
+async def _serve(scenario, secret="s3cret", read_timeout=1.0):
+    application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+    server = WebhookServer(application, "127.0.0.1", 0, "/hook", secret,
+                           read_timeout=read_timeout)
+    await server.start()
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    try:
+        return await scenario(server, reader, writer, application)
+    finally:
+        writer.close()
+        await server.stop()
+
+
+def _post(length: str, secret: str = "s3cret", body: bytes = b"") -> bytes:
+    return (f"POST /hook HTTP/1.1\r\nHost: test\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+            f"Content-Length: {length}\r\n\r\n").encode() + body
+
+
+def test_update_is_queued():
+    body = json.dumps({"update_id": 7}).encode()
+
+    async def scenario(server, reader, writer, application):
+        writer.write(_post(str(len(body)), body=body))
+        status, _ = await read_response(reader)
+        return status, application.update_queue.get_nowait().update_id
+
+    assert asyncio.run(_serve(scenario)) == (200, 7)
+
+
+@pytest.mark.parametrize("length", ["-1", "abc", "1_0", "²"])
+def test_bad_content_length_is_rejected(length):
+    async def scenario(server, reader, writer, application):
+        writer.write(_post(length))
+        status, _ = await read_response(reader)
+        # После ошибки сервер закрывает соединение
+        return status, await reader.read(), server.rejected
+
+    assert asyncio.run(_serve(scenario)) == (400, b"", 1)
+
+
+def test_too_large_body_is_rejected():
+    async def scenario(server, reader, writer, application):
+        writer.write(_post(str(10 ** 9)))
+        status, _ = await read_response(reader)
+        return status
+
+    assert asyncio.run(_serve(scenario)) == 413
+
+
+def test_wrong_secret_is_forbidden():
+    body = b'{"update_id": 1}'
+
+    async def scenario(server, reader, writer, application):
+        writer.write(_post(str(len(body)), secret="s3creT", body=body))
+        status, _ = await read_response(reader)
+        return status, application.update_queue.qsize()
+
+    assert asyncio.run(_serve(scenario)) == (403, 0)
+
+
+@pytest.mark.parametrize("request_bytes", [
+    b"POST /hook HTTP/1.1\r\nContent-Length: 10",
+    _post("10", body=b"{}"),
+])
+def test_silent_client_is_disconnected(request_bytes):
+    async def scenario(server, reader, writer, application):
+        writer.write(request_bytes)
+        return await asyncio.wait_for(reader.read(), 5)
+
+    assert asyncio.run(_serve(scenario, read_timeout=0.2)) == b""
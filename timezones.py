@@ -0,0 +1,292 @@
+import bisect
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import pytz
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+
+def next_transition(tz: pytz.BaseTzInfo, after: datetime) -> Optional[datetime]:
+    """Ближайший переход на летнее/зимнее время после after (naive UTC)
+
+    Возвращает None, если у пояса нет будущих переходов.
+    """
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not transitions:
+        return None
+    index = bisect.bisect_right(transitions, after)
+    return transitions[index] if index < len(transitions) else None
+
+
+def _transition_period(tz: pytz.BaseTzInfo, moment: datetime
+                       ) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Границы периода (naive UTC), в котором смещение пояса не меняется"""
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not transitions:
+        return None, None
+    index = bisect.bisect_right(transitions, moment)
+    start = transitions[index - 1] if index > 0 else None
+    end = transitions[index] if index < len(transitions) else None
+    return start, end
+
+
+class TimezoneRegistry:
+    """Общий на весь процесс реестр часовых поясов
+
+    Имя пояса разбирается один раз: дальше и tzinfo, и само имя (одна
+    строка на всех пользователей с этим поясом) берутся из словаря.
+    Смещение от UTC кэшируется до ближайшего перехода на летнее/зимнее
+    время, поэтому повторные вычисления не локализуют время заново.
+    """
+
+    def __init__(self):
+        self._zones: Dict[str, pytz.BaseTzInfo] = {}
+        self._names: Dict[str, str] = {}
+        # имя -> (смещение, начало периода, конец периода)
+        self._offsets: Dict[str, Tuple[timedelta, Optional[datetime], Optional[datetime]]] = {}
+
+    def get(self, name: str) -> pytz.BaseTzInfo:
+        """tzinfo по имени (UnknownTimeZoneError для неизвестного пояса)"""
+        tz = self._zones.get(name)
+        if tz is None:
+            tz = self._zones[name] = pytz.timezone(name)
+            self._names[name] = tz.zone
+        return tz
+
+    def name(self, name: str) -> str:
+        """Каноническое имя пояса - один общий объект строки на процесс"""
+        canonical = self._names.get(name)
+        if canonical is None:
+            self.get(name)
+            canonical = self._names[name]
+        return canonical
+
+    def utc_offset(self, name: str, now: Optional[datetime] = None) -> timedelta:
+        """Смещение пояса от UTC в момент now (naive UTC)"""
+        if now is None:
+            now = datetime.utcnow()
+        cached = self._offsets.get(name)
+        if cached is not None:
+            offset, start, end = cached
+            if (start is None or now >= start) and (end is None or now < end):
+                return offset
+        tz = self.get(name)
+        offset = pytz.utc.localize(now).astimezone(tz).utcoffset()
+        self._offsets[name] = (offset, *_transition_period(tz, now))
+        return offset
+
+
+# Один реестр на процесс: им пользуются и диспетчер, и интерфейс
+registry = TimezoneRegistry()
+
+
+def format_offset(offset: timedelta) -> str:
+    """Смещение от UTC в виде +03:00"""
+    minutes = int(offset.total_seconds() // 60)
+    sign = "-" if minutes < 0 else "+"
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+class TimezoneKeyboard:
+    """Готовая клавиатура популярных часовых поясов со смещениями от UTC
+
+    Смещения меняются только при переходе на летнее/зимнее время, поэтому
+    клавиатура строится один раз и пересобирается, только когда наступает
+    ближайший переход в одном из поясов. Время этого перехода вычисляется
+    заранее, так что обычный вызов markup() — одно сравнение времени.
+    """
+
+    def __init__(self, zones: Sequence[str], extra_rows: List[List[InlineKeyboardButton]]):
+        self.zones = [zone for zone in zones if zone in pytz.common_timezones_set]
+        self.extra_rows = extra_rows
+        self._markup: Optional[InlineKeyboardMarkup] = None
+        self._expires: Optional[datetime] = None
+
+    def markup(self, now: Optional[datetime] = None) -> InlineKeyboardMarkup:
+        if now is None:
+            now = datetime.utcnow()
+        if self._markup is None or (self._expires is not None and now >= self._expires):
+            self._build(now)
+        return self._markup
+
+    def _build(self, now: datetime):
+        buttons = []
+        expires = None
+        for zone in self.zones:
+            buttons.append([
+                InlineKeyboardButton(f"{zone} ({format_offset(registry.utc_offset(zone, now))})",
+                                     callback_data=f"tz_{zone}")
+            ])
+            transition = next_transition(registry.get(zone), now)
+            if transition is not None and (expires is None or transition < expires):
+                expires = transition
+        self._markup = InlineKeyboardMarkup(buttons + self.extra_rows)
+        self._expires = expires
+
+
+# GMT+4, UTC-3:30, +0530, -5
+OFFSET_RE = re.compile(r"^(?:gmt|utc)?([+-])(\d{1,2})(?::?(\d{2}))?$")
+
+
+def parse_offset(text: str) -> Optional[int]:
+    """Разбирает смещение вида GMT+4 / UTC-3:30 / +0530 в минуты"""
+    match = OFFSET_RE.match(text.replace(" ", ""))
+    if not match:
+        return None
+    sign, hours, minutes = match.groups()
+    total = int(hours) * 60 + int(minutes or 0)
+    if total > 14 * 60:
+        return None
+    return -total if sign == "-" else total
+
+
+def _normalize(text: str) -> str:
+    return "_".join(text.lower().split())
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TimezoneIndex:
+    """Индекс часовых поясов в памяти для поиска по свободному вводу
+
+    Ключи поиска: полное имя IANA, название города, сокращения (MSK, CET,
+    EST) и дополнительные псевдонимы (например, русские названия городов). Поиск идёт по шагам: точное имя,
+    смещение (GMT+4), точный ключ, префикс (бинарный поиск по
+    отсортированным ключам) и нечёткое совпадение по триграммам — так
+    опечатки вроде "Moskow" всё равно находят нужный пояс.
+    """
+
+    def __init__(self, zones: Iterable[str] = pytz.all_timezones,
+                 aliases: Optional[Dict[str, str]] = None,
+                 preferred: Sequence[str] = (), now: Optional[datetime] = None):
+        if now is None:
+            now = datetime.utcnow()
+        preferred = set(preferred)
+        self._canonical: Dict[str, str] = {}
+        self._keys: Dict[str, List[str]] = defaultdict(list)
+        self._by_offset: Dict[int, List[str]] = defaultdict(list)
+        # Популярные пояса показываем первыми, устаревшие псевдонимы
+        # (US/Eastern) - последними
+        self._rank: Dict[str, int] = {}
+
+        for zone in zones:
+            self._canonical[zone.lower()] = zone
+            if zone in preferred:
+                self._rank[zone] = 0
+            else:
+                self._rank[zone] = 1 if zone in pytz.common_timezones_set else 2
+            tz = registry.get(zone)
+            city = zone.rsplit("/", 1)[-1]
+            keys = {zone.lower(), city.lower()}
+            offsets = set()
+            # Сейчас и через полгода: оба значения для поясов с летним временем
+            for moment in (now, now + timedelta(days=182)):
+                local = pytz.utc.localize(moment).astimezone(tz)
+                offsets.add(int(local.utcoffset().total_seconds() // 60))
+                abbreviation = local.tzname()
+                if abbreviation.isalpha() and abbreviation != "LMT":
+                    keys.add(abbreviation.lower())
+            for key in keys:
+                self._keys[key].append(zone)
+            for offset in offsets:
+                self._by_offset[offset].append(zone)
+
+        for alias, zone in (aliases or {}).items():
+            if zone in self._rank:
+                self._keys[_normalize(alias)].insert(0, zone)
+
+        for zones_list in list(self._keys.values()) + list(self._by_offset.values()):
+            zones_list.sort(key=self._sort_key)
+        self._sorted_keys = sorted(self._keys)
+        self._trigram_index: Dict[str, List[str]] = defaultdict(list)
+        for key in self._sorted_keys:
+            for trigram in _trigrams(key):
+                self._trigram_index[trigram].append(key)
+
+    def _sort_key(self, zone: str):
+        # Etc/GMT-4 - точное совпадение для запроса "GMT+4"
+        return (not zone.startswith("Etc/"), self._rank[zone], zone)
+
+    def exact(self, text: str) -> Optional[str]:
+        """Каноническое имя пояса без учёта регистра или None"""
+        return self._canonical.get(_normalize(text))
+
+    def search(self, text: str, limit: int = 50) -> List[str]:
+        """Пояса, подходящие под ввод, от лучших совпадений к худшим"""
+        query = _normalize(text)
+        if not query:
+            return []
+        zone = self._canonical.get(query)
+        if zone is not None:
+            return [zone]
+        offset = parse_offset(query)
+        if offset is not None:
+            return self._by_offset.get(offset, [])[:limit]
+
+        results: List[str] = []
+        seen: Set[str] = set()
+
+        def add(zones: Iterable[str]):
+            for zone in zones:
+                if zone not in seen:
+                    seen.add(zone)
+                    results.append(zone)
+
+        add(self._keys.get(query, ()))
+        keys = self._sorted_keys
+        position = bisect.bisect_left(keys, query)
+        prefixed = []
+        while position < len(keys) and keys[position].startswith(query):
+            prefixed.extend(self._keys[keys[position]])
+            position += 1
+        add(sorted(prefixed, key=self._sort_key))
+        if len(results) < limit:
+            add(self._fuzzy(query))
+        return results[:limit]
+
+    def _fuzzy(self, query: str, threshold: float = 0.3) -> List[str]:
+        """Нечёткий поиск: сходство ключей по доле общих триграмм"""
+        query_trigrams = _trigrams(query)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for key in self._trigram_index.get(trigram, ()):
+                shared[key] += 1
+        scored = []
+        for key, count in shared.items():
+            # Сходство Жаккара по триграммам
+            score = count / (len(query_trigrams) + len(key) + 1 - count)
+            if score >= threshold:
+                scored.append((-score, key))
+        scored.sort()
+        zones = []
+        for _, key in scored:
+            zones.extend(self._keys[key])
+        return zones
+
+
+def timezone_search_keyboard(matches: List[str], page: int, page_size: int,
+                             cancel_callback: str) -> InlineKeyboardMarkup:
+    """Страница найденных поясов с кнопками листания"""
+    pages = max(1, (len(matches) + page_size - 1) // page_size)
+    page = min(max(page, 0), pages - 1)
+    buttons = [
+        [InlineKeyboardButton(zone, callback_data=f"tz_{zone}")]
+        for zone in matches[page * page_size:(page + 1) * page_size]
+    ]
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️", callback_data=f"tzpage_{page - 1}"))
+    if pages > 1:
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="tzpage_noop"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("➡️", callback_data=f"tzpage_{page + 1}"))
+    if navigation:
+        buttons.append(navigation)
+    buttons.append([InlineKeyboardButton("◀️ Отмена", callback_data=cancel_callback)])
+    return InlineKeyboardMarkup(buttons)
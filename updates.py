@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Awaitable, Deque, Dict, Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import (
+    ApplicationHandlerStop, BaseHandler, BaseUpdateProcessor, CallbackQueryHandler, ChatJoinRequestHandler,
+    ChatMemberHandler, ChosenInlineResultHandler, CommandHandler, ContextTypes,
+    ConversationHandler, InlineQueryHandler, MessageHandler, PollAnswerHandler,
+    PollHandler, PreCheckoutQueryHandler, ShippingQueryHandler
+)
+
+logger = logging.getLogger(__name__)
+
+# Какие типы обновлений нужны каждому виду обработчика. Команды и текст
+# обрабатываются только в новых сообщениях: правки и посты каналов бот
+# не поддерживает.
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: (Update.MESSAGE,),
+    MessageHandler: (Update.MESSAGE,),
+    CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+    InlineQueryHandler: (Update.INLINE_QUERY,),
+    ChosenInlineResultHandler: (Update.CHOSEN_INLINE_RESULT,),
+    ShippingQueryHandler: (Update.SHIPPING_QUERY,),
+    PreCheckoutQueryHandler: (Update.PRE_CHECKOUT_QUERY,),
+    PollHandler: (Update.POLL,),
+    PollAnswerHandler: (Update.POLL_ANSWER,),
+    ChatJoinRequestHandler: (Update.CHAT_JOIN_REQUEST,),
+}
+
+CHAT_MEMBER_UPDATE_TYPES = {
+    ChatMemberHandler.MY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER,),
+    ChatMemberHandler.CHAT_MEMBER: (Update.CHAT_MEMBER,),
+    ChatMemberHandler.ANY_CHAT_MEMBER: (Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER),
+}
+
+
+def _handler_update_types(handler: BaseHandler) -> Iterable[str]:
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points + handler.fallbacks:
+            yield from _handler_update_types(inner)
+        for state_handlers in handler.states.values():
+            for inner in state_handlers:
+                yield from _handler_update_types(inner)
+        return
+    if isinstance(handler, ChatMemberHandler):
+        yield from CHAT_MEMBER_UPDATE_TYPES[handler.chat_member_types]
+        return
+    for handler_type, update_types in HANDLER_UPDATE_TYPES.items():
+        if isinstance(handler, handler_type):
+            yield from update_types
+            return
+    # Неизвестный обработчик (например, TypeHandler) может ждать что угодно
+    yield from Update.ALL_TYPES
+
+
+def allowed_update_types(handlers: Dict[int, List[BaseHandler]]) -> List[str]:
+    """Список типов обновлений, которые нужны зарегистрированным обработчикам
+
+    Передаётся в allowed_updates (getUpdates / setWebhook), чтобы Telegram
+    не присылал обновления, которые всё равно некому обработать.
+    """
+    types = set()
+    for group_handlers in handlers.values():
+        for handler in group_handlers:
+            types.update(_handler_update_types(handler))
+    # Сохраняем порядок Update.ALL_TYPES, чтобы список был стабильным
+    return [update_type for update_type in Update.ALL_TYPES if update_type in types]
+
+
+class UpdateFilter:
+    """Отбрасывает обновления неподдерживаемых типов до диспетчеризации
+
+    Регистрируется как TypeHandler в группе -1: она проверяется первой, и
+    ApplicationHandlerStop не даёт обновлению дойти до остальных групп.
+    Такие обновления всё же могут прийти — например, если webhook ещё
+    зарегистрирован со старым allowed_updates.
+    """
+
+    def __init__(self, allowed: Iterable[str], log_every: int = 100):
+        self.allowed = tuple(allowed)
+        self.log_every = log_every
+        self.dropped: Counter = Counter()
+
+    def _update_type(self, update: Update) -> str:
+        for update_type in Update.ALL_TYPES:
+            if getattr(update, update_type, None) is not None:
+                return str(update_type)
+        return "unknown"
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        for update_type in self.allowed:
+            if getattr(update, update_type, None) is not None:
+                return
+        update_type = self._update_type(update)
+        self.dropped[update_type] += 1
+        total = sum(self.dropped.values())
+        if total == 1 or total % self.log_every == 0:
+            logger.info(f"🚫 Отброшено обновлений без обработчиков: {dict(self.dropped)}")
+        raise ApplicationHandlerStop
+
+
+class AdmissionQueue(asyncio.Queue):
+    """Очередь обновлений, которая отдаёт обновление только при свободном месте
+
+    Application забирает обновления из очереди и сразу создаёт на каждое
+    задачу, поэтому сама по себе очередь опустела бы мгновенно, а число
+    ожидающих задач ничем не было бы ограничено. get() сначала занимает
+    одно из max_pending мест; место освобождает PerUserUpdateProcessor,
+    когда обработчики обновления отработали (release). Пока все места
+    заняты, обновления копятся в очереди (не больше maxsize), а put()
+    ждёт — так замедляется приём.
+    """
+
+    def __init__(self, maxsize: int, max_pending: int):
+        super().__init__(maxsize)
+        self._admission = asyncio.Semaphore(max_pending)
+
+    async def get(self):
+        await self._admission.acquire()
+        try:
+            return await super().get()
+        except BaseException:
+            self._admission.release()
+            raise
+
+    def release(self):
+        """Освобождает место обработанного обновления"""
+        self._admission.release()
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    max_concurrent_updates), а обновления одного пользователя — строго по
+    очереди: состояние ConversationHandler и context.user_data не
+    читаются и не меняются двумя обработчиками сразу. Обновление занятого
+    пользователя не ждёт в слоте общего семафора: оно встаёт в очередь
+    пользователя и сразу отдаёт слот, а выполняет его задача, которая уже
+    обрабатывает этого пользователя.
+
+    Если задана admission (очередь обновлений приложения), после каждого
+    обновления освобождается его место в ней.
+    """
+
+    __slots__ = ("_admission", "_queues")
+
+    def __init__(self, max_concurrent_updates: int, admission: Optional[AdmissionQueue] = None):
+        super().__init__(max_concurrent_updates)
+        self._admission = admission
+        # Обновления пользователей, которые сейчас обрабатываются: первое
+        # выполняется, остальные ждут своей очереди
+        self._queues: Dict[int, Deque[Awaitable]] = {}
+
+    @staticmethod
+    def _user_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    def is_busy(self, key: int) -> bool:
+        """Обрабатывается ли (или ждёт очереди) обновление пользователя key"""
+        return key in self._queues
+
+    async def _run(self, coroutine: Awaitable):
+        try:
+            await coroutine
+        finally:
+            if self._admission is not None:
+                self._admission.release()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = self._user_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Обновления приходят по порядку, и первым в очереди
+            # пользователя всегда стоит более раннее
+            queue.append(coroutine)
+            return
+        queue = self._queues[key] = deque([coroutine])
+        try:
+            while queue:
+                await self._run(queue.popleft())
+        finally:
+            del self._queues[key]
+            # Остановка посреди очереди: оставшиеся обновления не выполнятся
+            for pending in queue:
+                pending.close()
+                if self._admission is not None:
+                    self._admission.release()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
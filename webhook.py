@@ -0,0 +1,259 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Telegram присылает обновления размером в единицы килобайт
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько секунд ждать заголовки и тело запроса; молчащее дольше соединение
+# закрывается, чтобы медленные клиенты не занимали сервер бесконечно
+READ_TIMEOUT = 30
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+
+class RequestError(Exception):
+    """Запрос разобран, но принять его нельзя; status - HTTP-статус ответа"""
+
+    def __init__(self, status: int):
+        super().__init__(STATUS_TEXT[status])
+        self.status = status
+
+
+async def read_request(reader: asyncio.StreamReader, timeout: Optional[float] = None
+                       ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Читает один HTTP/1.1 запрос: (метод, путь, заголовки, тело)
+
+    Возвращает None, если соединение закрыто, запрос не разобрать или
+    клиент не уложился в timeout секунд. Если Content-Length некорректен
+    или больше MAX_BODY_SIZE, бросает RequestError с кодом 400 или 413.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        return None
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        return None
+    headers: Dict[str, str] = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+
+    length_text = headers.get("content-length", "") or "0"
+    if not (length_text.isascii() and length_text.isdigit()):
+        # int() принял бы и "-1", и "1_0"; отрицательная длина сломала бы readexactly
+        raise RequestError(400)
+    length = int(length_text)
+    if length > MAX_BODY_SIZE:
+        raise RequestError(413)
+    if not length:
+        return method, target, headers, b""
+    try:
+        body = await asyncio.wait_for(reader.readexactly(length), timeout)
+    except asyncio.TimeoutError:
+        return None
+    return method, target, headers, body
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Читает один HTTP/1.1 ответ: (статус, тело)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    status = int(status_line.split(" ", 2)[1])
+    length = 0
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip() or 0)
+    body = await reader.readexactly(length) if length else b""
+    return status, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, keep_alive: bool = True,
+                   body: bytes = b"", content_type: str = "application/json"):
+    """Пишет HTTP-ответ в поток (без drain)"""
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+    )
+
+
+class WebhookServer:
+    """Встроенный асинхронный HTTP-сервер для приёма обновлений Telegram
+
+    Работает в том же event loop, что и бот, без сторонних веб-фреймворков.
+    Каждый POST на path разбирается в Update и кладётся в очередь
+    обновлений приложения. Одновременно разбирается не больше
+    max_concurrency запросов; если очередь обновлений ограничена и
+    заполнена (AdmissionQueue не отдаёт обновления быстрее, чем их
+    обрабатывают), ответ задерживается, и Telegram сам притормаживает
+    отправку.
+    Соединения keep-alive, поэтому пачка обновлений идёт без лишних
+    рукопожатий.
+    """
+
+    def __init__(self, application: Application, host: str = "0.0.0.0", port: int = 8443,
+                 path: str = "/webhook", secret_token: Optional[str] = None,
+                 max_concurrency: int = 64, read_timeout: float = READ_TIMEOUT):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.read_timeout = read_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Начинает принимать соединения"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"🌐 Webhook-сервер слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Перестаёт принимать соединения и закрывает открытые"""
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, self.read_timeout)
+                except RequestError as e:
+                    # Тело не прочитано, и граница следующего запроса неизвестна
+                    self.rejected += 1
+                    write_response(writer, e.status, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status = await self._handle_request(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                write_response(writer, status, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Соединение закрыто в stop(); отменённая задача-обработчик
+            # вызвала бы ошибку в колбэке asyncio.start_server
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _handle_request(self, method: str, target: str, headers: Dict[str, str],
+                              body: bytes) -> int:
+        """Обрабатывает один запрос и возвращает HTTP-статус"""
+        if target != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if self.secret_token and not self._secret_matches(headers):
+            self.rejected += 1
+            return 403
+
+        async with self._semaphore:
+            status = await self._dispatch(body)
+        if status == 200:
+            self.received += 1
+        else:
+            self.rejected += 1
+        return status
+
+    def _secret_matches(self, headers: Dict[str, str]) -> bool:
+        """Сравнивает секрет за постоянное время, не выдавая совпавший префикс"""
+        received = headers.get("x-telegram-bot-api-secret-token", "")
+        return hmac.compare_digest(received.encode("latin-1"), self.secret_token.encode())
+
+    async def _dispatch(self, body: bytes) -> int:
+        """Передаёт тело обновления дальше; возвращает HTTP-статус"""
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"⚠️ Некорректное обновление в webhook: {e}")
+            return 400
+        await self.application.update_queue.put(update)
+        return 200
+
+
+async def serve_webhook(application: Application, host: str, port: int, path: str,
+                        webhook_url: Optional[str] = None, secret_token: Optional[str] = None,
+                        max_concurrency: int = 64,
+                        allowed_updates: Optional[List[str]] = None,
+                        stop_event: Optional[asyncio.Event] = None):
+    """Запускает приложение в режиме webhook до сигнала остановки
+
+    Повторяет жизненный цикл run_polling: initialize, post_init, start,
+    затем stop, post_stop, shutdown. Если задан webhook_url, адрес
+    регистрируется в Telegram через setWebhook.
+    """
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+    server = WebhookServer(application, host, port, path, secret_token, max_concurrency)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                webhook_url + path,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+                max_connections=min(max_concurrency, 100)
+            )
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)